@@ -0,0 +1,179 @@
+"""Micro-benchmarks van het hot path: parsers en positiegrootte.
+
+Gebruik (vanuit de project root):
+    python benchmarks/bench_hotpath.py                  # meten en vergelijken met de baseline
+    python benchmarks/bench_hotpath.py --save-baseline  # huidige meting als baseline opslaan
+
+Per benchmark worden ops/sec en de piek van de geheugenallocaties per call
+(tracemalloc) gemeten. Een benchmark die meer dan `--tolerance` trager is dan
+de baseline wordt als regressie gemeld en het script eindigt met exit code 1.
+De baseline is machine-afhankelijk; sla hem opnieuw op na een hardwarewissel.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import numpy as np
+
+import logger_setup
+from batchsizing import BatchPositionSize
+from strategy import Strategy
+from tradesignalparser import PARSER_CLASSES
+from tradingbot import PositionSize, ProcessTradeSignal
+
+CORPUS_FILE = os.path.join(ROOT, 'benchmarks', 'corpus', 'corpus_v1.json')
+BASELINE_FILE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path, 'r', encoding='utf-8') as corpus_file:
+        return json.load(corpus_file)
+
+def measure(func, inputs, min_time=0.5, repeats=5):
+    """Meet ops/sec over de hele lijst inputs en de gemiddelde piekallocatie per call.
+
+    De snelste van `repeats` herhalingen telt, dat filtert de meeste ruis van
+    andere processen weg.
+    """
+    def run(rounds):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for item in inputs:
+                func(item)
+        return time.perf_counter() - start
+
+    # opwarmen en het aantal rondes per herhaling bepalen
+    rounds = 1
+    while run(rounds) < min_time / repeats:
+        rounds *= 2
+    elapsed = min(run(rounds) for _ in range(repeats))
+    ops_per_sec = rounds * len(inputs) / elapsed
+
+    tracemalloc.start()
+    peaks = 0
+    for item in inputs:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        func(item)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks += peak - baseline
+    tracemalloc.stop()
+
+    return {'ops_per_sec': round(ops_per_sec, 1), 'peak_bytes_per_call': round(peaks / len(inputs), 1)}
+
+def swallow_value_error(func):
+    # chatter levert een ValueError op, net als in handle_new_message
+    def wrapper(message):
+        try:
+            func(message)
+        except ValueError:
+            pass
+    return wrapper
+
+def run_benchmarks(corpus, min_time=0.5):
+    results = {}
+    for parser_name, messages in corpus['channels'].items():
+        parser = PARSER_CLASSES[parser_name]()
+        valid = [parser.clean_message(message) for message in messages['valid']]
+        chatter = [parser.clean_message(message) for message in messages['chatter']]
+        results[f'{parser_name}.clean_message'] = measure(
+            parser.clean_message, messages['valid'] + messages['chatter'], min_time
+        )
+        results[f'{parser_name}.parse_trade_signal[valid]'] = measure(parser.parse_trade_signal, valid, min_time)
+        results[f'{parser_name}.parse_trade_signal[chatter]'] = measure(
+            swallow_value_error(parser.parse_trade_signal), chatter, min_time
+        )
+
+    sizer = PositionSize()
+    strategy = Strategy(0.01, 0.1, 3, '', True, False, 50)
+    results['PositionSize.calculate_position_size'] = measure(
+        lambda case: sizer.calculate_position_size(
+            case['lot_size'], case['equity'], strategy, case['stop_loss'], case['eur_base'], case['price']
+        ),
+        corpus['sizing'], min_time
+    )
+
+    processor = ProcessTradeSignal(None)
+    split_inputs = [(0.37, 3), (1.01, 4), (0.1, 3), (2.5, 5), (0.07, 3)]
+    results['ProcessTradeSignal.split_position_size'] = measure(
+        lambda case: processor.split_position_size(*case), split_inputs, min_time
+    )
+
+    # een batch van 1000 rijen (signaal x account x strategie) per aanroep
+    batch = BatchPositionSize()
+    cases = (corpus['sizing'] * (1000 // len(corpus['sizing']) + 1))[:1000]
+    batch_input = {
+        'equity': np.array([case['equity'] for case in cases]),
+        'stop_distance': np.array([abs(case['price'] - case['stop_loss']) for case in cases]),
+        'eur_base_price': np.array([case['eur_base'] for case in cases]),
+        'contract_size': np.array([case['lot_size'] for case in cases]),
+    }
+    results['BatchPositionSize.size_legs[1000 rows]'] = measure(
+        lambda case: batch.size_legs(
+            case['equity'], strategy.risklevel, case['stop_distance'], case['eur_base_price'],
+            case['contract_size'], 3, strategy.useFixedRiskAmount, strategy.fixedRiskAmount
+        ),
+        [batch_input], min_time
+    )
+    return results
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get('results', {}).get(name)
+        if reference is None:
+            print(f'{name:55s} {result["ops_per_sec"]:>12,.0f} ops/s  {result["peak_bytes_per_call"]:>8,.0f} B/call  (new)')
+            continue
+        change = result['ops_per_sec'] / reference['ops_per_sec'] - 1
+        flag = ''
+        if change < -tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:55s} {result["ops_per_sec"]:>12,.0f} ops/s  {result["peak_bytes_per_call"]:>8,.0f} B/call  '
+              f'({change:+.1%} vs baseline){flag}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the parser and sizing hot path')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown before a regression is reported')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Minimum measuring time per benchmark in seconds')
+    args = parser.parse_args()
+
+    # logging zou de meting domineren en data/log.txt vullen
+    logger_setup.LoggerSingleton.get_logger().setLevel(logging.WARNING)
+
+    corpus = load_corpus()
+    results = run_benchmarks(corpus, args.min_time)
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w') as baseline_file:
+            json.dump({
+                'corpus_version': corpus['version'],
+                'python': sys.version.split()[0],
+                'results': results
+            }, baseline_file, indent=2)
+        print(f'Baseline written to {BASELINE_FILE}')
+        return
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('corpus_version') != corpus['version']:
+            print('Baseline was recorded with another corpus version, comparison is not meaningful.')
+            baseline = {}
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f'{len(regressions)} benchmark(s) slower than the baseline: {", ".join(regressions)}')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""Fan-out van trade signalen naar meerdere MT5 accounts.
+
+De MetaTrader5 package kan per proces maar met een terminal verbonden zijn.
+Daarom krijgt ieder account een eigen worker proces met een eigen terminal,
+`Strategy`, tick feed en order rate limiter. De `ChannelMonitor` parseert een
+signaal een keer en stuurt het via `AccountPool.submit` naar alle workers
+tegelijk; de fills komen via een gedeelde result queue terug.
+"""
+import asyncio
+import importlib
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+import logger_setup
+from mt5handler import SymbolSpecCache
+
+logger = logger_setup.LoggerSingleton.get_logger()
+
+def get_account_settings(config, connection_name, channels=None, mt5_module='MetaTrader5'):
+    """Alles wat een worker nodig heeft, als picklebare dict (spawn onder Windows)."""
+    mt5_connection = config['mt5_connections'].get(connection_name)
+    if not mt5_connection:
+        raise ValueError(f'Geen verbinding gevonden met de naam: {connection_name}')
+    return {
+        'mt5_module': mt5_module,
+        'login': mt5_connection['login'],
+        'password': mt5_connection['password'],
+        'server': mt5_connection['server'],
+        'strategy': config['strategies'][mt5_connection['strategy']],
+        'symbols': SymbolSpecCache.symbols_to_prewarm(config['channels'] if channels is None else channels),
+        'order_rate_limit': config.get('order_rate_limit', {}),
+        'symbol_cache_ttl': config.get('symbol_cache_ttl', 6 * 3600),
+        'tick_feed': config.get('tick_feed', {}),
+        'persistence': config.get('persistence', {}),
+        'logging': config.get('logging', {}),
+        'exposure': config.get('exposure', {}),
+        'account_snapshot': config.get('account_snapshot', {}),
+    }
+
+def account_worker(name, settings, jobs, results):
+    """Entry point van een worker proces: inloggen en daarna signalen uitvoeren.
+
+    Berichten naar de pool zijn tuples:
+        ('ready', name, ok, error)
+        ('result', job_id, name, {'fills': [...], 'elapsed': s} of {'error': ..., 'elapsed': s})
+    Een None op de jobs queue stopt de worker.
+    """
+    # pas hier importeren, in het worker proces
+    import manage_shelve
+    from mt5handler import AccountSnapshot, MT5Scheduler, TickStore
+    from ratelimiter import OrderRateLimiter
+    from strategy import Strategy
+    from tradingbot import ProcessTradeSignal
+
+    logging_params = settings.get('logging', {})
+    logger_setup.LoggerSingleton.configure(
+        async_logging=logging_params.get('async', True),
+        json_file=logging_params.get('json_file'),
+        level=logging_params.get('level', 'INFO')
+    )
+
+    mt5 = importlib.import_module(settings['mt5_module'])
+    if not mt5.initialize():
+        results.put(('ready', name, False, f'initialize failed: {mt5.last_error()}'))
+        logger_setup.LoggerSingleton.stop()
+        return
+    if not mt5.login(int(settings['login']), password=settings['password'], server=settings['server']):
+        results.put(('ready', name, False, f'login failed: {mt5.last_error()}'))
+        mt5.shutdown()
+        logger_setup.LoggerSingleton.stop()
+        return
+
+    # de rate limiter geldt per account, iedere broker verbinding heeft zijn eigen limiet
+    order_rate_limit = settings['order_rate_limit']
+    OrderRateLimiter.configure(
+        rate=order_rate_limit.get('orders_per_second', 2.5),
+        capacity=order_rate_limit.get('burst', 1)
+    )
+    persistence = settings['persistence']
+    manage_shelve.start_write_behind(
+        flush_interval=persistence.get('flush_interval', 1.0),
+        max_batch_size=persistence.get('max_batch_size', 500),
+        fsync_policy=persistence.get('fsync_policy', 'batch'),
+        fsync_interval=persistence.get('fsync_interval', 5.0)
+    )
+
+    watched_symbols = settings['symbols']
+    SymbolSpecCache.get_cache(mt5, ttl=settings['symbol_cache_ttl']).prewarm(watched_symbols)
+    tick_feed = settings['tick_feed']
+    TickStore.configure(
+        symbols=watched_symbols,
+        history=tick_feed.get('history', 256),
+        max_staleness=tick_feed.get('max_staleness', 2.0)
+    )
+    scheduler = MT5Scheduler(
+        mt5, interval=tick_feed.get('interval', 0.5), symbols=watched_symbols,
+        reconcile_interval=settings['exposure'].get('reconcile_interval', 30.0),
+        account_snapshot=AccountSnapshot.get_snapshot(
+            mt5, max_staleness=settings['account_snapshot'].get('max_staleness', 2.0)
+        ),
+        snapshot_interval=settings['account_snapshot'].get('interval', 1.0)
+    )
+    processor = ProcessTradeSignal(mt5)
+    strategy = Strategy(**settings['strategy'])
+
+    results.put(('ready', name, True, None))
+    logger.info('Account worker %s ready.', name)
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        tick_feed_task = asyncio.create_task(scheduler.start())
+        try:
+            while True:
+                job = await loop.run_in_executor(None, jobs.get)
+                if job is None:
+                    break
+                job_id, tradeSignal = job
+                started = time.perf_counter()
+                try:
+                    orderResults = await processor.start_order_entry_process_async(tradeSignal, strategy)
+                    result = {'fills': [
+                        {'comment': order.request.comment, 'volume': order.volume,
+                         'price': order.price, 'retcode': order.retcode}
+                        for order in orderResults or []
+                    ]}
+                except Exception as e:
+                    logger.error('Account worker %s failed on %s: %s', name, tradeSignal.ref_number, e)
+                    result = {'error': str(e)}
+                result['elapsed'] = time.perf_counter() - started
+                results.put(('result', job_id, name, result))
+        finally:
+            scheduler.stop()
+            tick_feed_task.cancel()
+
+    try:
+        asyncio.run(serve())
+    finally:
+        manage_shelve.stop_write_behind()
+        mt5.shutdown()
+        logger.info('Account worker %s stopped.', name)
+        logger_setup.LoggerSingleton.stop()
+
+class AccountPool:
+    """Een worker proces per MT5 account, aangestuurd vanuit de event loop van de monitor.
+
+    Parameters
+    ----------
+    accounts: dict
+        Naam van de connection -> settings van `get_account_settings`.
+
+    order_timeout: float
+        Maximale tijd in seconden die `submit` op alle accounts wacht.
+    """
+
+    def __init__(self, accounts, order_timeout=30.0, start_timeout=60.0):
+        self.accounts = accounts
+        self.order_timeout = order_timeout
+        self.start_timeout = start_timeout
+        self.results = multiprocessing.Queue()
+        self.jobs = {}
+        self.processes = {}
+        self.ready = []
+        self.pending = {}  # job id -> (future, {account: result})
+        self.job_ids = itertools.count(1)
+        self.loop = None
+        self.collector = None
+
+    @staticmethod
+    def from_config(config, connection_names, channels=None, mt5_module='MetaTrader5'):
+        fan_out = config.get('fan_out', {})
+        return AccountPool(
+            {name: get_account_settings(config, name, channels, mt5_module) for name in connection_names},
+            order_timeout=fan_out.get('order_timeout', 30.0),
+            start_timeout=fan_out.get('start_timeout', 60.0)
+        )
+
+    def start(self):
+        """Start de workers en wacht tot ze ingelogd zijn. Accounts die niet starten worden overgeslagen."""
+        for name, settings in self.accounts.items():
+            self.jobs[name] = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=account_worker, args=(name, settings, self.jobs[name], self.results),
+                name=f'account-{name}', daemon=True
+            )
+            process.start()
+            self.processes[name] = process
+
+        deadline = time.monotonic() + self.start_timeout
+        waiting = set(self.accounts)
+        while waiting:
+            try:
+                _, name, ok, error = self.results.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                logger.error("Account workers did not start in time: %s", ', '.join(sorted(waiting)))
+                break
+            waiting.discard(name)
+            if ok:
+                self.ready.append(name)
+            else:
+                logger.error('Account worker %s could not start: %s', name, error)
+
+        if not self.ready:
+            raise ConnectionError('None of the account workers could log in.')
+        logger.info("Account workers ready: %s", ', '.join(self.ready))
+
+        self.collector = threading.Thread(target=self.collect, name='account-pool-results', daemon=True)
+        self.collector.start()
+
+    def collect(self):
+        # draait in een thread; de resultaten worden in de event loop afgeleverd
+        while True:
+            message = self.results.get()
+            if message is None:
+                break
+            _, job_id, name, result = message
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.deliver, job_id, name, result)
+
+    def deliver(self, job_id, name, result):
+        if job_id not in self.pending:
+            logger.info('Late result of %s for job %s ignored.', name, job_id)
+            return
+        future, collected = self.pending[job_id]
+        collected[name] = result
+        if len(collected) == len(self.ready) and not future.done():
+            future.set_result(collected)
+
+    async def submit(self, tradeSignal):
+        """Stuurt een signaal naar alle accounts tegelijk en geeft per account het resultaat terug.
+
+        Accounts die niet binnen `order_timeout` antwoorden krijgen {'error': 'timeout'}.
+        """
+        self.loop = asyncio.get_running_loop()
+        job_id = next(self.job_ids)
+        future = self.loop.create_future()
+        collected = {}
+        self.pending[job_id] = (future, collected)
+        for name in self.ready:
+            self.jobs[name].put((job_id, tradeSignal))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.order_timeout)
+        except asyncio.TimeoutError:
+            for name in self.ready:
+                collected.setdefault(name, {'error': 'timeout'})
+        finally:
+            del self.pending[job_id]
+        return dict(collected)
+
+    @staticmethod
+    def format_summary(tradeSignal, results):
+        lines = [f'Fan-out {tradeSignal.ref_number} ({tradeSignal.forexSymbol}):']
+        for name, result in sorted(results.items()):
+            if 'error' in result:
+                lines.append(f"{name}: FAILED ({result['error']})")
+                continue
+            volume = round(sum(fill['volume'] for fill in result['fills']), 2)
+            prices = ', '.join(str(fill['price']) for fill in result['fills'])
+            lines.append(f"{name}: {len(result['fills'])} orders, {volume} lots @ {prices or '-'} "
+                         f"({result.get('elapsed', 0) * 1000:.0f} ms)")
+        return '\n'.join(lines)
+
+    def stop(self, timeout=10.0):
+        for name in self.ready:
+            self.jobs[name].put(None)
+        for name, process in self.processes.items():
+            process.join(timeout)
+            if process.is_alive():
+                logger.error('Account worker %s did not stop, terminating.', name)
+                process.terminate()
+        if self.collector is not None:
+            self.results.put(None)
+            self.collector.join(timeout)
+            self.collector = None
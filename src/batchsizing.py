@@ -0,0 +1,96 @@
+from decimal import Decimal, ROUND_HALF_EVEN
+import numpy as np
+
+class BatchPositionSize:
+    """Gevectoriseerde variant van `PositionSize` en `split_position_size`.
+
+    Alle argumenten zijn arrays (of scalars) die tegen elkaar worden
+    gebroadcast, een rij per combinatie van signaal, account en strategie.
+    De uitkomsten zijn gelijk aan de scalaire versies in tradingbot.py; met
+    `size_legs` worden in een aanroep de volumes per leg bepaald, zodat een
+    signaal voor veel accounts en strategieen tegelijk (of een backtest over
+    duizenden signalen) geen Python loop per positie nodig heeft.
+    """
+
+    @staticmethod
+    def strategy_arrays(strategies):
+        """Zet een lijst `Strategy` objecten om naar de arrays die `size_legs` verwacht."""
+        return {
+            'risklevel': np.array([strategy.risklevel for strategy in strategies], dtype=float),
+            'use_fixed_risk_amount': np.array([bool(strategy.useFixedRiskAmount) for strategy in strategies]),
+            'fixed_risk_amount': np.array([strategy.fixedRiskAmount for strategy in strategies], dtype=float),
+            'split': np.array([bool(strategy.splitPositionSize) for strategy in strategies]),
+        }
+
+    def calculate_position_sizes(self, equity, risklevel, stop_distance, eur_base_price, contract_size,
+                                 use_fixed_risk_amount=False, fixed_risk_amount=0.0):
+        """Positiegrootte in lots, zoals `PositionSize.calculate_position_size`.
+
+        stop_distance is de absolute afstand tussen de prijs en de stop loss.
+        """
+        stopLossPipsEur = np.round(np.abs(np.asarray(stop_distance, dtype=float)), 5) / eur_base_price
+        riskAmount = np.where(use_fixed_risk_amount, fixed_risk_amount, np.multiply(equity, risklevel))
+        return np.round(riskAmount / stopLossPipsEur / contract_size, 2)
+
+    def split_volumes(self, volumes, parts, volume_min=0.01, volume_step=0.01, volume_max=np.inf, split=True):
+        """Verdeelt ieder volume over `parts` legs; geeft een (n, max(parts)) array.
+
+        Werkt in eenheden van volume_step. Het afrondingsverschil gaat, net als
+        in `split_position_size`, bij een overschot naar de eerste leg en bij
+        een tekort een stap van de laatste legs af. Een volume dat te klein is
+        om te splitsen krijgt op iedere leg het minimale volume, zoals in
+        `start_order_entry_process_async`. Ongebruikte legs zijn 0.
+        """
+        volumes, parts, volume_min, volume_step, volume_max, split = np.broadcast_arrays(
+            np.asarray(volumes, dtype=float), np.asarray(parts, dtype=np.int64),
+            np.asarray(volume_min, dtype=float), np.asarray(volume_step, dtype=float),
+            np.asarray(volume_max, dtype=float), np.asarray(split, dtype=bool)
+        )
+        volumes, volume_min, volume_step = np.atleast_1d(volumes), np.atleast_1d(volume_min), np.atleast_1d(volume_step)
+        volume_max, split = np.atleast_1d(volume_max), np.atleast_1d(split)
+        parts = np.where(np.atleast_1d(split), np.atleast_1d(parts), 1)
+
+        legs = np.arange(max(int(parts.max(initial=1)), 1))
+        active = legs < parts[:, None]
+
+        stepsPerLot = np.rint(1 / volume_step)
+        steps = np.rint(volumes * stepsPerLot).astype(np.int64)
+        baseSteps = self.round_half_even(volumes / parts, stepsPerLot)
+        difference = steps - baseSteps * parts
+
+        legSteps = np.where(active, baseSteps[:, None], 0)
+        legSteps[:, 0] += np.maximum(difference, 0)
+        shortfall = np.maximum(-difference, 0)
+        legSteps -= (active & (legs >= (parts - shortfall)[:, None])).astype(np.int64)
+
+        legVolumes = legSteps * volume_step[:, None]
+        tooSmall = (volumes / volume_min / parts < 1) & split
+        legVolumes = np.where(tooSmall[:, None] & active, volume_min[:, None], legVolumes)
+        legVolumes = np.minimum(legVolumes, volume_max[:, None])
+        return np.round(legVolumes, 8)
+
+    @staticmethod
+    def round_half_even(values, stepsPerLot):
+        """Aantal stappen van values * stepsPerLot, afgerond zoals Python's round(x, 2) bij 100 stappen.
+
+        np.rint op het product is bijna altijd goed; alleen als het product
+        precies op .5 uitkomt kan de exacte binaire waarde van x er net boven of
+        onder liggen. Die (zeldzame) gevallen worden met Decimal beslist.
+        """
+        scaled = values * stepsPerLot
+        result = np.rint(scaled).astype(np.int64)
+        ties = np.flatnonzero(scaled - np.floor(scaled) == 0.5)
+        for index in ties:
+            exact = Decimal(float(values[index])) * int(stepsPerLot[index])
+            result[index] = int(exact.to_integral_value(rounding=ROUND_HALF_EVEN))
+        return result
+
+    def size_legs(self, equity, risklevel, stop_distance, eur_base_price, contract_size, parts,
+                  use_fixed_risk_amount=False, fixed_risk_amount=0.0, split=True,
+                  volume_min=0.01, volume_step=0.01, volume_max=np.inf):
+        """Positiegrootte plus verdeling over de legs in een aanroep."""
+        volumes = self.calculate_position_sizes(
+            equity, risklevel, stop_distance, eur_base_price, contract_size,
+            use_fixed_risk_amount, fixed_risk_amount
+        )
+        return self.split_volumes(volumes, parts, volume_min, volume_step, volume_max, split)
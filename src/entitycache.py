@@ -0,0 +1,80 @@
+import logger_setup
+import manage_shelve
+
+logger = logger_setup.LoggerSingleton.get_logger()
+
+class EntityCache:
+    """Opgezochte input peers (id + access hash) en titels van de gevolgde channels.
+
+    De ids in de config veranderen nooit, dus een eenmaal opgezochte input
+    peer blijft geldig. De cache staat in de SQLite store en is bij het
+    opstarten direct beschikbaar; alleen een ontbrekende of ongeldige entry
+    kost een request naar Telegram.
+
+    Een entry is (peer type, peer id, access hash, titel); het peer type is
+    de naam van de Telethon class, bijvoorbeeld 'InputPeerChannel'.
+    """
+    PEER_ID_FIELDS = {
+        'InputPeerChannel': 'channel_id',
+        'InputPeerChat': 'chat_id',
+        'InputPeerUser': 'user_id',
+    }
+
+    def __init__(self):
+        self.entries = {}  # channel id uit de config -> (peer type, peer id, access hash, titel)
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        self.entries = manage_shelve.get_channel_entities()
+        logger.info("Entity cache loaded: %d channels.", len(self.entries))
+
+    def get(self, channel_id):
+        entry = self.entries.get(channel_id)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, channel_id, input_peer, title=None):
+        """Legt een opgezochte input peer vast. Andere peers (bijv. InputPeerSelf) worden overgeslagen."""
+        peer_type = type(input_peer).__name__
+        field = self.PEER_ID_FIELDS.get(peer_type)
+        if field is None:
+            return False
+        entry = (peer_type, getattr(input_peer, field), getattr(input_peer, 'access_hash', None),
+                 title if title is not None else self.title(channel_id))
+        if self.entries.get(channel_id) != entry:
+            self.entries[channel_id] = entry
+            manage_shelve.store_channel_entity(channel_id, *entry)
+        return True
+
+    def title(self, channel_id):
+        entry = self.entries.get(channel_id)
+        return None if entry is None else entry[3]
+
+    def update_title(self, channel_id, title):
+        """Werkt de titel bij als die is veranderd (de titel komt mee met binnenkomende berichten)."""
+        entry = self.entries.get(channel_id)
+        if entry is None or not title or entry[3] == title:
+            return False
+        self.entries[channel_id] = entry[:3] + (title,)
+        manage_shelve.store_channel_entity(channel_id, *self.entries[channel_id])
+        return True
+
+    def invalidate(self, channel_id):
+        if self.entries.pop(channel_id, None) is not None:
+            manage_shelve.delete_channel_entity(channel_id)
+
+    def input_peer(self, channel_id):
+        """De Telethon input peer uit de cache, of None als de channel niet in de cache staat."""
+        entry = self.get(channel_id)
+        if entry is None:
+            return None
+        from telethon.tl import types
+        peer_type, peer_id, access_hash, _ = entry
+        peer_class = getattr(types, peer_type)
+        if peer_type == 'InputPeerChat':
+            return peer_class(peer_id)
+        return peer_class(peer_id, access_hash)
@@ -0,0 +1,126 @@
+import time
+import logger_setup
+
+logger = logger_setup.LoggerSingleton.get_logger()
+
+class ExposureBook:
+    """Open risico per positie, per symbool, per valuta en in totaal (in EUR).
+
+    Het risico van een positie is het verlies bij het raken van de stop loss:
+    volume * contract size * |open prijs - stop loss| / EURxxx koers, dezelfde
+    berekening als in `log_order_summary`. De book wordt bijgewerkt met onze
+    eigen fills (`add`) en periodiek gelijkgetrokken met `positions_get`
+    (`reconcile`), zodat de heat check bij een order een O(1) lookup is in
+    plaats van een call naar de broker.
+
+    Een symbool telt mee voor beide valuta van het paar, EURUSD dus voor EUR
+    en voor USD.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.positions = {}  # ticket -> (symbool, risico, tijdstip van toevoegen)
+        self.reservations = {}  # signaal -> (symbool, risico) van orders die nog onderweg zijn
+        self.per_symbol = {}
+        self.per_currency = {}
+        self.total = 0.0
+        self.last_reconcile = None
+
+    @staticmethod
+    def get_book():
+        if ExposureBook._instance is None:
+            ExposureBook._instance = ExposureBook()
+        return ExposureBook._instance
+
+    @staticmethod
+    def position_risk(volume, contract_size, open_price, stop_loss, eur_rate):
+        if not stop_loss or not eur_rate:
+            # zonder stop loss of koers is het risico niet te bepalen
+            return 0.0
+        return volume * contract_size * abs(open_price - stop_loss) / eur_rate
+
+    @staticmethod
+    def currencies(symbol):
+        return (symbol[:3], symbol[3:6]) if len(symbol) >= 6 else (symbol,)
+
+    def _apply(self, symbol, risk):
+        self.per_symbol[symbol] = self.per_symbol.get(symbol, 0.0) + risk
+        for currency in self.currencies(symbol):
+            self.per_currency[currency] = self.per_currency.get(currency, 0.0) + risk
+        self.total += risk
+
+    def add(self, ticket, symbol, risk):
+        """Legt een (eigen) fill vast. Een bekend ticket wordt vervangen."""
+        self.remove(ticket)
+        self.positions[ticket] = (symbol, risk, time.time())
+        self._apply(symbol, risk)
+
+    def remove(self, ticket):
+        position = self.positions.pop(ticket, None)
+        if position is not None:
+            self._apply(position[0], -position[1])
+
+    def reserve(self, key, symbol, risk):
+        """Houdt het risico van een signaal vast tussen de heat check en de fills.
+
+        Zo kunnen twee signalen die tegelijk binnenkomen niet allebei door de
+        check komen terwijl hun orders nog onderweg zijn.
+        """
+        self.release(key)
+        self.reservations[key] = (symbol, risk)
+        self._apply(symbol, risk)
+
+    def consume(self, key, risk):
+        """Verlaagt een reservering met het risico van een fill die net in de book is gezet.
+
+        Zo telt een leg niet dubbel (reservering plus positie) terwijl de
+        overige legs van het signaal nog onderweg zijn.
+        """
+        reservation = self.reservations.get(key)
+        if reservation is None:
+            return
+        symbol, reserved = reservation
+        used = min(max(risk, 0.0), reserved)
+        self.reservations[key] = (symbol, reserved - used)
+        self._apply(symbol, -used)
+
+    def release(self, key):
+        reservation = self.reservations.pop(key, None)
+        if reservation is not None:
+            self._apply(reservation[0], -reservation[1])
+
+    def reconcile(self, positions, started=None):
+        """Trekt de book gelijk met de posities van de broker.
+
+        positions is een lijst (ticket, symbool, risico). Fills die na
+        `started` (het moment dat de snapshot werd opgevraagd) zijn toegevoegd
+        blijven staan, ook als ze nog niet in de snapshot zitten.
+        """
+        keep = {
+            ticket: position for ticket, position in self.positions.items()
+            if started is not None and position[2] >= started
+        }
+        self.positions = {}
+        self.per_symbol = {}
+        self.per_currency = {}
+        self.total = 0.0
+        for ticket, symbol, risk in positions:
+            self.positions[ticket] = (symbol, risk, started or time.time())
+            self._apply(symbol, risk)
+        for ticket, (symbol, risk, added) in keep.items():
+            if ticket not in self.positions:
+                self.positions[ticket] = (symbol, risk, added)
+                self._apply(symbol, risk)
+        for symbol, risk in self.reservations.values():
+            self._apply(symbol, risk)
+        self.last_reconcile = time.time()
+
+    def symbol_risk(self, symbol):
+        return self.per_symbol.get(symbol, 0.0)
+
+    def currency_risk(self, currency):
+        return self.per_currency.get(currency, 0.0)
+
+    def can_add(self, new_risk, equity, portfolioheat):
+        """True als het totale open risico plus new_risk binnen portfolioheat * equity blijft."""
+        return self.total + new_risk <= portfolioheat * equity
@@ -0,0 +1,97 @@
+from datetime import datetime, timezone
+import logger_setup
+from tradesignalparser import ParserRegistry
+
+logger = logger_setup.LoggerSingleton.get_logger()
+
+class RecoveredEvent:
+    """Een bericht uit `iter_messages` in de vorm van een NewMessage event.
+
+    Zo gaan berichten die tijdens een storing zijn gemist door dezelfde
+    handlers als live berichten. `chat` is None: de titel staat al in de
+    entity cache.
+    """
+    recovered = True
+
+    def __init__(self, chat_id, message):
+        self.chat_id = chat_id
+        self.message = message
+        self.chat = None
+
+def marked_chat_id(channel_id):
+    """Het id waaronder Telethon een channel meldt (`event.chat_id`, -100 + id).
+
+    De config mag ook het kale channel id bevatten; de processed index, de
+    signal store en de order sleutels gebruiken altijd het marked id.
+    """
+    return ParserRegistry.get_chat_ids(channel_id)[-1]
+
+async def fetch_missed_messages(client, processed, channel_id, peer=None, limit=100):
+    """De berichten na het laatst geziene bericht van een channel, oudste eerst, als `RecoveredEvent`s.
+
+    Geeft een lege lijst voor een channel zonder high-water mark. Fouten van
+    `iter_messages` gaan naar de aanroeper.
+    """
+    chat_id = marked_chat_id(channel_id)
+    min_id = processed.resume_from(chat_id)
+    if min_id is None:
+        return []
+    messages = [
+        message async for message in client.iter_messages(peer or chat_id, min_id=min_id, limit=limit)
+    ]
+    return [RecoveredEvent(chat_id, message) for message in reversed(messages)]
+
+class LateSignalPolicy:
+    """Bepaalt of een signaal dat te laat binnenkomt nog wordt uitgevoerd.
+
+    Parameters
+    ----------
+    max_signal_age: float
+        Maximale leeftijd van het bericht in seconden, None voor geen limiet.
+
+    max_price_drift: float
+        Maximale afwijking van de huidige prijs ten opzichte van de open
+        prijs van het signaal, als fractie (0.002 = 0.2%). None voor geen limiet.
+    """
+
+    def __init__(self, max_signal_age=300.0, max_price_drift=0.002):
+        self.max_signal_age = max_signal_age
+        self.max_price_drift = max_price_drift
+        self.rejected = 0
+
+    @staticmethod
+    def signal_age(message_date, now=None):
+        """Leeftijd van een bericht in seconden; Telegram geeft datums in UTC."""
+        if message_date is None:
+            return 0.0
+        if message_date.tzinfo is None:
+            message_date = message_date.replace(tzinfo=timezone.utc)
+        now = now or datetime.now(timezone.utc)
+        return max(0.0, (now - message_date).total_seconds())
+
+    @staticmethod
+    def price_drift(open_price, price):
+        if not open_price or price is None:
+            return None
+        return abs(price - float(open_price)) / float(open_price)
+
+    def check_age(self, message_date, now=None):
+        """Reden om het signaal over te slaan, of None als het niet te oud is."""
+        age = self.signal_age(message_date, now)
+        if self.max_signal_age is not None and age > self.max_signal_age:
+            self.rejected += 1
+            return f'signal is {age:.0f}s old (max {self.max_signal_age:.0f}s)'
+        return None
+
+    def check_drift(self, open_price, price):
+        """Reden om het signaal over te slaan, of None als de prijs nog dicht genoeg bij de open prijs ligt.
+
+        Zonder huidige prijs of open prijs valt de drift niet te bepalen en
+        wordt het signaal niet tegengehouden; de order entry controleert de
+        prijs zelf ook.
+        """
+        drift = self.price_drift(open_price, price)
+        if self.max_price_drift is not None and drift is not None and drift > self.max_price_drift:
+            self.rejected += 1
+            return f'price {price} drifted {drift:.2%} from {open_price} (max {self.max_price_drift:.2%})'
+        return None
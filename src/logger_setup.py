@@ -1,9 +1,65 @@
 # logger_setup.py
 
+import copy
+import json
 import logging
+import logging.handlers
+import queue
+
+# velden die via `extra=` aan een log record kunnen worden meegegeven
+STRUCTURED_FIELDS = ('ref', 'channel', 'stage')
+
+class JsonLinesFormatter(logging.Formatter):
+    """Een JSON object per regel, met de velden uit STRUCTURED_FIELDS als ze gezet zijn."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler die het bericht niet in de aanroepende thread formatteert.
+
+    De standaard QueueHandler formatteert het bericht al voordat het op de
+    queue gaat. Hier worden alleen de argumenten (ondiep) gekopieerd, zodat
+    een object dat later nog wordt aangepast (bijvoorbeeld het ref nummer van
+    een TradeSignal) toch wordt gelogd zoals het was. Het formatteren gebeurt
+    in de listener thread.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if isinstance(record.args, tuple):
+            record.args = tuple(self.snapshot(arg) for arg in record.args)
+        if record.exc_info:
+            # tracebacks houden frames vast, dus die worden wel direct omgezet
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    @staticmethod
+    def snapshot(arg):
+        if isinstance(arg, (str, int, float, bool, type(None))):
+            return arg
+        try:
+            return copy.copy(arg)
+        except Exception:
+            return repr(arg)
 
 class LoggerSingleton:
     _instance = None
+    _listener = None
 
     @staticmethod
     def get_logger(log_file='data/log.txt'):  # Standaard log_file
@@ -24,3 +80,51 @@ class LoggerSingleton:
             LoggerSingleton._instance.addHandler(file_handler)
 
         return LoggerSingleton._instance
+
+    @staticmethod
+    def configure(async_logging=True, json_file=None, level='INFO'):
+        """Zet de logger om naar een queue: de handlers draaien in een achtergrond thread.
+
+        De bestaande console en file handlers verhuizen naar een QueueListener,
+        zodat de event loop niet meer op de terminal of de schijf wacht. Met
+        `json_file` komt er een extra handler bij die JSON-lines schrijft met
+        de velden ref, channel en stage.
+        """
+        logger = LoggerSingleton.get_logger()
+        logger.setLevel(level)
+        LoggerSingleton.stop()
+
+        handlers = [handler for handler in logger.handlers if not isinstance(handler, LazyQueueHandler)]
+        if json_file and not any(isinstance(handler.formatter, JsonLinesFormatter) for handler in handlers):
+            json_handler = logging.FileHandler(json_file)
+            json_handler.setFormatter(JsonLinesFormatter())
+            handlers.append(json_handler)
+
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+
+        if not async_logging:
+            for handler in handlers:
+                logger.addHandler(handler)
+            return logger
+
+        log_queue = queue.SimpleQueue()
+        logger.addHandler(LazyQueueHandler(log_queue))
+        LoggerSingleton._listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        LoggerSingleton._listener.start()
+        return logger
+
+    @staticmethod
+    def stop():
+        """Stopt de listener nadat alle records in de queue zijn weggeschreven."""
+        if LoggerSingleton._listener is not None:
+            listener = LoggerSingleton._listener
+            LoggerSingleton._listener = None
+            listener.stop()
+            # de handlers weer direct aan de logger hangen voor wat er nog na komt
+            logger = LoggerSingleton.get_logger()
+            for handler in list(logger.handlers):
+                if isinstance(handler, LazyQueueHandler):
+                    logger.removeHandler(handler)
+            for handler in listener.handlers:
+                logger.addHandler(handler)
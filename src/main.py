@@ -1,3 +1,6 @@
+import time
+STARTED = time.perf_counter()
+
 import json
 import asyncio
 import signal
@@ -7,10 +10,17 @@ import contextlib
 import logger_setup
 import argparse
 import sys
-import MetaTrader5 as mt5
-from mt5handler import MT5Scheduler
+import manage_shelve
+from accountpool import AccountPool
+from mt5handler import AccountSnapshot, MT5Handler, MT5Scheduler, SymbolSpecCache, TickStore
 from strategy import Strategy
-from telegram_monitor import ChannelMonitor
+from ratelimiter import OrderRateLimiter
+from supervisor import ReconnectSupervisor
+from metrics import EventLoopLagMonitor, MetricsRegistry, MetricsServer
+from tracing import StartupTimer
+
+# MetaTrader5, Telethon en python-telegram-bot worden pas in main() geladen: --help
+# blijft snel en de Telegram imports lopen tegelijk met het verbinden van MT5
 
 logger = logger_setup.LoggerSingleton.get_logger()
 
@@ -36,33 +46,199 @@ def suppress_output():
             logger.info("suppressing....")
             yield
 
-async def run_channel(channel_monitor):
-    await channel_monitor.start_monitoring()
+def get_channels(config, channel_params):
+    """De te volgen channels uit de config, gefilterd op --channels zoals in `ChannelMonitor`."""
+    if not channel_params:
+        return config['channels']
+    return [channel for channel in config['channels'] if channel['param_name'] in channel_params]
+
+def connect_mt5(mt5, config, connection_name, channels, timer):
+    """Start de terminal, logt in en haalt de symbool specificaties op.
+
+    Draait in de MT5 thread, tegelijk met het verbinden van Telegram. Geeft de
+    gevolgde symbolen terug, of None als de terminal niet kon starten.
+    """
+    login, password, server = get_mt5_credentials(config, connection_name)
+    with timer.measure('mt5_initialize'):
+        initialized = mt5.initialize()
+    if not initialized:
+        logger.info("initialize mt5 failed")
+        logger.info(mt5.last_error())
+        mt5.shutdown()
+        return None
+
+    with timer.measure('mt5_login'):
+        if mt5.login(int(login), password=password, server=server):
+            logger.info("Ingelogd op account:")
+        else:
+            logger.info("Inloggen mislukt. Fout: %s", mt5.last_error())
+
+    # haal de symbool specificaties alvast op zodat het eerste signaal niet hoeft te wachten
+    with timer.measure('symbol_prewarm'):
+        symbol_cache = SymbolSpecCache.get_cache(mt5, ttl=config.get('symbol_cache_ttl', 6 * 3600))
+        watched_symbols = SymbolSpecCache.symbols_to_prewarm(channels)
+        symbol_cache.prewarm(watched_symbols)
+    return watched_symbols
+
+def get_supervisor(config):
+    reconnect = config.get('reconnect', {})
+    return ReconnectSupervisor(
+        base_delay=reconnect.get('base_delay', 1.0),
+        max_delay=reconnect.get('max_delay', 60.0),
+        jitter=reconnect.get('jitter', 0.5)
+    )
+
+async def start_metrics(config, supervisor):
+    """Start de lokale metrics endpoint en de event loop lag meting, als `metrics.enabled` aan staat.
+
+    Geeft (server, lag monitor) terug voor `stop_metrics`, of None.
+    """
+    params = config.get('metrics', {})
+    if not params.get('enabled', False):
+        return None
+    registry = MetricsRegistry.get_registry()
+    registry.gauge('reconnects', 'Aantal reconnects naar Telegram.', callback=lambda: supervisor.reconnects)
+    registry.gauge('last_downtime_seconds', 'Downtime van de laatste storing.', callback=lambda: supervisor.last_downtime)
+    lagMonitor = EventLoopLagMonitor(interval=params.get('loop_lag_interval', 0.5), registry=registry)
+    server = MetricsServer(registry, host=params.get('host', '127.0.0.1'), port=params.get('port', 9108))
+    try:
+        await server.start()
+    except OSError as e:
+        # de bot draait ook zonder metrics
+        logger.error('Metrics endpoint could not start: %s', e)
+        return None
+    lagMonitor.start()
+    return server, lagMonitor
+
+async def stop_metrics(metrics):
+    if metrics is not None:
+        server, lagMonitor = metrics
+        lagMonitor.stop()
+        await server.stop()
+
+def install_shutdown_handlers(loop, channel_monitor):
+    """SIGINT en SIGTERM starten `graceful_shutdown` op de loop.
 
-# experimental
-async def run_mt5_scheduler(mt5):
-    mt5_data_fetcher = MT5Scheduler(mt5)
-    await mt5_data_fetcher.start()
+    De monitor stopt zodra `is_running` False is, daarna moet de loop nog
+    doorlopen tot de teruggegeven shutdown task klaar is. Waar de loop geen
+    signal handlers ondersteunt (Windows) blijft KeyboardInterrupt over.
+    """
+    shutdown = []
+
+    def handle_signal(signum):
+        if shutdown:
+            return
+        logger.info("Signal %s received. Shutting down...", signal.Signals(signum).name)
+        shutdown.append(loop.create_task(channel_monitor.graceful_shutdown()))
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, handle_signal, signum)
+        except NotImplementedError:
+            break
+    return shutdown
+
+async def finish_shutdown(shutdown):
+    if shutdown and not shutdown[0].done():
+        await shutdown[0]
+
+def run_fan_out(config, args, timer):
+    """Een Telegram listener voor meerdere accounts: de orders lopen via de AccountPool."""
+    with timer.measure('import_telegram'):
+        from telegram_monitor import ChannelMonitor
+
+    persistence = config.get('persistence', {})
+    manage_shelve.start_write_behind(
+        flush_interval=persistence.get('flush_interval', 1.0),
+        max_batch_size=persistence.get('max_batch_size', 500),
+        fsync_policy=persistence.get('fsync_policy', 'batch'),
+        fsync_interval=persistence.get('fsync_interval', 5.0)
+    )
+
+    try:
+        channel_monitor = ChannelMonitor(config, None, None, args.channels)
+        account_pool = AccountPool.from_config(config, args.connections, channel_monitor.channels)
+    except ValueError as e:
+        logger.error('%s', e)
+        manage_shelve.stop_write_behind()
+        sys.exit(1)
+    channel_monitor.account_pool = account_pool
+
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: channel_monitor.dump_latency_traces())
+
+    supervisor = get_supervisor(config)
+
+    async def run():
+        # iedere worker logt zelf in terwijl de listener met Telegram verbindt;
+        # accounts die niet inloggen worden overgeslagen
+        def start_pool():
+            with timer.measure('account_workers'):
+                account_pool.start()
+
+        loop = asyncio.get_running_loop()
+        shutdown = install_shutdown_handlers(loop, channel_monitor)
+        metrics = await start_metrics(config, supervisor)
+        try:
+            await asyncio.gather(
+                loop.run_in_executor(None, start_pool), supervisor.connect(lambda: channel_monitor.connect(timer))
+            )
+            timer.log()
+            logger.info("Starting the channel monitor for %s.", ', '.join(account_pool.ready))
+            await supervisor.run(channel_monitor.connect, channel_monitor.monitor, connected=True)
+            await finish_shutdown(shutdown)
+        finally:
+            await stop_metrics(metrics)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.info("KeyboardInterrupt received. Exiting...")
+    except ConnectionError as e:
+        logger.error('%s', e)
+    finally:
+        account_pool.stop()
+        manage_shelve.stop_write_behind()
+        logger.info("Trading bot stopped.")
+        logger_setup.LoggerSingleton.stop()
 
 def main():
 
     logger = logger_setup.LoggerSingleton.get_logger()
+    timer = StartupTimer(STARTED)
+    timer.record('imports', STARTED)
 
+    config_start = time.perf_counter()
     with open('config.json', 'r') as config_file:
         config = json.load(config_file)
 
+    # log records worden in een achtergrond thread weggeschreven, niet op de event loop
+    logging_params = config.get('logging', {})
+    logger_setup.LoggerSingleton.configure(
+        async_logging=logging_params.get('async', True),
+        json_file=logging_params.get('json_file'),
+        level=logging_params.get('level', 'INFO')
+    )
+
     available_connections = ', '.join(config['mt5_connections'].keys())
     available_channels = ', '.join(channel['param_name'] for channel in config['channels'])
     
     # Argument parser instellen
     parser = argparse.ArgumentParser(description='MT5 Connection')
 
-    parser.add_argument(
+    # een enkele connection, of met --connections een fan-out naar meerdere accounts
+    connection_group = parser.add_mutually_exclusive_group(required=True)
+    connection_group.add_argument(
         '--connection',
         type=str,
-        required=True,  # Maak dit argument verplicht
         help=f'De MT5 connection name (available: {available_connections}).'
     )
+    connection_group.add_argument(
+        '--connections',
+        type=str,
+        nargs='+',
+        help='Meerdere MT5 connections, ieder in een eigen worker proces.'
+    )
     parser.add_argument(
         '--channels', 
         type=str, 
@@ -71,65 +247,115 @@ def main():
     )
 
     args = parser.parse_args()
+    timer.record('config', config_start)
+
+    if args.connections:
+        run_fan_out(config, args, timer)
+        return
 
-    # Maak een MT5Connection object aan
-    login, password, server = get_mt5_credentials(config, args.connection)
+    try:
+        get_mt5_credentials(config, args.connection)
+    except ValueError as e:
+        logger.error('%s', e)
+        sys.exit(1)
+
+    # MT5 verbinden in de MT5 thread; ondertussen worden Telegram geimporteerd en verbonden
+    with timer.measure('import_mt5'):
+        import MetaTrader5 as mt5
+    mt5_connected = MT5Handler.executor.submit(
+        connect_mt5, mt5, config, args.connection, get_channels(config, args.channels), timer
+    )
 
     strategy_params = get_strategy_params(config, args.connection)
     strategy = Strategy(**strategy_params)
 
+    # gedeelde order rate limiter voor alle channels
+    order_rate_limit = config.get('order_rate_limit', {})
+    OrderRateLimiter.configure(
+        rate=order_rate_limit.get('orders_per_second', 2.5),
+        capacity=order_rate_limit.get('burst', 1)
+    )
+
+    # opslag via een achtergrond writer zodat de handlers niet op de schijf wachten
+    persistence = config.get('persistence', {})
+    manage_shelve.start_write_behind(
+        flush_interval=persistence.get('flush_interval', 1.0),
+        max_batch_size=persistence.get('max_batch_size', 500),
+        fsync_policy=persistence.get('fsync_policy', 'batch'),
+        fsync_interval=persistence.get('fsync_interval', 5.0)
+    )
+
     try:
+        with timer.measure('import_telegram'):
+            from telegram_monitor import ChannelMonitor
         channel_monitor = ChannelMonitor(config, mt5, strategy, args.channels)
     except ValueError as e:
-        logger.error(f'{e}')
+        logger.error('%s', e)
         sys.exit(1)
 
-    # Start de MT5 terminal
-    if not mt5.initialize():
-        logger.info("initialize mt5 failed")
-        logger.info(mt5.last_error())
-        mt5.shutdown()
-        exit()
+    tick_feed = config.get('tick_feed', {})
+    account_snapshot = config.get('account_snapshot', {})
 
-    if mt5.login(int(login), password=password, server=server):
-        logger.info("Ingelogd op account:")
-    else:
-        logger.info("Inloggen mislukt. Fout:", mt5.last_error())
+    loop = asyncio.get_event_loop()
 
-    # Start the telegram channel monitor
-    logger.info('Starting the channel monitor.')
+    # latency traces op verzoek wegschrijven: kill -USR1 <pid> (niet beschikbaar onder Windows)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: channel_monitor.dump_latency_traces())
 
-    loop = asyncio.get_event_loop()
+    supervisor = get_supervisor(config)
+    # voor de loop start, anders komt een SIGTERM nooit bij graceful_shutdown
+    shutdown = install_shutdown_handlers(loop, channel_monitor)
 
     async def run_channel():
-        await channel_monitor.start_monitoring()
-
-    def connect():
+        metrics = await start_metrics(config, supervisor)
         try:
-            loop.run_until_complete(run_channel())
-        except KeyboardInterrupt:
-            logger.info("KeyboardInterrupt received. Exiting...")
-        except ConnectionError as e:
-            logger.info('Connection error, trying to reconnect...')
-            connect()
-        except ConnectionRefusedError as e:
-            logger.info('Connection refused error, trying to reconnect...')
-            connect()
+            await connect_and_monitor()
         finally:
-            loop.close()
-            logger.info("Trading bot stopped.")
+            await stop_metrics(metrics)
 
-    connect()
+    async def connect_and_monitor():
+        # Telegram verbinden terwijl de MT5 thread de terminal start
+        telegram_connected = asyncio.create_task(supervisor.connect(lambda: channel_monitor.connect(timer)))
+        watched_symbols = await asyncio.wrap_future(mt5_connected)
+        if watched_symbols is None:
+            telegram_connected.cancel()
+            raise SystemExit(1)
+        await telegram_connected
 
-    # Signal handler registreren
-    def handle_signal(signum, frame):
-        print(f"Signal {signum} received. Shutting down...")
-        loop.create_task(channel_monitor.graceful_shutdown())  # Voeg de coroutine toe aan de eventloop
-        loop.stop()  # Stop de hoofdloop netjes
+        # tick feed voor de gevolgde symbolen
+        TickStore.configure(
+            symbols=watched_symbols,
+            history=tick_feed.get('history', 256),
+            max_staleness=tick_feed.get('max_staleness', 2.0)
+        )
+        mt5_scheduler = MT5Scheduler(
+            mt5, interval=tick_feed.get('interval', 0.5), symbols=watched_symbols,
+            reconcile_interval=config.get('exposure', {}).get('reconcile_interval', 30.0),
+            account_snapshot=AccountSnapshot.get_snapshot(mt5, max_staleness=account_snapshot.get('max_staleness', 2.0)),
+            snapshot_interval=account_snapshot.get('interval', 1.0)
+        )
+        timer.log()
 
-    # Signal handlers instellen
-    signal.signal(signal.SIGINT, handle_signal)
-    signal.signal(signal.SIGTERM, handle_signal)
+        # Start the telegram channel monitor
+        logger.info('Starting the channel monitor.')
+        tick_feed_task = asyncio.create_task(mt5_scheduler.start())
+        try:
+            await supervisor.run(channel_monitor.connect, channel_monitor.monitor, connected=True)
+        finally:
+            mt5_scheduler.stop()
+            tick_feed_task.cancel()
+
+    # de supervisor verbindt opnieuw op dezelfde loop en met dezelfde client
+    try:
+        loop.run_until_complete(run_channel())
+        loop.run_until_complete(finish_shutdown(shutdown))
+    except KeyboardInterrupt:
+        logger.info("KeyboardInterrupt received. Exiting...")
+    finally:
+        manage_shelve.stop_write_behind()
+        loop.close()
+        logger.info("Trading bot stopped.")
+        logger_setup.LoggerSingleton.stop()
 
 if __name__ == "__main__":
     main()
@@ -1,48 +1,158 @@
 import shelve
 import os
+import copy
+from signalstore import SignalStore, WriteBehindWriter
 
+# De oorspronkelijke shelve databases worden nu als 'logische' namen gebruikt
+# voor de tabellen in de SQLite store. De functies hieronder houden dezelfde
+# interface zodat de aanroepers niet hoeven te veranderen.
 SIGNALS_DB = os.path.join('data', 'trade_signals')
 TRADES_POSITIONS_DB = os.path.join('data', 'signals_and_positions')
+STORE_DB = os.path.join('data', 'autosignaltrader.sqlite3')
 
-def store_data(dbName, key, value):
-    with shelve.open(dbName) as db:
-        db[key] = value
+# write-behind writer, None zolang er synchroon wordt weggeschreven
+writer = None
 
-def get_item(dbName, key):
-    with shelve.open(dbName) as db:
-        try:
-            return db[key]
-        except KeyError:
-            return
+def get_store():
+    return SignalStore.get_store(STORE_DB)
+
+def set_store(store):
+    """Gebruik een andere store, bijvoorbeeld een in-memory store tijdens een replay."""
+    SignalStore._instance = store
+
+def start_write_behind(flush_interval=1.0, max_batch_size=500, fsync_policy='batch', fsync_interval=5.0):
+    """Laat alle schrijfacties via een achtergrond writer lopen."""
+    global writer
+    if writer is None:
+        writer = WriteBehindWriter(get_store(), flush_interval, max_batch_size, fsync_policy, fsync_interval)
+        writer.start()
+    return writer
+
+def stop_write_behind():
+    """Schrijft openstaande records weg, daarna wordt er weer synchroon geschreven."""
+    global writer
+    if writer is not None:
+        writer.stop()
+        writer = None
+
+def _write(kind, *args):
+    if writer is not None:
+        writer.enqueue(kind, *args)
+    else:
+        get_store().write_batch([(kind, args)])
+
+def order_key(channel_id, message_id):
+    """Sleutel van de order resultaten van een signaal: het bericht waar het signaal uit komt."""
+    return f'{channel_id}:{message_id}'
+
+def store_data(dbName, key, value, channel_id=0):
+    if dbName == SIGNALS_DB:
+        _write('message_versions', channel_id, int(key), value)
+    elif dbName == TRADES_POSITIONS_DB:
+        _write('order_results', key, value)
+    else:
+        raise ValueError(f'Unknown database: {dbName}')
+
+def get_item(dbName, key, channel_id=None):
+    if dbName == SIGNALS_DB:
+        if writer is not None:
+            pending = writer.get_pending_message_versions(int(key), channel_id)
+            if pending is not None:
+                return pending
+        return get_store().get_message_versions(int(key), channel_id)
+    elif dbName == TRADES_POSITIONS_DB:
+        return get_store().get_order_results(key)
+    raise ValueError(f'Unknown database: {dbName}')
+
+def append_message_version(channel_id, message_id, text):
+    """Slaat een nieuwe versie van een bericht op; kost O(1), ongeacht het aantal edits."""
+    _write('message_version', channel_id, int(message_id), text)
+
+def get_latest_message_version(channel_id, message_id):
+    if writer is not None:
+        pending = writer.get_pending_latest_message_version(channel_id, int(message_id))
+        if pending is not None:
+            return pending
+    return get_store().get_latest_message_version(channel_id, int(message_id))
+
+def get_signal(channel_id, message_id):
+    """Het laatst opgeslagen signaal van een bericht als dict (zoals `SignalStore.get_signal`), of None."""
+    if writer is not None:
+        pending = writer.get_pending_signal(channel_id, message_id)
+        if pending is not None:
+            return {
+                'ref_number': pending.ref_number, 'symbol': pending.forexSymbol,
+                'direction': pending.tradeDirection, 'open_price': pending.open_price,
+                'stop_loss': pending.stop_loss, 'target_profits': list(pending.target_profits)
+            }
+    return get_store().get_signal(channel_id, message_id)
+
+def store_signal(channel_id, message_id, trade_signal):
+    # kopie, het signaal kan nog worden aangepast voordat het is weggeschreven
+    _write('signal', channel_id, message_id, copy.copy(trade_signal))
+
+def mark_processed(channel_id, message_id, ref_number):
+    _write('processed', channel_id, message_id, ref_number)
+
+def get_processed(channel_id, message_id):
+    # openstaande writes staan nog niet in de store, die vangt ProcessedMessageIndex zelf af
+    return get_store().get_processed(channel_id, message_id)
+
+def get_recent_processed(limit):
+    return get_store().get_recent_processed(limit)
+
+def get_processed_high_water_marks():
+    return get_store().get_processed_high_water_marks()
+
+def store_channel_position(channel_id, message_id):
+    _write('channel_position', channel_id, message_id)
+
+def get_channel_positions():
+    return get_store().get_channel_positions()
+
+def store_channel_entity(channel_id, peer_type, peer_id, access_hash, title):
+    _write('channel_entity', channel_id, peer_type, peer_id, access_hash, title)
+
+def delete_channel_entity(channel_id):
+    _write('delete_channel_entity', channel_id)
+
+def get_channel_entities():
+    return get_store().get_channel_entities()
 
 def show_all_data(dbName):
-    with shelve.open(dbName) as db:
-        for key, value in db.items():
+    if dbName == TRADES_POSITIONS_DB:
+        for key, value in get_store().iter_order_results():
             print(f'Sleutel: {key}, Waarde: {value}')
+    else:
+        with get_store().lock:
+            rows = get_store().connection.execute(
+                'SELECT channel_id, message_id, version, text FROM raw_messages ORDER BY message_id, version'
+            ).fetchall()
+        for row in rows:
+            print(f'Sleutel: {row["message_id"]} ({row["channel_id"]}, v{row["version"]}), Waarde: {row["text"]}')
 
 def get_most_recent(dbName):
-    with shelve.open(dbName) as db:
-        sorted_keys = sorted(db.keys(), key=int) 
-        if sorted_keys:
-            # Haal de hoogste sleutel op
-            highest_key = sorted_keys[-1]
-            highest_value = db[highest_key]
-    
-    return highest_key, highest_value
+    if dbName == SIGNALS_DB:
+        return get_store().get_latest_message()
+    elif dbName == TRADES_POSITIONS_DB:
+        return get_store().get_latest_order_results()
+    raise ValueError(f'Unknown database: {dbName}')
+
+def import_shelve(dbName):
+    """Importeert de gegevens uit een oude shelve database in de SQLite store."""
+    count = 0
+    with shelve.open(dbName, flag='r') as db:
+        for key in sorted(db.keys(), key=int):
+            store_data(dbName, key, db[key])
+            count += 1
+    return count
 
 if __name__ == "__main__":
-    key = '34224'
-    value = [1, 2, 3, 4]
-    store_data(SIGNALS_DB, key, value)
-    value.append(1000)
-    store_data(SIGNALS_DB, key, value)
-
-    item = get_item(SIGNALS_DB, '234234')
-    if item:
-        print(item)
-    else:
-        print('niets gevonden') 
-    show_all_data(SIGNALS_DB)
-    highest = get_most_recent(SIGNALS_DB)
-    print(highest)
-    print(type(highest))
+    # eenmalige migratie van de oude shelve databases
+    for dbName in [SIGNALS_DB, TRADES_POSITIONS_DB]:
+        try:
+            print(f'{import_shelve(dbName)} items geimporteerd uit {dbName}')
+        except Exception as e:
+            print(f'Kon {dbName} niet importeren: {e}')
+    print(get_most_recent(SIGNALS_DB))
+    print(get_most_recent(TRADES_POSITIONS_DB))
@@ -0,0 +1,304 @@
+"""Metrics in het Prometheus text formaat (versie 0.0.4) via een lokale HTTP endpoint.
+
+Geen extra dependency: counters, gauges en histogrammen worden hier
+bijgehouden en bij een scrape van /metrics door een asyncio server in
+hetzelfde proces opgemaakt. Counters en histogrammen mogen vanuit iedere
+thread worden bijgewerkt (bijvoorbeeld de MT5 thread); gauges met een
+callback worden pas bij een scrape uitgerekend.
+"""
+import asyncio
+import math
+import threading
+import time
+import logger_setup
+
+logger = logger_setup.LoggerSingleton.get_logger()
+
+PREFIX = 'autosignaltrader_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.extend(f'{name}="{escape_label(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return 'NaN'
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}  # label waarden -> waarde
+        self.lock = threading.Lock()
+
+    def key(self, labelValues):
+        if len(labelValues) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {labelValues}.")
+        return tuple(str(value) for value in labelValues)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def samples(self):
+        with self.lock:
+            return list(self.values.items())
+
+    def render(self):
+        return self.header() + [
+            f'{self.name}{format_labels(self.labels, labelValues)} {format_value(value)}'
+            for labelValues, value in sorted(self.samples())
+        ]
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labelValues, amount=1):
+        key = self.key(labelValues)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, *labelValues):
+        return self.values.get(self.key(labelValues), 0)
+
+class Gauge(Metric):
+    """Gauge met een vaste waarde (`set`) of een callback die bij de scrape wordt aangeroepen.
+
+    De callback geeft een getal terug, of voor een gauge met labels een dict
+    van label waarden (tuple) naar getal. None betekent geen sample.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def set(self, value, *labelValues):
+        key = self.key(labelValues)
+        with self.lock:
+            self.values[key] = value
+
+    def samples(self):
+        if self.callback is None:
+            return super().samples()
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.info("Metric %s could not be collected: %s", self.name, e)
+            return []
+        if isinstance(value, dict):
+            return [(self.key(key if isinstance(key, tuple) else (key,)), sample)
+                    for key, sample in value.items() if sample is not None]
+        return [] if value is None else [((), value)]
+
+class Histogram(Metric):
+    """Histogram met vaste, cumulatieve buckets zoals Prometheus die verwacht."""
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelValues):
+        key = self.key(labelValues)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # tellingen per bucket, daarna +Inf, som en aantal
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def count(self, *labelValues):
+        counts = self.values.get(self.key(labelValues))
+        return counts[-1] if counts else 0
+
+    def render(self):
+        with self.lock:
+            samples = sorted((key, list(counts)) for key, counts in self.values.items())
+        lines = self.header()
+        for labelValues, counts in samples:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, labelValues, [("le", format_value(bound))])} '
+                             f'{cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, labelValues)} {format_value(counts[-2])}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, labelValues)} {counts[-1]}')
+        return lines
+
+class MetricsRegistry:
+    """Alle metrics van het proces; `counter`, `gauge` en `histogram` geven een bestaande metric terug."""
+    _instance = None
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = {}  # naam -> functie die zelf regels in het text formaat teruggeeft
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_registry():
+        if MetricsRegistry._instance is None:
+            MetricsRegistry._instance = MetricsRegistry()
+        return MetricsRegistry._instance
+
+    def register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labels != metric.labels:
+                    raise ValueError(f"Metric {metric.name} is already registered with other labels.")
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=(), callback=None):
+        gauge = self.register(Gauge(name, documentation, labels, callback))
+        if callback is not None:
+            # een nieuwe monitor (of een test) vervangt de callback van de vorige
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name, documentation, labels=(), buckets=Histogram.DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, name, collector):
+        self.collectors[name] = collector
+
+    def render(self):
+        lines = []
+        for metric in sorted(self.metrics.values(), key=lambda metric: metric.name):
+            lines.extend(metric.render())
+        for collector in self.collectors.values():
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.info("Metrics collector failed: %s", e)
+        return '\n'.join(lines) + '\n'
+
+def latency_summary(name, documentation, histograms):
+    """Regels voor een Prometheus summary uit `LatencyHistogram`s.
+
+    histograms is een lijst van (label paren, histogram); de quantiles
+    komen uit de logaritmische buckets van het histogram (ca. 5% nauwkeurig).
+    """
+    name = PREFIX + name
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} summary']
+    for labels, histogram in histograms:
+        if histogram.count == 0:
+            continue
+        names = [label for label, _ in labels]
+        values = [value for _, value in labels]
+        for quantile in (0.5, 0.95, 0.99):
+            lines.append(f'{name}{format_labels(names, values, [("quantile", quantile)])} '
+                         f'{format_value(histogram.percentile(quantile * 100))}')
+        lines.append(f'{name}_sum{format_labels(names, values)} {format_value(histogram.total)}')
+        lines.append(f'{name}_count{format_labels(names, values)} {histogram.count}')
+    return lines
+
+class EventLoopLagMonitor:
+    """Meet hoe veel later dan gepland de event loop een sleep afrondt.
+
+    Een blokkerende call op de loop (bijvoorbeeld een MT5 call buiten de
+    executor) is zo direct zichtbaar als lag.
+    """
+
+    def __init__(self, interval=0.5, registry=None):
+        registry = registry or MetricsRegistry.get_registry()
+        self.interval = interval
+        self.lag = registry.gauge('event_loop_lag_last_seconds', 'Laatst gemeten vertraging van de event loop.')
+        self.histogram = registry.histogram('event_loop_lag_seconds', 'Vertraging van de event loop.')
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.lag.set(lag)
+            self.histogram.observe(lag)
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+class MetricsServer:
+    """Minimale HTTP server voor GET /metrics op de event loop van de bot.
+
+    Luistert standaard alleen op localhost; de endpoint is bedoeld voor een
+    Prometheus (of ander) proces op dezelfde machine.
+    """
+
+    def __init__(self, registry=None, host='127.0.0.1', port=9108, read_timeout=5.0):
+        self.registry = registry or MetricsRegistry.get_registry()
+        self.host = host
+        self.port = port
+        self.read_timeout = read_timeout
+        self.server = None
+        self.scrapes = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        # met poort 0 kiest het OS een vrije poort
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info("Metrics available on http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle(self, reader, writer):
+        try:
+            requestLine = await asyncio.wait_for(reader.readline(), self.read_timeout)
+            # de headers zijn niet nodig, maar moeten wel gelezen worden
+            while True:
+                line = await asyncio.wait_for(reader.readline(), self.read_timeout)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+            parts = requestLine.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                self.scrapes += 1
+                self.respond(writer, '200 OK', self.registry.render(), CONTENT_TYPE)
+            else:
+                self.respond(writer, '404 Not Found', 'Not found, try /metrics\n', 'text/plain; charset=utf-8')
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def respond(writer, status, body, contentType):
+        payload = body.encode('utf-8')
+        writer.write(
+            f'HTTP/1.1 {status}\r\nContent-Type: {contentType}\r\n'
+            f'Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + payload
+        )
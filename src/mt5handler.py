@@ -1,16 +1,32 @@
 import pdb
 from datetime import datetime, timedelta
 import asyncio
-import MetaTrader5 as mt5
+import functools
+import threading
+import time
+from array import array
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from logger_setup import LoggerSingleton
+from exposure import ExposureBook
+from metrics import MetricsRegistry
 
 # Verkrijg de logger-instantie zonder log_file argument
 logger = LoggerSingleton.get_logger()  # Gebruik de standaard log_file
 
+ORDER_SEND_RESULTS = MetricsRegistry.get_registry().counter(
+    'order_send_total', 'Resultaten van order_send per actie en retcode.', ('action', 'retcode')
+)
+ORDER_SEND_SECONDS = MetricsRegistry.get_registry().histogram(
+    'order_send_seconds', 'Duur van order_send bij de broker.', ('action',)
+)
+
 class MT5Connection:
     _instance = None
 
     def __new__(cls, login=None, password=None, server=None):
+        # MetaTrader5 bestaat alleen voor Windows (Wine) en wordt pas geladen als het nodig is
+        import MetaTrader5 as mt5
         if cls._instance is None:
             cls._instance = super(MT5Connection, cls).__new__(cls)
             if not mt5.initialize():
@@ -25,43 +41,360 @@ class MT5Connection:
         return MT5Connection._instance
 
     def login(self, login, password):
-
+        import MetaTrader5 as mt5
         if not mt5.login(int(login), password):
             error_code = mt5.last_error()  # Verkrijg de laatste fout
-            logger.warning(f"Login mislukt: {error_code}")  # Log de foutmelding
+            logger.warning("Login mislukt: %s", error_code)  # Log de foutmelding
             raise Exception(f"Login failed: {error_code}")
         logger.info("Login succesvol")
 
+SymbolSpec = namedtuple(
+    'SymbolSpec',
+    ['digits', 'contract_size', 'volume_min', 'volume_step', 'volume_max', 'stops_level', 'fetched_at']
+)
+
+class SymbolSpecCache:
+    """Cache voor symbool specificaties die zelden veranderen.
+
+    Onder Wine kost iedere `symbol_info` call een IPC round trip. De cache
+    houdt per symbool de digits, contract size, volume min/step/max en het
+    stops level vast totdat de TTL verloopt of `invalidate` wordt aangeroepen.
+    """
+    _instance = None
+    _lock = threading.Lock()  # de MT5 thread en de main thread vragen de cache tegelijk op
+
+    def __init__(self, mt5, ttl=6 * 3600):
+        self.mt5 = mt5
+        self.ttl = ttl
+        self.specs = {}
+
+    @staticmethod
+    def get_cache(mt5, ttl=None):
+        with SymbolSpecCache._lock:
+            if SymbolSpecCache._instance is None or SymbolSpecCache._instance.mt5 is not mt5:
+                SymbolSpecCache._instance = SymbolSpecCache(mt5)
+            if ttl is not None:
+                SymbolSpecCache._instance.ttl = ttl
+            return SymbolSpecCache._instance
+
+    def get(self, symbol):
+        spec = self.specs.get(symbol)
+        if spec is None or time.monotonic() - spec.fetched_at > self.ttl:
+            spec = self.refresh(symbol)
+        return spec
+
+    def refresh(self, symbol):
+        info = self.mt5.symbol_info(symbol)
+        if info is None:
+            logger.warning("Could not retrieve symbol info for %s: %s", symbol, self.mt5.last_error())
+            self.specs.pop(symbol, None)
+            return None
+        spec = SymbolSpec(
+            digits=info.digits,
+            contract_size=info.trade_contract_size,
+            volume_min=info.volume_min,
+            volume_step=info.volume_step,
+            volume_max=info.volume_max,
+            stops_level=info.trade_stops_level,
+            fetched_at=time.monotonic()
+        )
+        self.specs[symbol] = spec
+        return spec
+
+    def invalidate(self, symbol=None):
+        """Verwijdert een symbool uit de cache, of de hele cache als er geen symbool is opgegeven."""
+        if symbol is None:
+            self.specs.clear()
+        else:
+            self.specs.pop(symbol, None)
+
+    def prewarm(self, symbols):
+        """Haalt de specificaties van alle opgegeven symbolen alvast op."""
+        start = time.monotonic()
+        loaded = []
+        for symbol in symbols:
+            # zorg dat het symbool in de market watch staat zodat er ook ticks zijn
+            self.mt5.symbol_select(symbol, True)
+            if self.refresh(symbol) is not None:
+                loaded.append(symbol)
+        logger.info("Pre-warmed symbol cache for %s in %.0f ms.", ', '.join(loaded), (time.monotonic() - start) * 1000)
+        return loaded
+
+    @staticmethod
+    def symbols_to_prewarm(channels):
+        """Bepaalt de symbolen uit de channel config plus de EURxxx conversieparen."""
+        symbols = []
+        for channel in channels:
+            for symbol in channel.get('symbols', []):
+                if symbol not in symbols:
+                    symbols.append(symbol)
+        for symbol in list(symbols):
+            quoteCurrency = symbol[-3:]
+            conversionPair = "EUR" + quoteCurrency
+            if quoteCurrency != "EUR" and conversionPair not in symbols:
+                symbols.append(conversionPair)
+        return symbols
+
+class TickStore:
+    """Compacte, vooraf gealloceerde opslag van de laatste ticks per symbool.
+
+    Ieder symbool krijgt een ring buffer (array van doubles) met `history`
+    records van (ontvangen, tick tijd, bid, ask). De schrijver vult eerst het
+    volgende slot en verplaatst daarna pas de kop, zodat een lezer in een
+    andere thread altijd een volledig record ziet. `latest` is O(1).
+    """
+    _instance = None
+    RECORD_SIZE = 4
+
+    def __init__(self, symbols=(), history=256, max_staleness=2.0):
+        self.reset(symbols, history, max_staleness)
+
+    @staticmethod
+    def get_store():
+        if TickStore._instance is None:
+            TickStore._instance = TickStore()
+        return TickStore._instance
+
+    @staticmethod
+    def configure(symbols=(), history=256, max_staleness=2.0):
+        # de gedeelde store wordt in place aangepast, handlers die al een
+        # referentie hebben lezen daardoor meteen uit de nieuwe buffers
+        store = TickStore.get_store()
+        store.reset(symbols, history, max_staleness)
+        return store
+
+    def reset(self, symbols=(), history=256, max_staleness=2.0):
+        if history < 2:
+            raise ValueError(f"Invalid history: {history}. Must be at least 2.")
+        self.history = history
+        self.max_staleness = max_staleness
+        self.buffers = {}
+        self.heads = {}
+        for symbol in symbols:
+            self.add_symbol(symbol)
+
+    def add_symbol(self, symbol):
+        if symbol not in self.buffers:
+            self.buffers[symbol] = array('d', bytes(8 * self.RECORD_SIZE * self.history))
+            self.heads[symbol] = -1
+
+    def symbols(self):
+        return list(self.buffers.keys())
+
+    def put(self, symbol, bid, ask, tick_time, received=None):
+        self.add_symbol(symbol)
+        buffer = self.buffers[symbol]
+        slot = (self.heads[symbol] + 1) % self.history
+        offset = slot * self.RECORD_SIZE
+        buffer[offset] = time.monotonic() if received is None else received
+        buffer[offset + 1] = tick_time
+        buffer[offset + 2] = bid
+        buffer[offset + 3] = ask
+        self.heads[symbol] = slot
+
+    def latest(self, symbol):
+        """Geeft (ontvangen, tick tijd, bid, ask) van de laatste tick terug, of None."""
+        head = self.heads.get(symbol, -1)
+        if head < 0:
+            return None
+        offset = head * self.RECORD_SIZE
+        return tuple(self.buffers[symbol][offset:offset + self.RECORD_SIZE])
+
+    def age(self, symbol):
+        """Leeftijd van de laatste tick in seconden, of None als er nog geen tick is."""
+        tick = self.latest(symbol)
+        if tick is None:
+            return None
+        return time.monotonic() - tick[0]
+
+    def get_fresh_price(self, symbol):
+        """Geeft (bid, ask) terug als de laatste tick niet ouder is dan `max_staleness`."""
+        tick = self.latest(symbol)
+        if tick is None or time.monotonic() - tick[0] > self.max_staleness:
+            return None
+        return (tick[2], tick[3])
+
+class AccountSnapshot:
+    """Periodieke momentopname van het account en de open posities.
+
+    Wordt door `MT5Scheduler` ververst, zodat sizing en positiebeheer niet
+    bij ieder signaal `account_info()` en `positions_get()` hoeven aan te
+    roepen. De posities zijn geindexeerd op symbool, op order comment (ons
+    ref nummer, bijvoorbeeld `GTMO#3416.2_2`), op signaal (het ref nummer
+    zonder het leg nummer) en op magic number. Een snapshot wordt alleen
+    gebruikt zolang hij niet ouder is dan `max_staleness` seconden.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, mt5=None, max_staleness=2.0):
+        self.mt5 = mt5
+        self.max_staleness = max_staleness
+        self.account = None
+        self.positions = ()
+        self.by_symbol = {}
+        self.by_comment = {}
+        self.by_signal = {}
+        self.by_magic = {}
+        self.refreshed = None
+
+    @staticmethod
+    def get_snapshot(mt5, max_staleness=None):
+        with AccountSnapshot._lock:
+            if AccountSnapshot._instance is None or AccountSnapshot._instance.mt5 is not mt5:
+                AccountSnapshot._instance = AccountSnapshot(mt5)
+            if max_staleness is not None:
+                AccountSnapshot._instance.max_staleness = max_staleness
+            return AccountSnapshot._instance
+
+    @staticmethod
+    def signal_ref(comment):
+        # 'GTMO#3416.2_2' hoort bij signaal 'GTMO#3416.2'
+        base, _, leg = comment.rpartition('_')
+        return base if base and leg.isdigit() else comment
+
+    @staticmethod
+    def leg_number(comment):
+        """Het leg nummer uit een order comment ('GTMO#3416.2_2' -> 2), of None."""
+        base, _, leg = comment.rpartition('_')
+        return int(leg) if base and leg.isdigit() else None
+
+    def update(self, account, positions):
+        """Vervangt de snapshot in een keer; lezers zien de oude of de nieuwe indexen."""
+        by_symbol, by_comment, by_signal, by_magic = {}, {}, {}, {}
+        for position in positions:
+            by_symbol.setdefault(position.symbol, []).append(position)
+            by_comment.setdefault(position.comment, []).append(position)
+            by_signal.setdefault(self.signal_ref(position.comment), []).append(position)
+            by_magic.setdefault(position.magic, []).append(position)
+        self.account = account
+        self.positions = tuple(positions)
+        self.by_symbol, self.by_comment, self.by_signal, self.by_magic = by_symbol, by_comment, by_signal, by_magic
+        self.refreshed = time.monotonic()
+
+    def refresh(self):
+        """Haalt het account en de posities op (blokkerend, via de MT5 thread aanroepen)."""
+        account = self.mt5.account_info()
+        positions = self.mt5.positions_get()
+        if account is None or positions is None:
+            logger.warning("Could not refresh the account snapshot: %s", self.mt5.last_error())
+            return False
+        self.update(account, positions)
+        return True
+
+    def invalidate(self):
+        """Markeert de snapshot als verouderd, bijvoorbeeld na het aanpassen van posities."""
+        self.refreshed = None
+
+    def age(self):
+        """Leeftijd van de snapshot in seconden, of None als er nog geen snapshot is."""
+        if self.refreshed is None:
+            return None
+        return time.monotonic() - self.refreshed
+
+    def is_fresh(self):
+        age = self.age()
+        return age is not None and age <= self.max_staleness
+
+    def positions_for_symbol(self, symbol):
+        return self.by_symbol.get(symbol, [])
+
+    def positions_for_comment(self, comment):
+        return self.by_comment.get(comment, [])
+
+    def positions_for_signal(self, ref_number):
+        return self.by_signal.get(ref_number, [])
+
+    def positions_for_magic(self, magic):
+        return self.by_magic.get(magic, [])
+
 class MT5Handler:
+    # De MT5 API ondersteunt maar een terminal per proces; alle blokkerende
+    # calls vanuit de event loop lopen daarom via een en dezelfde thread.
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mt5')
 
-    def __init__(self, mt5):
+    def __init__(self, mt5, spec_cache=None, tick_store=None, account_snapshot=None):
         # self.connection = MT5Connection.get_instance()  # Haal de singleton verbinding op
         self.mt5 = mt5
+        self.specCache = spec_cache or SymbolSpecCache.get_cache(mt5)
+        self.tickStore = tick_store or TickStore.get_store()
+        self.accountSnapshot = account_snapshot or AccountSnapshot.get_snapshot(mt5)
+
+    async def run(self, func, *args, **kwargs):
+        """Voert een blokkerende MT5 call uit zonder de event loop te blokkeren."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
 
     def get_account_info(self):
+        # eerst de snapshot van de scheduler, alleen als die te oud is naar de terminal
+        if self.accountSnapshot.is_fresh():
+            return self.accountSnapshot.account
         accountInfo = self.mt5.account_info()
         return accountInfo
 
     def get_open_positions(self):
+        if self.accountSnapshot.is_fresh():
+            return len(self.accountSnapshot.positions)
         nrOpenPositions = self.mt5.positions_total()
         return nrOpenPositions
 
+    def get_positions(self, symbol=None, ref_number=None, magic=None):
+        """Open posities, eventueel van een symbool, een magic number of alle legs van een signaal."""
+        if not self.accountSnapshot.is_fresh():
+            self.accountSnapshot.refresh()
+        if ref_number is not None:
+            return list(self.accountSnapshot.positions_for_signal(ref_number))
+        if symbol is not None:
+            return list(self.accountSnapshot.positions_for_symbol(symbol))
+        if magic is not None:
+            return list(self.accountSnapshot.positions_for_magic(magic))
+        return list(self.accountSnapshot.positions)
+
+    def get_exposure_positions(self, positions=None):
+        """Open posities als (ticket, symbool, risico in EUR) voor `ExposureBook.reconcile`."""
+        if positions is None:
+            positions = self.mt5.positions_get()
+        if positions is None:
+            logger.warning("Could not retrieve positions: %s", self.mt5.last_error())
+            return None
+        exposure = []
+        for position in positions:
+            quoteCurrency = position.symbol[-3:]
+            if quoteCurrency == 'EUR':
+                eurRate = 1.0
+            else:
+                prices = self.get_price('EUR' + quoteCurrency)
+                eurRate = prices[1] if prices else None
+            exposure.append((position.ticket, position.symbol, ExposureBook.position_risk(
+                position.volume, self.get_contract_size(position.symbol), position.price_open, position.sl, eurRate
+            )))
+        return exposure
+
+    def get_symbol_spec(self, symbol):
+        return self.specCache.get(symbol)
+
     def get_digts(self, symbol):
-        nr_digits = self.mt5.symbol_info(symbol).digits
+        nr_digits = self.get_symbol_spec(symbol).digits
         return nr_digits
 
     def get_contract_size(self, symbol):
-        trade_contract_size = self.mt5.symbol_info(symbol).trade_contract_size
+        trade_contract_size = self.get_symbol_spec(symbol).contract_size
         return trade_contract_size
 
     def get_minimal_volume_size(self, symbol):
-        min_volume_size = self.mt5.symbol_info(symbol).volume_min
+        min_volume_size = self.get_symbol_spec(symbol).volume_min
         return min_volume_size
 
     def get_price(self, symbol):
+        # eerst de tick feed proberen, alleen bij een verouderde tick live ophalen
+        price = self.tickStore.get_fresh_price(symbol)
+        if price is not None:
+            return price
+
         tick_info = self.mt5.symbol_info_tick(symbol)
         if tick_info is None:
             return None
+        self.tickStore.put(symbol, tick_info.bid, tick_info.ask, tick_info.time_msc / 1000)
         return (tick_info.bid, tick_info.ask)
 
     def place_trade_order(self, symbol, entry_price, stop_loss, target_profit, volume, trade_direction, trade_ref_number):
@@ -83,45 +416,104 @@ class MT5Handler:
             "type_filling": self.mt5.ORDER_FILLING_IOC
         }
 
-        result = self.mt5.order_send(order)
-        logger.info(self.mt5.last_error())
+        result = self.send_order('deal', order)
+        logger.info('%s', self.mt5.last_error())
 
-        if result.retcode != mt5.TRADE_RETCODE_DONE:
-            logger.info(f"Order failed, retcode={result}, last error:\n{self.mt5.last_error()}")
+        if result.retcode != self.mt5.TRADE_RETCODE_DONE:
+            logger.info("Order failed, retcode=%s, last error:\n%s", result, self.mt5.last_error(),
+                        extra={'ref': trade_ref_number, 'stage': 'order_send'})
             return
         else:
-            logger.info(f'Trade was placed successfully:\n{result}')
+            logger.info('Trade was placed successfully:\n%s', result, extra={'ref': trade_ref_number, 'stage': 'order_send'})
             return result
 
+    def send_order(self, action, request):
+        """`order_send` met de duur en de retcode in de metrics."""
+        started = time.perf_counter()
+        result = self.mt5.order_send(request)
+        ORDER_SEND_SECONDS.observe(time.perf_counter() - started, action)
+        ORDER_SEND_RESULTS.inc(action, 'none' if result is None else result.retcode)
+        return result
+
+    def modify_position(self, position, stop_loss, take_profit):
+        """Past de SL en TP van een open positie aan; geeft het order result terug (of None)."""
+        digits = self.get_digts(position.symbol)
+        request = {
+            "action": self.mt5.TRADE_ACTION_SLTP,
+            "position": position.ticket,
+            "symbol": position.symbol,
+            "sl": round(stop_loss, digits),
+            "tp": round(take_profit, digits) if take_profit else 0.0,
+            "magic": position.magic,
+            "comment": position.comment
+        }
+
+        result = self.send_order('sltp', request)
+        if result is None:
+            logger.info("Modification of %s failed, last error: %s", position.comment, self.mt5.last_error(),
+                        extra={'ref': position.comment, 'stage': 'modify'})
+        return result
+
     def shutdown(self):
         self.mt5.shutdown()
 
 class MT5Scheduler:
-    def __init__(self, mt5, interval=300):
+    """Tick poller die de laatste prijzen van een set symbolen in de TickStore bijhoudt."""
+
+    def __init__(self, mt5, interval=0.5, symbols=None, tick_store=None, exposure_book=None, reconcile_interval=30.0,
+                 account_snapshot=None, snapshot_interval=1.0):
         self.mt5 = mt5  # Verwijzing naar de MT5-terminal
         self.interval = interval  # Interval in seconden
         self.is_running = True  # Vlag om de loop te controleren
+        self.tickStore = tick_store or TickStore.get_store()
+        for symbol in symbols or []:
+            self.tickStore.add_symbol(symbol)
+        # account en posities worden iedere snapshot_interval seconden ververst
+        self.accountSnapshot = account_snapshot or AccountSnapshot.get_snapshot(mt5)
+        self.snapshotInterval = snapshot_interval
+        self.lastSnapshot = None
+        # de exposure book wordt zo nu en dan gelijkgetrokken met de posities van de broker
+        self.exposureBook = exposure_book or ExposureBook.get_book()
+        self.reconcileInterval = reconcile_interval
+        self.lastReconcile = None
+
+    def is_due(self, last, interval):
+        return last is None or time.monotonic() - last >= interval
 
     async def fetch_data(self):
+        loop = asyncio.get_running_loop()
         while self.is_running:
-            logger.info('Running inside the fetch_data function. Do stuff here like retrieving position information.')
-            """
-            # Hier kun je de logica toevoegen om gegevens op te halen van de MT5-terminal
-            price = self.get_price()  # Voorbeeldfunctie om de prijs op te halen
-            logger.info(f"Opgehaalde prijs: {price}")
-
-            # Controleer of het bijna het einde van de handelsdag of week is
-            if self.is_near_end_of_trading_day():
-                logger.info("Bijna einde van de handelsdag!")
-            if self.is_near_end_of_trading_week():
-                logger.info("Bijna einde van de handelsweek!")
-            """
+            try:
+                # de blokkerende MT5 calls lopen via de MT5 thread van de handler
+                await loop.run_in_executor(MT5Handler.executor, self.poll_ticks)
+                if self.is_due(self.lastSnapshot, self.snapshotInterval):
+                    self.lastSnapshot = time.monotonic()
+                    await self.refresh_snapshot()
+            except Exception as e:
+                logger.warning("Error while polling ticks: %s", e)
             await asyncio.sleep(self.interval)
 
-    def get_price(self):
-        # Voeg hier de logica toe om de prijs op te halen van de MT5-terminal
-        # Dit is een placeholder
-        return self.mt5.get_last_price()  # Voorbeeldfunctie
+    async def refresh_snapshot(self):
+        started = time.time()
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(MT5Handler.executor, self.accountSnapshot.refresh):
+            return
+        # de exposure book gebruikt dezelfde posities, zonder extra call naar de terminal
+        if self.is_due(self.lastReconcile, self.reconcileInterval):
+            self.lastReconcile = time.monotonic()
+            handler = MT5Handler(self.mt5, tick_store=self.tickStore, account_snapshot=self.accountSnapshot)
+            positions = await handler.run(handler.get_exposure_positions, self.accountSnapshot.positions)
+            if positions is not None:
+                self.exposureBook.reconcile(positions, started)
+
+    def poll_ticks(self):
+        for symbol in self.tickStore.symbols():
+            tick = self.mt5.symbol_info_tick(symbol)
+            if tick is not None:
+                self.tickStore.put(symbol, tick.bid, tick.ask, tick.time_msc / 1000)
+
+    def get_price(self, symbol):
+        return self.tickStore.get_fresh_price(symbol)
 
     def is_near_end_of_trading_day(self):
         # Voeg hier de logica toe om te controleren of het bijna het einde van de handelsdag is
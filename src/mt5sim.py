@@ -0,0 +1,503 @@
+import random
+import time
+from collections import namedtuple
+import logger_setup
+
+logger = logger_setup.LoggerSingleton.get_logger()
+
+# Constanten met dezelfde waarden als in de MetaTrader5 package
+TRADE_ACTION_DEAL = 1
+TRADE_ACTION_SLTP = 6
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+ORDER_TIME_GTC = 0
+ORDER_FILLING_FOK = 0
+ORDER_FILLING_IOC = 1
+POSITION_TYPE_BUY = 0
+POSITION_TYPE_SELL = 1
+TRADE_RETCODE_REQUOTE = 10004
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_INVALID_VOLUME = 10014
+TRADE_RETCODE_INVALID_STOPS = 10016
+TRADE_RETCODE_NO_MONEY = 10019
+TRADE_RETCODE_PRICE_OFF = 10021
+TRADE_RETCODE_POSITION_CLOSED = 10036
+RES_S_OK = 1
+RES_E_NOT_FOUND = -1
+RES_E_AUTH_FAILED = -6
+RES_E_NO_IPC = -10004
+
+SymbolInfo = namedtuple('SymbolInfo', [
+    'name', 'digits', 'point', 'trade_contract_size', 'volume_min', 'volume_step',
+    'volume_max', 'trade_stops_level', 'currency_base', 'currency_profit', 'bid', 'ask'
+])
+Tick = namedtuple('Tick', ['time', 'bid', 'ask', 'last', 'volume', 'time_msc', 'flags', 'volume_real'])
+AccountInfo = namedtuple('AccountInfo', [
+    'login', 'balance', 'equity', 'profit', 'margin', 'margin_free', 'leverage', 'currency', 'server'
+])
+TradeRequest = namedtuple('TradeRequest', [
+    'action', 'magic', 'order', 'symbol', 'volume', 'price', 'stoplimit', 'sl', 'tp', 'deviation',
+    'type', 'type_filling', 'type_time', 'expiration', 'comment', 'position', 'position_by'
+])
+OrderSendResult = namedtuple('OrderSendResult', [
+    'retcode', 'deal', 'order', 'volume', 'price', 'bid', 'ask', 'comment', 'request_id',
+    'retcode_external', 'request'
+])
+TradePosition = namedtuple('TradePosition', [
+    'ticket', 'time', 'time_msc', 'type', 'magic', 'identifier', 'volume', 'price_open', 'sl', 'tp',
+    'price_current', 'swap', 'profit', 'symbol', 'comment'
+])
+ClosedPosition = namedtuple('ClosedPosition', [
+    'ticket', 'symbol', 'comment', 'type', 'volume', 'price_open', 'price_close', 'reason',
+    'time_open', 'time_close', 'profit'
+])
+
+def default_symbol_spec(symbol):
+    """Redelijke standaard specificaties voor forex paren en goud."""
+    if symbol.startswith('XAU'):
+        digits, contract_size = 2, 100
+    elif symbol.endswith('JPY'):
+        digits, contract_size = 3, 100000
+    else:
+        digits, contract_size = 5, 100000
+    return {
+        'digits': digits, 'trade_contract_size': contract_size, 'volume_min': 0.01,
+        'volume_step': 0.01, 'volume_max': 100.0, 'trade_stops_level': 0
+    }
+
+class SimulatedMT5:
+    """In-process gesimuleerde broker met de MT5 API die deze bot gebruikt.
+
+    Prijzen worden met `set_tick` aangeleverd (uit een opgenomen of synthetische
+    tick reeks). Bij iedere tick worden de SL en TP van de open posities van dat
+    symbool gecontroleerd. De account valuta is EUR, winst in de quote valuta
+    wordt via het EURxxx paar omgerekend. Met `configure` en `fail_next_orders`
+    kunnen latency, requotes en andere retcodes worden geinjecteerd.
+    """
+
+    # de constanten ook als attribuut, zoals bij de MetaTrader5 module
+    TRADE_ACTION_DEAL = TRADE_ACTION_DEAL
+    TRADE_ACTION_SLTP = TRADE_ACTION_SLTP
+    ORDER_TYPE_BUY = ORDER_TYPE_BUY
+    ORDER_TYPE_SELL = ORDER_TYPE_SELL
+    ORDER_TIME_GTC = ORDER_TIME_GTC
+    ORDER_FILLING_FOK = ORDER_FILLING_FOK
+    ORDER_FILLING_IOC = ORDER_FILLING_IOC
+    POSITION_TYPE_BUY = POSITION_TYPE_BUY
+    POSITION_TYPE_SELL = POSITION_TYPE_SELL
+    TRADE_RETCODE_REQUOTE = TRADE_RETCODE_REQUOTE
+    TRADE_RETCODE_DONE = TRADE_RETCODE_DONE
+    TRADE_RETCODE_INVALID_VOLUME = TRADE_RETCODE_INVALID_VOLUME
+    TRADE_RETCODE_INVALID_STOPS = TRADE_RETCODE_INVALID_STOPS
+    TRADE_RETCODE_NO_MONEY = TRADE_RETCODE_NO_MONEY
+    TRADE_RETCODE_PRICE_OFF = TRADE_RETCODE_PRICE_OFF
+    TRADE_RETCODE_POSITION_CLOSED = TRADE_RETCODE_POSITION_CLOSED
+
+    def __init__(self, balance=10000.0, symbol_specs=None, login=1, server='Simulated'):
+        self.login_id = login
+        self.server = server
+        self.balance = float(balance)
+        self.symbol_specs = dict(symbol_specs or {})
+        self.ticks = {}
+        self.positions = {}
+        self.positions_by_symbol = {}
+        self.closed_positions = []
+        self.next_ticket = 1
+        self.now = time.time()
+        self.error = (RES_S_OK, 'Success')
+        # eenvoudige callback, bijvoorbeeld voor het vastleggen van SL/TP hits
+        self.on_close = None
+
+        self.initialized = True
+        self.fail_initialize = False
+        self.fail_login = False
+        self.latency = {}
+        self.retcode_rates = {}
+        self.forced_retcodes = []
+        self.call_counts = {}
+        self.retcode_counts = {}
+        self.random = random.Random()
+
+    # tijd en prijzen
+
+    def set_time(self, timestamp):
+        self.now = timestamp
+
+    def set_tick(self, symbol, bid, ask, timestamp=None):
+        if timestamp is not None:
+            self.now = timestamp
+        self.ticks[symbol] = Tick(
+            int(self.now), bid, ask, 0.0, 0, int(self.now * 1000), 0, 0.0
+        )
+        self.check_stops(symbol, bid, ask)
+
+    # latency en failure injectie
+
+    def configure(self, latency=None, requote_rate=None, retcode_rates=None, seed=None):
+        """Stelt de latency en failure injectie in.
+
+        Parameters
+        ----------
+        latency: float, tuple of dict, optional
+            Vertraging per call in seconden. Een float geldt voor alle calls,
+            een (min, max) tuple geeft een uniforme jitter en een dict per
+            functienaam (bijv. {'order_send': (0.02, 0.08)}) overschrijft de
+            waarde voor specifieke calls.
+
+        requote_rate: float, optional
+            Kans dat een order_send met TRADE_RETCODE_REQUOTE wordt geweigerd.
+
+        retcode_rates: dict, optional
+            Kans per retcode, bijv. {TRADE_RETCODE_NO_MONEY: 0.01}.
+        """
+        if latency is not None:
+            self.latency = latency if isinstance(latency, dict) else {'default': latency}
+        if requote_rate is not None:
+            self.retcode_rates[TRADE_RETCODE_REQUOTE] = requote_rate
+        if retcode_rates is not None:
+            self.retcode_rates.update(retcode_rates)
+        if seed is not None:
+            self.random.seed(seed)
+
+    def fail_next_orders(self, retcode, count=1):
+        """Laat de volgende `count` order_send calls met `retcode` mislukken."""
+        self.forced_retcodes.extend([retcode] * count)
+
+    def delay(self, name):
+        latency = self.latency.get(name, self.latency.get('default', 0))
+        if isinstance(latency, (tuple, list)):
+            latency = self.random.uniform(*latency)
+        if latency > 0:
+            time.sleep(latency)
+        self.call_counts[name] = self.call_counts.get(name, 0) + 1
+
+    def injected_retcode(self):
+        if self.forced_retcodes:
+            return self.forced_retcodes.pop(0)
+        for retcode, rate in self.retcode_rates.items():
+            if rate and self.random.random() < rate:
+                return retcode
+        return None
+
+    def connected(self, name):
+        self.delay(name)
+        if not self.initialized:
+            self.error = (RES_E_NO_IPC, 'No IPC connection')
+            return False
+        return True
+
+    # MT5 API
+
+    def initialize(self, *args, **kwargs):
+        self.delay('initialize')
+        if self.fail_initialize:
+            self.error = (RES_E_NO_IPC, 'IPC timeout')
+            return False
+        self.initialized = True
+        self.error = (RES_S_OK, 'Success')
+        return True
+
+    def login(self, login, password=None, server=None, **kwargs):
+        if not self.connected('login'):
+            return False
+        if self.fail_login:
+            self.error = (RES_E_AUTH_FAILED, 'Authorization failed')
+            return False
+        self.login_id = int(login)
+        if server:
+            self.server = server
+        return True
+
+    def shutdown(self):
+        self.initialized = False
+        return True
+
+    def last_error(self):
+        return self.error
+
+    def symbol_select(self, symbol, enable=True):
+        return self.connected('symbol_select')
+
+    def symbol_info(self, symbol):
+        if not self.connected('symbol_info'):
+            return None
+        return self.get_symbol_info(symbol)
+
+    def get_symbol_info(self, symbol):
+        spec = self.symbol_specs.get(symbol) or default_symbol_spec(symbol)
+        tick = self.ticks.get(symbol)
+        return SymbolInfo(
+            name=symbol, digits=spec['digits'], point=10 ** -spec['digits'],
+            trade_contract_size=spec['trade_contract_size'], volume_min=spec['volume_min'],
+            volume_step=spec['volume_step'], volume_max=spec['volume_max'],
+            trade_stops_level=spec['trade_stops_level'], currency_base=symbol[:3],
+            currency_profit=symbol[-3:], bid=tick.bid if tick else 0.0, ask=tick.ask if tick else 0.0
+        )
+
+    def symbol_info_tick(self, symbol):
+        if not self.connected('symbol_info_tick'):
+            return None
+        tick = self.ticks.get(symbol)
+        if tick is None:
+            self.error = (RES_E_NOT_FOUND, f'No ticks for {symbol}')
+        return tick
+
+    def floating_profit(self, position):
+        return self.profit_in_account_currency(
+            position['symbol'], position['type'], position['volume'], position['price_open'],
+            position['price_current'], position['contract_size']
+        )
+
+    def account_info(self):
+        if not self.connected('account_info'):
+            return None
+        # de open winst wordt pas hier berekend, niet bij iedere tick
+        profit = sum(self.floating_profit(position) for position in self.positions.values())
+        return AccountInfo(
+            login=self.login_id, balance=round(self.balance, 2), equity=round(self.balance + profit, 2),
+            profit=round(profit, 2), margin=0.0, margin_free=round(self.balance + profit, 2),
+            leverage=100, currency='EUR', server=self.server
+        )
+
+    def positions_total(self):
+        if not self.connected('positions_total'):
+            return None
+        return len(self.positions)
+
+    def positions_get(self, symbol=None, ticket=None, group=None):
+        if not self.connected('positions_get'):
+            return None
+        if ticket is not None:
+            positions = [self.positions[ticket]] if ticket in self.positions else []
+        elif symbol is not None:
+            positions = [self.positions[t] for t in self.positions_by_symbol.get(symbol, [])]
+        else:
+            positions = list(self.positions.values())
+        return tuple(self.to_trade_position(position) for position in positions)
+
+    def order_send(self, request):
+        if not self.connected('order_send'):
+            return None
+        tradeRequest = self.to_trade_request(request)
+        retcode = self.injected_retcode()
+        if retcode is not None:
+            self.error = (RES_S_OK, 'Success')
+            return self.result(retcode, tradeRequest)
+        if tradeRequest.action == TRADE_ACTION_DEAL:
+            return self.open_position(tradeRequest)
+        if tradeRequest.action == TRADE_ACTION_SLTP:
+            return self.modify_position(tradeRequest)
+        return self.result(TRADE_RETCODE_PRICE_OFF, tradeRequest)
+
+    # interne logica
+
+    def to_trade_request(self, request):
+        fields = {field: 0 for field in TradeRequest._fields}
+        fields.update({'symbol': '', 'comment': ''})
+        fields.update(request)
+        return TradeRequest(**fields)
+
+    def result(self, retcode, request, deal=0, order=0, volume=0.0, price=0.0):
+        self.retcode_counts[retcode] = self.retcode_counts.get(retcode, 0) + 1
+        tick = self.ticks.get(request.symbol)
+        comment = 'Request executed' if retcode == TRADE_RETCODE_DONE else f'Retcode {retcode}'
+        return OrderSendResult(
+            retcode=retcode, deal=deal, order=order, volume=volume, price=price,
+            bid=tick.bid if tick else 0.0, ask=tick.ask if tick else 0.0, comment=comment,
+            request_id=0, retcode_external=0, request=request
+        )
+
+    def open_position(self, request):
+        tick = self.ticks.get(request.symbol)
+        if tick is None:
+            return self.result(TRADE_RETCODE_PRICE_OFF, request)
+        spec = self.get_symbol_info(request.symbol)
+        if request.volume < spec.volume_min or request.volume > spec.volume_max:
+            return self.result(TRADE_RETCODE_INVALID_VOLUME, request)
+        is_buy = request.type == ORDER_TYPE_BUY
+        price = tick.ask if is_buy else tick.bid
+        ticket = self.next_ticket
+        self.next_ticket += 1
+        self.positions[ticket] = {
+            'ticket': ticket, 'time': self.now, 'type': POSITION_TYPE_BUY if is_buy else POSITION_TYPE_SELL,
+            'magic': request.magic, 'volume': request.volume, 'price_open': price, 'sl': request.sl or 0.0,
+            'tp': request.tp or 0.0, 'price_current': price, 'symbol': request.symbol,
+            'comment': request.comment, 'contract_size': spec.trade_contract_size
+        }
+        self.positions_by_symbol.setdefault(request.symbol, []).append(ticket)
+        return self.result(TRADE_RETCODE_DONE, request, deal=ticket, order=ticket, volume=request.volume, price=price)
+
+    def modify_position(self, request):
+        position = self.positions.get(request.position)
+        if position is None:
+            return self.result(TRADE_RETCODE_POSITION_CLOSED, request)
+        position['sl'] = request.sl
+        position['tp'] = request.tp
+        return self.result(TRADE_RETCODE_DONE, request, order=position['ticket'], volume=position['volume'])
+
+    def to_trade_position(self, position):
+        return TradePosition(
+            ticket=position['ticket'], time=int(position['time']), time_msc=int(position['time'] * 1000),
+            type=position['type'], magic=position['magic'], identifier=position['ticket'],
+            volume=position['volume'], price_open=position['price_open'], sl=position['sl'],
+            tp=position['tp'], price_current=position['price_current'], swap=0.0,
+            profit=round(self.floating_profit(position), 2), symbol=position['symbol'], comment=position['comment']
+        )
+
+    def profit_in_account_currency(self, symbol, position_type, volume, price_open, price_close, contract_size):
+        direction = 1 if position_type == POSITION_TYPE_BUY else -1
+        profit = direction * (price_close - price_open) * volume * contract_size
+        quote_currency = symbol[-3:]
+        if quote_currency == 'EUR':
+            return profit
+        conversion = self.ticks.get('EUR' + quote_currency)
+        return profit / conversion.bid if conversion else profit
+
+    def check_stops(self, symbol, bid, ask):
+        tickets = self.positions_by_symbol.get(symbol)
+        if not tickets:
+            return
+        for ticket in list(tickets):
+            position = self.positions[ticket]
+            is_buy = position['type'] == POSITION_TYPE_BUY
+            price = bid if is_buy else ask
+            position['price_current'] = price
+            sl, tp = position['sl'], position['tp']
+            if sl and ((is_buy and price <= sl) or (not is_buy and price >= sl)):
+                self.close_position(ticket, sl, 'sl')
+            elif tp and ((is_buy and price >= tp) or (not is_buy and price <= tp)):
+                self.close_position(ticket, tp, 'tp')
+
+    def close_position(self, ticket, price, reason):
+        position = self.positions.pop(ticket)
+        self.positions_by_symbol[position['symbol']].remove(ticket)
+        position['price_current'] = price
+        profit = self.floating_profit(position)
+        self.balance += profit
+        closed = ClosedPosition(
+            ticket=ticket, symbol=position['symbol'], comment=position['comment'], type=position['type'],
+            volume=position['volume'], price_open=position['price_open'], price_close=price, reason=reason,
+            time_open=position['time'], time_close=self.now, profit=round(profit, 2)
+        )
+        self.closed_positions.append(closed)
+        if self.on_close is not None:
+            self.on_close(closed)
+        return closed
+
+# Drop-in vervanging van de MetaTrader5 module, bijvoorbeeld `import mt5sim as mt5`.
+# Alle functies werken op een gedeelde simulator die met `reset` opnieuw wordt aangemaakt.
+simulator = SimulatedMT5()
+
+def reset(**kwargs):
+    global simulator
+    simulator = SimulatedMT5(**kwargs)
+    return simulator
+
+def configure(**kwargs):
+    simulator.configure(**kwargs)
+
+def set_tick(symbol, bid, ask, timestamp=None):
+    simulator.set_tick(symbol, bid, ask, timestamp)
+
+def initialize(*args, **kwargs):
+    return simulator.initialize(*args, **kwargs)
+
+def login(login, password=None, server=None, **kwargs):
+    return simulator.login(login, password=password, server=server, **kwargs)
+
+def shutdown():
+    return simulator.shutdown()
+
+def last_error():
+    return simulator.last_error()
+
+def symbol_select(symbol, enable=True):
+    return simulator.symbol_select(symbol, enable)
+
+def symbol_info(symbol):
+    return simulator.symbol_info(symbol)
+
+def symbol_info_tick(symbol):
+    return simulator.symbol_info_tick(symbol)
+
+def account_info():
+    return simulator.account_info()
+
+def positions_total():
+    return simulator.positions_total()
+
+def positions_get(symbol=None, ticket=None, group=None):
+    return simulator.positions_get(symbol=symbol, ticket=ticket, group=group)
+
+def order_send(request):
+    return simulator.order_send(request)
+
+if __name__ == '__main__':
+    # Eenvoudige load test van het order pad tegen de simulator
+    import argparse
+    import asyncio
+    import logging
+    import sys
+    from exposure import ExposureBook
+    from mt5handler import MT5Handler, SymbolSpecCache, TickStore
+    from ratelimiter import TokenBucket
+    from strategy import Strategy
+    from tradesignalparser import TradeSignal
+    from tradingbot import ProcessTradeSignal
+
+    parser = argparse.ArgumentParser(description='Load test the order path against the MT5 simulator')
+    parser.add_argument('--signals', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0, help='Latency per MT5 call in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra uniform jitter per call in seconds')
+    parser.add_argument('--requote-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    module = sys.modules[__name__]
+    reset()
+    configure(latency=(args.latency, args.latency + args.jitter), requote_rate=args.requote_rate, seed=args.seed)
+    set_tick('EURUSD', 1.08, 1.08)
+    set_tick('XAUUSD', 3416.0, 3416.2)
+
+    import manage_shelve
+    from signalstore import SignalStore
+    manage_shelve.set_store(SignalStore(':memory:'))
+
+    # een eigen exposure book en geen heat limiet: de load test meet het order pad, niet de heat check
+    processor = ProcessTradeSignal(
+        module, order_limiter=TokenBucket(rate=1e9, capacity=1e9), exposure_book=ExposureBook(),
+        mt5handler=MT5Handler(module, spec_cache=SymbolSpecCache(module), tick_store=TickStore(max_staleness=-1))
+    )
+    strategy = Strategy(0.01, float('inf'), 3, '', True, True, 50)
+    durations = []
+    rejected = 0
+
+    async def run():
+        global rejected
+        for index in range(args.signals):
+            signal = TradeSignal('XAUUSD', 'Buy', 3416.2, 3405.1, [3435.0, 3450.0, 3475.0, 3500.0],
+                                 f'LOAD#{index}', [False] * 4)
+            start = time.perf_counter()
+            orderResults = await processor.start_order_entry_process_async(signal, strategy)
+            if orderResults:
+                durations.append(time.perf_counter() - start)
+            else:
+                rejected += 1
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    if not durations:
+        print(f"All {args.signals} signals were rejected.")
+        sys.exit(1)
+    durations.sort()
+    print(f"{len(durations)} signals placed in {elapsed:.2f}s ({len(durations) / elapsed:.1f} signals/s), "
+          f"{rejected} rejected")
+    print(f"p50 {durations[len(durations) // 2] * 1000:.2f} ms, "
+          f"p95 {durations[int(len(durations) * 0.95)] * 1000:.2f} ms, "
+          f"max {durations[-1] * 1000:.2f} ms per signal")
+    print(f"Calls: {simulator.call_counts}")
+    print(f"Retcodes: {simulator.retcode_counts}")
+    print(f"Open positions: {simulator.positions_total()}")
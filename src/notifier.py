@@ -0,0 +1,130 @@
+import asyncio
+import time
+from collections import deque
+import logger_setup
+from telegram import Bot
+from telegram.error import RetryAfter, TelegramError
+
+logger = logger_setup.LoggerSingleton.get_logger()
+
+class TelegramNotifier:
+    """Langlevende afzender van bot berichten.
+
+    Houdt een enkele `Bot` (en daarmee een HTTP connection pool) open en
+    verstuurt berichten vanuit een asyncio queue, buiten het order pad om.
+    Berichten die binnen `coalesce_window` seconden na elkaar binnenkomen,
+    bijvoorbeeld alle legs van een gesplitste order, worden samengevoegd tot
+    een bericht. Tussen twee verzendingen zit minimaal `min_interval`
+    seconden om binnen de flood limits van de Bot API te blijven.
+    """
+    MAX_MESSAGE_LENGTH = 4096
+
+    def __init__(self, token, chat_id, coalesce_window=0.5, min_interval=1.0, max_queue_size=1000):
+        self.bot = Bot(token=token)
+        self.chat_id = chat_id
+        self.coalesce_window = coalesce_window
+        self.min_interval = min_interval
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        self.send_latencies = deque(maxlen=100)  # seconden per verzonden bericht
+        self.last_sent = 0.0
+        self.sent_count = 0
+        self.dropped_count = 0
+        self.is_running = False
+        self.task = None
+        self.batch = []
+
+    @property
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    @property
+    def last_send_latency(self):
+        return self.send_latencies[-1] if self.send_latencies else None
+
+    def notify(self, message):
+        """Zet een bericht in de wachtrij, blokkeert nooit."""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped_count += 1
+            logger.warning("Notification queue is full, dropping message:\n%s", message)
+
+    async def start(self):
+        if self.task is None:
+            await self.bot.initialize()
+            self.is_running = True
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while self.is_running:
+            self.batch = [await self.queue.get()]
+            # wacht kort op meer berichten zodat een burst als een bericht gaat
+            await asyncio.sleep(self.coalesce_window)
+            await self.send(self.drain(self.batch))
+            self.batch = []
+
+    def drain(self, messages):
+        while True:
+            try:
+                messages.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return messages
+
+    def merge(self, messages):
+        """Voegt berichten samen tot zo min mogelijk berichten binnen de maximale lengte."""
+        merged = []
+        current = ''
+        for message in messages:
+            for start in range(0, max(len(message), 1), self.MAX_MESSAGE_LENGTH):
+                part = message[start:start + self.MAX_MESSAGE_LENGTH]
+                if current and len(current) + 2 + len(part) > self.MAX_MESSAGE_LENGTH:
+                    merged.append(current)
+                    current = part
+                else:
+                    current = f"{current}\n\n{part}" if current else part
+        if current:
+            merged.append(current)
+        return merged
+
+    async def send(self, messages):
+        for text in self.merge(messages):
+            wait = self.min_interval - (time.monotonic() - self.last_sent)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            start = time.monotonic()
+            try:
+                await self.bot.send_message(chat_id=self.chat_id, text=text)
+            except RetryAfter as e:
+                retry_after = getattr(e.retry_after, 'total_seconds', lambda: e.retry_after)()
+                logger.warning("Flood limit reached, retrying bot message in %s seconds.", retry_after)
+                await asyncio.sleep(retry_after)
+                try:
+                    await self.bot.send_message(chat_id=self.chat_id, text=text)
+                except TelegramError as e:
+                    logger.error("Failed to send the bot message: %s", e)
+                    continue
+            except TelegramError as e:
+                logger.error("Failed to send the bot message: %s", e)
+                continue
+            finally:
+                self.last_sent = time.monotonic()
+            self.send_latencies.append(self.last_sent - start)
+            self.sent_count += 1
+            logger.info("Bot message sent successfully in %.0f ms (queue depth: %d).",
+                        self.send_latencies[-1] * 1000, self.queue_depth)
+
+    async def stop(self):
+        """Stopt de zender en verstuurt wat er nog in de wachtrij staat."""
+        self.is_running = False
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        pending = self.drain(self.batch)
+        self.batch = []
+        if pending:
+            await self.send(pending)
+        await self.bot.shutdown()
@@ -0,0 +1,191 @@
+import asyncio
+import time
+import logger_setup
+from tracing import LatencyHistogram
+
+logger = logger_setup.LoggerSingleton.get_logger()
+
+class KeyedGate:
+    """Laat per sleutel (het symbool) een item tegelijk door; verschillende sleutels lopen parallel."""
+
+    def __init__(self):
+        self.locks = {}
+
+    async def acquire(self, key):
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = asyncio.Lock()
+        await lock.acquire()
+
+    def release(self, key):
+        lock = self.locks.get(key)
+        if lock is not None and lock.locked():
+            lock.release()
+
+    def in_flight(self):
+        return sorted(str(key) for key, lock in self.locks.items() if lock.locked())
+
+class PipelineStage:
+    """Een stage van de `SignalPipeline`: een begrensde queue met een of meer workers.
+
+    De handler krijgt een item en geeft het item terug voor de volgende
+    stage, of None als het item de pipeline verlaat. Bij een `gated` stage
+    wacht een item tot er voor zijn sleutel niets anders meer onderweg is;
+    de sleutel blijft bezet totdat het item de pipeline verlaat.
+    """
+
+    def __init__(self, name, handler, workers=1, queue_size=100, gated=False):
+        if workers < 1 or queue_size < 1:
+            raise ValueError(f"Invalid stage {name}: {workers} workers, queue size {queue_size}.")
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.gated = gated
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.queue_time = LatencyHistogram()  # tijd in de queue, inclusief wachten op de gate
+        self.handler_time = LatencyHistogram()
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.blocked = 0  # keren dat een put op een volle queue moest wachten
+        self.max_depth = 0
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def stats(self):
+        return {
+            'depth': self.depth(),
+            'max_depth': self.max_depth,
+            'capacity': self.queue.maxsize,
+            'workers': self.workers,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'blocked': self.blocked,
+            'queued': self.queue_time.summary(),
+            'handler': self.handler_time.summary(),
+        }
+
+class SignalPipeline:
+    """Berichten door opeenvolgende stages met begrensde queues.
+
+    Een volle queue laat de put van de vorige stage wachten, zodat de druk
+    doorloopt tot in `submit` (de Telethon callback) in plaats van dat er
+    ongemerkt een achterstand in het geheugen ontstaat. Met `key` en een
+    gated stage is er per symbool een signaal tegelijk onderweg, terwijl
+    signalen voor verschillende symbolen parallel lopen.
+    """
+
+    def __init__(self, stages, key=None):
+        self.stages = stages
+        self.key = key or (lambda item: None)
+        self.gate = KeyedGate()
+        self.holding = {}  # id(item) -> sleutel die het item bezet houdt
+        self.tasks = []
+
+    @property
+    def running(self):
+        return bool(self.tasks)
+
+    def start(self):
+        if self.tasks:
+            return
+        for position, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                self.tasks.append(asyncio.create_task(self.work(position, stage), name=f'pipeline-{stage.name}-{worker}'))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def submit(self, item):
+        """Zet een item in de eerste queue; wacht als die vol is."""
+        await self.put(self.stages[0], item)
+
+    async def join(self):
+        """Wacht tot alle items de pipeline hebben verlaten."""
+        for stage in self.stages:
+            await stage.queue.join()
+
+    async def put(self, stage, item):
+        if stage.queue.full():
+            stage.blocked += 1
+            logger.warning("Pipeline queue %s is full (%d), waiting.", stage.name, stage.queue.maxsize)
+        await stage.queue.put((item, time.perf_counter()))
+        stage.max_depth = max(stage.max_depth, stage.depth())
+
+    def leave(self, item):
+        if id(item) in self.holding:
+            self.gate.release(self.holding.pop(id(item)))
+
+    async def work(self, position, stage):
+        nextStage = self.stages[position + 1] if position + 1 < len(self.stages) else None
+        while True:
+            item, queued = await stage.queue.get()
+            try:
+                if stage.gated and id(item) not in self.holding:
+                    key = self.key(item)
+                    await self.gate.acquire(key)
+                    self.holding[id(item)] = key
+                stage.queue_time.record(time.perf_counter() - queued)
+
+                started = time.perf_counter()
+                try:
+                    result = await stage.handler(item)
+                except Exception as e:
+                    stage.failed += 1
+                    logger.error("Pipeline stage %s failed: %s", stage.name, e)
+                    self.leave(item)
+                    continue
+                finally:
+                    stage.handler_time.record(time.perf_counter() - started)
+                stage.processed += 1
+
+                if result is None:
+                    stage.dropped += 1
+                if result is None or nextStage is None:
+                    self.leave(item)
+                    continue
+                if result is not item and id(item) in self.holding:
+                    self.holding[id(result)] = self.holding.pop(id(item))
+                await self.put(nextStage, result)
+            finally:
+                stage.queue.task_done()
+
+    def stats(self):
+        return {
+            'stages': {stage.name: stage.stats() for stage in self.stages},
+            'in_flight': self.gate.in_flight(),
+        }
+
+    def log_stats(self):
+        logger.info("Signal pipeline: %s", ', '.join(
+            f"{stage.name} depth {stage.depth()}/{stage.queue.maxsize} (max {stage.max_depth}), "
+            f"{stage.processed} done, {stage.failed} failed, "
+            f"p95 {stage.handler_time.summary().get('p95_ms', 0)} ms"
+            for stage in self.stages
+        ))
+
+class SignalJob:
+    """Een bericht onderweg door de pipeline van de `ChannelMonitor`.
+
+    De parse stage vult `kind` ('signal' of 'stop_loss_update'; een edit
+    komt al als 'edit' binnen), het signaal en `key`, het symbool waarop de
+    job in de gated stages wacht. De sizing stage zet de `OrderPlan` klaar
+    voor de execution stage.
+    """
+
+    def __init__(self, event, trace=None, kind=None):
+        self.event = event
+        self.trace = trace
+        self.parser = None
+        self.message = None
+        self.kind = kind
+        self.diff = None
+        self.tradeSignal = None
+        self.ref_number = None
+        self.key = None
+        self.plan = None
@@ -0,0 +1,94 @@
+from collections import OrderedDict
+import logger_setup
+import manage_shelve
+
+logger = logger_setup.LoggerSingleton.get_logger()
+
+class ProcessedMessageIndex:
+    """Index van verwerkte berichten zodat een signaal nooit twee keer wordt uitgevoerd.
+
+    `catch_up()` en reconnects kunnen hetzelfde NewMessage event opnieuw
+    afleveren. De sleutel is (chat id, message id), de waarde het ref nummer
+    van het signaal.
+
+    De controle op het hot path is O(1): eerst de begrensde LRU in het
+    geheugen, dan het hoogste verwerkte message id per channel. Telegram
+    message ids lopen per channel op, dus een id boven dat high-water mark
+    is altijd nieuw. Alleen een oud id dat niet (meer) in de LRU staat
+    wordt in de SQLite store opgezocht. Daardoor blijft de index ook na een
+    herstart geldig.
+
+    Daarnaast wordt per channel het laatst geziene message id bijgehouden,
+    ook van berichten die geen signaal zijn. Vanaf dat punt worden na een
+    (her)start of reconnect de gemiste berichten opgehaald.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.recent = OrderedDict()  # (chat id, message id) -> ref nummer
+        self.high_water_marks = {}
+        self.last_seen = {}  # chat id -> laatst gezien message id
+        self.duplicates = 0
+
+    def load(self):
+        """Vult de LRU en de high-water marks vanuit de store, bij het opstarten."""
+        self.high_water_marks = manage_shelve.get_processed_high_water_marks()
+        # load draait ook bij iedere reconnect; een positie die nog in de writer staat blijft staan
+        for chat_id, message_id in manage_shelve.get_channel_positions().items():
+            self.last_seen[chat_id] = max(message_id, self.last_seen.get(chat_id, 0))
+        for chat_id, message_id, ref_number in manage_shelve.get_recent_processed(self.capacity):
+            self.remember(chat_id, message_id, ref_number)
+        logger.info("Processed message index loaded: %d recent messages, %d channels.",
+                    len(self.recent), len(self.high_water_marks))
+
+    def remember(self, chat_id, message_id, ref_number):
+        key = (chat_id, message_id)
+        self.recent[key] = ref_number
+        self.recent.move_to_end(key)
+        if len(self.recent) > self.capacity:
+            self.recent.popitem(last=False)
+        if message_id > self.high_water_marks.get(chat_id, 0):
+            self.high_water_marks[chat_id] = message_id
+
+    def mark_seen(self, chat_id, message_id):
+        """Legt het laatst geziene bericht van een channel vast (alleen als het nieuwer is)."""
+        if message_id > self.last_seen.get(chat_id, 0):
+            self.last_seen[chat_id] = message_id
+            manage_shelve.store_channel_position(chat_id, message_id)
+
+    def resume_from(self, chat_id):
+        """Het message id waarna berichten gemist kunnen zijn, of None voor een onbekend channel."""
+        return max(self.last_seen.get(chat_id, 0), self.high_water_marks.get(chat_id, 0)) or None
+
+    def get(self, chat_id, message_id):
+        """Geeft het ref nummer als het bericht al verwerkt is, anders None."""
+        key = (chat_id, message_id)
+        if key in self.recent:
+            self.recent.move_to_end(key)
+            return self.recent[key]
+        if message_id > self.high_water_marks.get(chat_id, 0):
+            return None
+        return manage_shelve.get_processed(chat_id, message_id)
+
+    def latest_ref(self, chat_id):
+        """Ref nummer van het laatst verwerkte signaal in een channel, of None."""
+        for (chat, _), ref_number in reversed(self.recent.items()):
+            if chat == chat_id and ref_number:
+                return ref_number
+        return None
+
+    def is_processed(self, chat_id, message_id):
+        return self.get(chat_id, message_id) is not None
+
+    def claim(self, chat_id, message_id, ref_number):
+        """Markeert een bericht als verwerkt. Geeft False als het al verwerkt was.
+
+        Wordt aangeroepen voordat de orders worden geplaatst: liever een gemist
+        signaal na een crash dan dubbele orders.
+        """
+        if self.is_processed(chat_id, message_id):
+            self.duplicates += 1
+            return False
+        self.remember(chat_id, message_id, ref_number or '')
+        manage_shelve.mark_processed(chat_id, message_id, ref_number)
+        return True
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Token bucket die de order-flow naar de broker begrenst.
+
+    De bucket mag tijdelijk negatief worden: iedere aanvraag reserveert
+    direct een token en krijgt de wachttijd terug tot dat token beschikbaar
+    is. Daardoor is de volgorde FIFO en is er geen lock nodig, zolang
+    `reserve` zonder await tussendoor wordt aangeroepen (asyncio is single
+    threaded). De bucket is niet aan een specifieke event loop gebonden.
+
+    Parameters
+    ----------
+    rate: float
+        Aantal tokens (orders) dat per seconde wordt bijgevuld.
+
+    capacity: int
+        Maximale burst. Met capacity=1 gaat de eerste order direct weg en
+        worden volgende orders op 1/rate seconden van elkaar gezet.
+    """
+
+    def __init__(self, rate=2.5, capacity=1):
+        if rate <= 0:
+            raise ValueError(f"Invalid rate: {rate}. Must be positive.")
+        if capacity < 1:
+            raise ValueError(f"Invalid capacity: {capacity}. Must be at least 1.")
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.last_refill
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.last_refill = now
+
+    def reserve(self) -> float:
+        """Reserveert een token en geeft de benodigde wachttijd in seconden terug."""
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    async def acquire(self) -> float:
+        """Wacht (zonder de event loop te blokkeren) tot er een token is.
+
+        Returns
+        -------
+        float
+            De tijd in seconden die de aanvraag in de wachtrij heeft gestaan.
+        """
+        start = time.monotonic()
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return time.monotonic() - start
+
+
+class OrderRateLimiter:
+    """Gedeelde token bucket voor alle signalen en alle channels."""
+    _instance = None
+
+    @staticmethod
+    def configure(rate=2.5, capacity=1):
+        OrderRateLimiter._instance = TokenBucket(rate, capacity)
+        return OrderRateLimiter._instance
+
+    @staticmethod
+    def get_limiter():
+        if OrderRateLimiter._instance is None:
+            OrderRateLimiter._instance = TokenBucket()
+        return OrderRateLimiter._instance
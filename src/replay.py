@@ -0,0 +1,305 @@
+"""Offline replay/backtest van geexporteerde channel geschiedenis.
+
+Gebruik:
+    python src/replay.py --messages history.jsonl --ticks ticks.csv
+    python src/replay.py --messages history.jsonl --synthetic
+
+Het berichtenbestand is JSONL met per regel een bericht:
+    {"timestamp": "2025-01-02T09:15:00+00:00", "chat_id": -1001234, "message_id": 42,
+     "text": "...", "edits": [{"timestamp": ..., "text": "..."}]}
+
+Het tick bestand is een CSV (time,symbol,bid,ask) of JSONL met dezelfde velden.
+Beide bestanden worden gestreamd en moeten op tijd gesorteerd zijn. De
+signalen lopen door dezelfde parsers, PositionSize en ProcessTradeSignal als
+in productie, maar tegen een gesimuleerde broker per strategie. Een edit
+met een andere SL of andere TP's wordt net als in productie op de open
+legs toegepast.
+"""
+import argparse
+import asyncio
+import copy
+import csv
+import heapq
+import json
+import logging
+import random
+from datetime import datetime
+import logger_setup
+import manage_shelve
+from mt5handler import AccountSnapshot, MT5Handler, SymbolSpecCache, TickStore
+from mt5sim import SimulatedMT5
+from exposure import ExposureBook
+from ratelimiter import TokenBucket
+from signaldiff import SignalDiff
+from signalstore import SignalStore
+from strategy import Strategy
+from tradesignalparser import ParserRegistry
+from tradingbot import ProcessTradeSignal
+
+logger = logger_setup.LoggerSingleton.get_logger()
+
+# EURxxx koersen voor de synthetische modus, nodig voor de positiegrootte
+DEFAULT_EUR_RATES = {
+    'EURUSD': 1.08, 'EURGBP': 0.85, 'EURJPY': 160.0, 'EURCAD': 1.47,
+    'EURAUD': 1.65, 'EURNZD': 1.80, 'EURCHF': 0.95
+}
+
+# bij gelijke tijd eerst de ticks, dan berichten, dan edits
+TICK, MESSAGE, EDIT = 0, 1, 2
+
+def parse_timestamp(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+def iter_messages(path):
+    """Streamt berichten en hun edits in tijdsvolgorde.
+
+    Edits worden in een kleine heap vastgehouden totdat hun tijdstip aan de
+    beurt is, zodat alleen de openstaande edits in het geheugen staan.
+    """
+    pending_edits = []
+    with open(path, 'r') as messages_file:
+        for line in messages_file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            timestamp = parse_timestamp(record['timestamp'])
+            while pending_edits and pending_edits[0][0] < timestamp:
+                yield heapq.heappop(pending_edits)
+            yield (timestamp, MESSAGE, record['chat_id'], record.get('message_id', 0), record['text'])
+            for edit in record.get('edits', []):
+                heapq.heappush(pending_edits, (
+                    parse_timestamp(edit['timestamp']), EDIT, record['chat_id'],
+                    record.get('message_id', 0), edit['text']
+                ))
+    while pending_edits:
+        yield heapq.heappop(pending_edits)
+
+def iter_ticks(path):
+    with open(path, 'r') as ticks_file:
+        if path.endswith('.csv'):
+            for row in csv.DictReader(ticks_file):
+                yield (parse_timestamp(row['time']), TICK, row['symbol'], float(row['bid']), float(row['ask']))
+        else:
+            for line in ticks_file:
+                if line.strip():
+                    row = json.loads(line)
+                    yield (parse_timestamp(row['time']), TICK, row['symbol'], float(row['bid']), float(row['ask']))
+
+class StrategyRun:
+    """Een strategie met een eigen gesimuleerde broker en resultaten."""
+
+    def __init__(self, name, strategy, balance):
+        self.name = name
+        self.strategy = strategy
+        self.broker = SimulatedMT5(balance=balance)
+        self.broker.on_close = self.record_close
+        # zonder rate limiter, met een tick store en account snapshot die altijd de broker vragen
+        # en een eigen exposure book
+        self.exposureBook = ExposureBook()
+        self.processor = ProcessTradeSignal(
+            self.broker,
+            order_limiter=TokenBucket(rate=1e9, capacity=1e9),
+            mt5handler=MT5Handler(
+                self.broker, spec_cache=SymbolSpecCache(self.broker), tick_store=TickStore(max_staleness=-1),
+                account_snapshot=AccountSnapshot(self.broker, max_staleness=-1)
+            ),
+            exposure_book=self.exposureBook
+        )
+        self.legs = {}  # order comment -> (signal ref, leg nummer)
+        self.signals = 0
+        self.fills = []
+        self.hits = []
+        self.output = None
+
+    def write(self, record):
+        if self.output is not None:
+            self.output.write(json.dumps(record) + '\n')
+
+    async def trade(self, tradeSignal, timestamp):
+        self.signals += 1
+        signalRef = tradeSignal.ref_number
+        orderResults = await self.processor.start_order_entry_process_async(copy.copy(tradeSignal), self.strategy)
+        for index, result in enumerate(orderResults or []):
+            self.legs[result.request.comment] = (signalRef, index + 1)
+            fill = {
+                'type': 'fill', 'strategy': self.name, 'time': timestamp, 'ref': signalRef,
+                'leg': index + 1, 'symbol': result.request.symbol, 'direction': tradeSignal.tradeDirection,
+                'volume': result.volume, 'price': result.price, 'sl': result.request.sl, 'tp': result.request.tp
+            }
+            self.fills.append(fill)
+            self.write(fill)
+
+    def record_close(self, closed):
+        self.exposureBook.remove(closed.ticket)
+        signalRef, leg = self.legs.get(closed.comment, (closed.comment, 1))
+        hit = {
+            'type': 'hit', 'strategy': self.name, 'time': closed.time_close, 'ref': signalRef, 'leg': leg,
+            'hit': f'TP{leg}' if closed.reason == 'tp' else 'SL', 'price': closed.price_close,
+            'profit': closed.profit
+        }
+        self.hits.append(hit)
+        self.write(hit)
+
+    def summary(self):
+        account = self.broker.account_info()
+        profits = [hit['profit'] for hit in self.hits]
+        return {
+            'type': 'summary', 'strategy': self.name, 'signals': self.signals, 'fills': len(self.fills),
+            'closed': len(self.hits), 'open': self.broker.positions_total(),
+            'wins': sum(1 for profit in profits if profit > 0),
+            'losses': sum(1 for profit in profits if profit <= 0),
+            'realized_pnl': round(sum(profits), 2), 'balance': account.balance, 'equity': account.equity
+        }
+
+class ReplayEngine:
+    """Stuurt berichten en ticks in tijdsvolgorde door de trading pipeline."""
+
+    def __init__(self, channels, strategies, balance=10000.0, synthetic=False, synthetic_steps=2000,
+                 spread=0.0, seed=None):
+        self.parsers = ParserRegistry(channels)
+        self.runs = [StrategyRun(name, strategy, balance) for name, strategy in strategies.items()]
+        self.synthetic = synthetic
+        self.synthetic_steps = synthetic_steps
+        self.spread = spread
+        self.random = random.Random(seed)
+        self.counters = {'messages': 0, 'edits': 0, 'edits_applied': 0, 'ticks': 0, 'signals': 0, 'irrelevant': 0}
+
+    def set_tick(self, symbol, bid, ask, timestamp):
+        for run in self.runs:
+            run.broker.set_tick(symbol, bid, ask, timestamp)
+
+    async def run(self, messages, ticks=()):
+        for event in heapq.merge(messages, ticks):
+            timestamp, kind = event[0], event[1]
+            if kind == TICK:
+                self.counters['ticks'] += 1
+                self.set_tick(event[2], event[3], event[4], timestamp)
+            elif kind == MESSAGE:
+                self.counters['messages'] += 1
+                await self.handle_message(timestamp, event[2], event[4], event[3])
+            else:
+                self.counters['edits'] += 1
+                await self.handle_edit(timestamp, event[2], event[3], event[4])
+
+    async def handle_message(self, timestamp, chat_id, text, message_id=0):
+        try:
+            parser = self.parsers.get(chat_id)
+        except ValueError:
+            self.counters['irrelevant'] += 1
+            return
+        try:
+            tradeSignal = parser.parse_trade_signal(parser.clean_message(text))
+        except ValueError:
+            self.counters['irrelevant'] += 1
+            return
+
+        self.counters['signals'] += 1
+        # de referentie voor edits, net als in productie
+        manage_shelve.store_signal(chat_id, message_id, tradeSignal)
+        if self.synthetic:
+            self.seed_prices(tradeSignal, timestamp)
+        for run in self.runs:
+            run.broker.set_time(timestamp)
+            await run.trade(tradeSignal, timestamp)
+        if self.synthetic:
+            self.simulate_path(tradeSignal, timestamp)
+
+    async def handle_edit(self, timestamp, chat_id, message_id, text):
+        """Past een gewijzigde SL of TP toe op de open legs van het signaal, zoals `apply_signal_edit`."""
+        stored = manage_shelve.get_signal(chat_id, message_id)
+        if stored is None:
+            return
+        parser = self.parsers.get(chat_id)
+        try:
+            edited = parser.parse_trade_signal(parser.clean_message(text))
+        except ValueError:
+            return
+        diff = SignalDiff(stored, edited)
+        if not diff.can_apply():
+            return
+
+        self.counters['edits_applied'] += 1
+        edited.ref_number = diff.ref_number
+        manage_shelve.store_signal(chat_id, message_id, edited)
+        for run in self.runs:
+            run.broker.set_time(timestamp)
+            summary = await run.processor.adjust_positions(
+                diff.ref_number, stop_loss=diff.new_stop_loss, take_profits=diff.new_target_profits, retry_delay=0
+            )
+            run.write({
+                'type': 'edit', 'strategy': run.name, 'time': timestamp, 'ref': diff.ref_number,
+                'sl': diff.new_stop_loss, 'tp': diff.new_target_profits,
+                'legs': summary['legs'], 'modified': summary['modified']
+            })
+
+    def seed_prices(self, tradeSignal, timestamp):
+        openPrice = float(tradeSignal.open_price)
+        self.set_tick(tradeSignal.forexSymbol, openPrice, openPrice + self.spread, timestamp)
+        for symbol, rate in DEFAULT_EUR_RATES.items():
+            self.set_tick(symbol, rate, rate, timestamp)
+
+    def simulate_path(self, tradeSignal, timestamp):
+        """Random walk vanaf de open prijs totdat alle legs van dit symbool gesloten zijn."""
+        symbol = tradeSignal.forexSymbol
+        price = float(tradeSignal.open_price)
+        step = abs(price - float(tradeSignal.stop_loss)) * 0.05 or price * 0.0001
+        for index in range(1, self.synthetic_steps + 1):
+            if not any(run.broker.positions_by_symbol.get(symbol) for run in self.runs):
+                break
+            price += self.random.gauss(0, step)
+            self.set_tick(symbol, price, price + self.spread, timestamp + index)
+
+    def summaries(self):
+        return [run.summary() for run in self.runs]
+
+def main():
+    with open('config.json', 'r') as config_file:
+        config = json.load(config_file)
+
+    parser = argparse.ArgumentParser(description='Replay exported channel history against a simulated broker')
+    parser.add_argument('--messages', required=True, help='JSONL file with the exported messages')
+    parser.add_argument('--ticks', help='CSV or JSONL tick file (time,symbol,bid,ask)')
+    parser.add_argument('--synthetic', action='store_true', help='Generate a random walk per signal instead of recorded ticks')
+    parser.add_argument('--synthetic-steps', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--spread', type=float, default=0.0)
+    parser.add_argument('--balance', type=float, default=10000.0)
+    parser.add_argument('--strategies', nargs='*', help=f"Strategies to replay. Available: {', '.join(config['strategies'])}")
+    parser.add_argument('--output', default='replay_results.jsonl', help='Output file for fills, hits and summaries')
+    parser.add_argument('--verbose', action='store_true', help='Log every order like the live bot does')
+    args = parser.parse_args()
+
+    if not args.ticks and not args.synthetic:
+        parser.error('Either --ticks or --synthetic is required.')
+
+    if not args.verbose:
+        logger.setLevel(logging.WARNING)
+
+    # de replay mag de productie database niet aanraken
+    manage_shelve.set_store(SignalStore(':memory:'))
+
+    strategies = {
+        name: Strategy(**params) for name, params in config['strategies'].items()
+        if not args.strategies or name in args.strategies
+    }
+    engine = ReplayEngine(
+        config['channels'], strategies, balance=args.balance, synthetic=args.synthetic,
+        synthetic_steps=args.synthetic_steps, spread=args.spread, seed=args.seed
+    )
+
+    with open(args.output, 'w') as output:
+        for run in engine.runs:
+            run.output = output
+        ticks = iter_ticks(args.ticks) if args.ticks else ()
+        asyncio.run(engine.run(iter_messages(args.messages), ticks))
+        for summary in engine.summaries():
+            output.write(json.dumps(summary) + '\n')
+
+    print(f"Replayed {engine.counters}")
+    for summary in engine.summaries():
+        print(summary)
+
+if __name__ == '__main__':
+    main()
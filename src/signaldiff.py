@@ -0,0 +1,67 @@
+class SignalDiff:
+    """Verschil tussen een opgeslagen signaal en het opnieuw geparste, aangepaste bericht.
+
+    Het opgeslagen signaal is een dict zoals `SignalStore.get_signal` die
+    teruggeeft, het aangepaste signaal een `TradeSignal`. Alleen een andere
+    stop loss of andere target profits kunnen op de open legs worden
+    toegepast; een ander symbool, een andere richting of open prijs wordt
+    alleen gemeld. Bij een ander symbool of een andere richting wordt er
+    niets aangepast, de open legs horen dan niet meer bij het signaal.
+    """
+    ORDER_FIELDS = ('stop_loss', 'target_profits')
+    IDENTITY_FIELDS = ('symbol', 'direction')
+
+    def __init__(self, stored, edited):
+        self.ref_number = stored['ref_number']
+        self.changes = {}  # veld -> (oud, nieuw)
+        fields = {
+            'symbol': (stored['symbol'], edited.forexSymbol),
+            'direction': (stored['direction'], edited.tradeDirection),
+            'open_price': (self.as_float(stored['open_price']), self.as_float(edited.open_price)),
+            'stop_loss': (self.as_float(stored['stop_loss']), self.as_float(edited.stop_loss)),
+            'target_profits': (list(stored['target_profits']), list(edited.target_profits)),
+        }
+        for field, (old, new) in fields.items():
+            if old != new:
+                self.changes[field] = (old, new)
+
+    @staticmethod
+    def as_float(value):
+        # GTMO bewaart de open prijs als tekst
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return value
+
+    def is_empty(self):
+        return not self.changes
+
+    def changes_orders(self):
+        """True als de stop loss of de target profits zijn veranderd."""
+        return any(field in self.changes for field in self.ORDER_FIELDS)
+
+    def can_apply(self):
+        """True als de wijziging automatisch op de open legs kan worden toegepast."""
+        return self.changes_orders() and not any(field in self.changes for field in self.IDENTITY_FIELDS)
+
+    def other_changes(self):
+        return {field: change for field, change in self.changes.items() if field not in self.ORDER_FIELDS}
+
+    @property
+    def new_stop_loss(self):
+        """De nieuwe stop loss, of None als die niet is veranderd."""
+        change = self.changes.get('stop_loss')
+        return None if change is None else change[1]
+
+    @property
+    def new_target_profits(self):
+        """De nieuwe target profits (een per leg), of None als die niet zijn veranderd."""
+        change = self.changes.get('target_profits')
+        return None if change is None else change[1]
+
+    def __str__(self):
+        if not self.changes:
+            return f"{self.ref_number}: no changes"
+        return f"{self.ref_number}: " + ', '.join(
+            f"{field} {old} -> {new}" for field, (old, new) in self.changes.items()
+        )
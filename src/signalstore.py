@@ -0,0 +1,551 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+import logger_setup
+
+logger = logger_setup.LoggerSingleton.get_logger()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS raw_messages (
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    received_at REAL NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (channel_id, message_id, version)
+);
+CREATE INDEX IF NOT EXISTS idx_raw_messages_message_id ON raw_messages (message_id);
+
+CREATE TABLE IF NOT EXISTS signals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    ref_number TEXT,
+    symbol TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    open_price REAL,
+    stop_loss REAL,
+    target_profits TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_signals_message ON signals (channel_id, message_id);
+CREATE INDEX IF NOT EXISTS idx_signals_ref_number ON signals (ref_number);
+
+CREATE TABLE IF NOT EXISTS order_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_key TEXT NOT NULL,
+    ref_number TEXT,
+    created_at REAL NOT NULL,
+    result TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_order_results_batch ON order_results (batch_key);
+CREATE INDEX IF NOT EXISTS idx_order_results_ref_number ON order_results (ref_number);
+
+CREATE TABLE IF NOT EXISTS processed_messages (
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    ref_number TEXT,
+    processed_at REAL NOT NULL,
+    PRIMARY KEY (channel_id, message_id)
+);
+
+CREATE TABLE IF NOT EXISTS channel_positions (
+    channel_id INTEGER PRIMARY KEY,
+    last_message_id INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS channel_entities (
+    channel_id INTEGER PRIMARY KEY,
+    peer_type TEXT NOT NULL,
+    peer_id INTEGER NOT NULL,
+    access_hash INTEGER,
+    title TEXT,
+    updated_at REAL NOT NULL
+);
+"""
+
+class SignalStore:
+    """SQLite (WAL) opslag voor ruwe berichten, signalen en order resultaten.
+
+    Gebruikt een enkele langlevende verbinding. Schrijfacties worden met een
+    lock geserialiseerd zodat de store ook vanuit een achtergrond thread
+    gebruikt kan worden.
+    """
+    _instance = None
+
+    def __init__(self, path, synchronous='NORMAL'):
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        self.set_synchronous(synchronous)
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    @staticmethod
+    def get_store(path):
+        if SignalStore._instance is None:
+            SignalStore._instance = SignalStore(path)
+        return SignalStore._instance
+
+    def set_synchronous(self, synchronous):
+        # FULL: iedere commit doet een fsync, NORMAL: alleen bij een checkpoint
+        if synchronous not in ('OFF', 'NORMAL', 'FULL'):
+            raise ValueError(f"Invalid synchronous mode: {synchronous}")
+        with self.lock:
+            self.connection.execute(f'PRAGMA synchronous={synchronous}')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    # ruwe berichten
+
+    def store_message_versions(self, channel_id, message_id, versions):
+        """Vervangt alle versies van een bericht in een transactie."""
+        with self.lock, self.connection:
+            self._store_message_versions(channel_id, message_id, versions)
+
+    def _store_message_versions(self, channel_id, message_id, versions):
+        now = time.time()
+        self.connection.execute(
+            'DELETE FROM raw_messages WHERE channel_id = ? AND message_id = ?',
+            (channel_id, message_id)
+        )
+        self.connection.executemany(
+            'INSERT INTO raw_messages (channel_id, message_id, version, received_at, text) VALUES (?, ?, ?, ?, ?)',
+            [(channel_id, message_id, version, now, text) for version, text in enumerate(versions)]
+        )
+
+    def append_message_version(self, channel_id, message_id, text):
+        """Voegt een versie (edit) toe zonder de eerdere versies te herschrijven."""
+        with self.lock, self.connection:
+            self._append_message_version(channel_id, message_id, text)
+
+    def _append_message_version(self, channel_id, message_id, text):
+        # het volgende versienummer komt uit de primary key index
+        self.connection.execute(
+            'INSERT INTO raw_messages (channel_id, message_id, version, received_at, text) '
+            'SELECT ?, ?, COALESCE(MAX(version) + 1, 0), ?, ? FROM raw_messages '
+            'WHERE channel_id = ? AND message_id = ?',
+            (channel_id, message_id, time.time(), text, channel_id, message_id)
+        )
+
+    def get_latest_message_version(self, channel_id, message_id):
+        """De tekst van de laatste versie van een bericht, of None."""
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT text FROM raw_messages WHERE channel_id = ? AND message_id = ? '
+                'ORDER BY version DESC LIMIT 1', (channel_id, message_id)
+            ).fetchone()
+        return None if row is None else row['text']
+
+    def get_message_versions(self, message_id, channel_id=None):
+        query = 'SELECT text FROM raw_messages WHERE message_id = ?'
+        params = [message_id]
+        if channel_id is not None:
+            query += ' AND channel_id = ?'
+            params.append(channel_id)
+        with self.lock:
+            rows = self.connection.execute(query + ' ORDER BY version', params).fetchall()
+        return [row['text'] for row in rows] or None
+
+    def get_latest_message(self):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT message_id FROM raw_messages ORDER BY message_id DESC LIMIT 1'
+            ).fetchone()
+        if row is None:
+            return None
+        return row['message_id'], self.get_message_versions(row['message_id'])
+
+    # signalen
+
+    def store_signals(self, records):
+        """Bulk insert van (channel_id, message_id, TradeSignal) records."""
+        with self.lock, self.connection:
+            self._store_signals(records)
+
+    def _store_signals(self, records):
+        now = time.time()
+        self.connection.executemany(
+            'INSERT INTO signals (channel_id, message_id, ref_number, symbol, direction, open_price, '
+            'stop_loss, target_profits, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [
+                (channel_id, message_id, signal.ref_number, signal.forexSymbol, signal.tradeDirection,
+                 signal.open_price, signal.stop_loss, json.dumps(signal.target_profits), now)
+                for channel_id, message_id, signal in records
+            ]
+        )
+
+    def get_signal(self, channel_id, message_id):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT * FROM signals WHERE channel_id = ? AND message_id = ? ORDER BY id DESC LIMIT 1',
+                (channel_id, message_id)
+            ).fetchone()
+        if row is None:
+            return None
+        signal = dict(row)
+        signal['target_profits'] = json.loads(signal['target_profits'])
+        return signal
+
+    # order resultaten
+
+    def store_order_results(self, batch_key, order_results):
+        """Bulk insert van de order resultaten van een signaal onder een gemeenschappelijke sleutel."""
+        with self.lock, self.connection:
+            self._store_order_results(batch_key, order_results)
+
+    def _store_order_results(self, batch_key, order_results):
+        now = time.time()
+        self.connection.executemany(
+            'INSERT INTO order_results (batch_key, ref_number, created_at, result) VALUES (?, ?, ?, ?)',
+            [
+                (str(batch_key), result.get('request', {}).get('comment'), now, json.dumps(result))
+                for result in order_results
+            ]
+        )
+
+    # verwerkte berichten
+
+    def mark_processed(self, channel_id, message_id, ref_number):
+        with self.lock, self.connection:
+            self._mark_processed(channel_id, message_id, ref_number)
+
+    def _mark_processed(self, channel_id, message_id, ref_number):
+        # de eerste verwerking wint, een herhaling overschrijft niets
+        self.connection.execute(
+            'INSERT OR IGNORE INTO processed_messages (channel_id, message_id, ref_number, processed_at) '
+            'VALUES (?, ?, ?, ?)',
+            (channel_id, message_id, ref_number, time.time())
+        )
+
+    def get_processed(self, channel_id, message_id):
+        """Geeft het ref nummer van een verwerkt bericht, of None als het niet verwerkt is."""
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT ref_number FROM processed_messages WHERE channel_id = ? AND message_id = ?',
+                (channel_id, message_id)
+            ).fetchone()
+        return None if row is None else (row['ref_number'] or '')
+
+    def get_recent_processed(self, limit):
+        """De laatst verwerkte berichten, oudste eerst: (channel_id, message_id, ref_number)."""
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT channel_id, message_id, ref_number FROM processed_messages '
+                'ORDER BY rowid DESC LIMIT ?', (limit,)
+            ).fetchall()
+        return [(row['channel_id'], row['message_id'], row['ref_number'] or '') for row in reversed(rows)]
+
+    def get_processed_high_water_marks(self):
+        """Het hoogste verwerkte message id per channel."""
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT channel_id, MAX(message_id) AS message_id FROM processed_messages GROUP BY channel_id'
+            ).fetchall()
+        return {row['channel_id']: row['message_id'] for row in rows}
+
+    # laatst geziene berichten per channel
+
+    def store_channel_position(self, channel_id, message_id):
+        with self.lock, self.connection:
+            self._store_channel_position(channel_id, message_id)
+
+    def _store_channel_position(self, channel_id, message_id):
+        # een ouder bericht (bijvoorbeeld uit gap recovery) zet de positie niet terug
+        self.connection.execute(
+            'INSERT INTO channel_positions (channel_id, last_message_id, updated_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(channel_id) DO UPDATE SET '
+            'last_message_id = MAX(last_message_id, excluded.last_message_id), updated_at = excluded.updated_at',
+            (channel_id, message_id, time.time())
+        )
+
+    def get_channel_positions(self):
+        """Het laatst geziene message id per channel."""
+        with self.lock:
+            rows = self.connection.execute('SELECT channel_id, last_message_id FROM channel_positions').fetchall()
+        return {row['channel_id']: row['last_message_id'] for row in rows}
+
+    # opgezochte channel entities
+
+    def store_channel_entity(self, channel_id, peer_type, peer_id, access_hash, title):
+        with self.lock, self.connection:
+            self._store_channel_entity(channel_id, peer_type, peer_id, access_hash, title)
+
+    def _store_channel_entity(self, channel_id, peer_type, peer_id, access_hash, title):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO channel_entities (channel_id, peer_type, peer_id, access_hash, title, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (channel_id, peer_type, peer_id, access_hash, title, time.time())
+        )
+
+    def _delete_channel_entity(self, channel_id):
+        self.connection.execute('DELETE FROM channel_entities WHERE channel_id = ?', (channel_id,))
+
+    def get_channel_entities(self):
+        """Alle opgeslagen entities: channel_id -> (peer_type, peer_id, access_hash, title)."""
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT channel_id, peer_type, peer_id, access_hash, title FROM channel_entities'
+            ).fetchall()
+        return {
+            row['channel_id']: (row['peer_type'], row['peer_id'], row['access_hash'], row['title'])
+            for row in rows
+        }
+
+    def write_batch(self, records):
+        """Schrijft een lijst (soort, argumenten) records in een enkele transactie."""
+        writers = {
+            'message_versions': self._store_message_versions,
+            'message_version': self._append_message_version,
+            'signal': lambda *args: self._store_signals([args]),
+            'order_results': self._store_order_results,
+            'processed': self._mark_processed,
+            'channel_position': self._store_channel_position,
+            'channel_entity': self._store_channel_entity,
+            'delete_channel_entity': self._delete_channel_entity,
+        }
+        with self.lock, self.connection:
+            for kind, args in records:
+                writers[kind](*args)
+
+    def checkpoint(self):
+        """Zet de WAL over naar de database file (met fsync)."""
+        with self.lock:
+            self.connection.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def get_order_results(self, batch_key):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT result FROM order_results WHERE batch_key = ? ORDER BY id', (str(batch_key),)
+            ).fetchall()
+        return [json.loads(row['result']) for row in rows] or None
+
+    def get_latest_order_results(self):
+        # de primary key is een B-tree, de laatste rij vinden is O(log n)
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT batch_key FROM order_results ORDER BY id DESC LIMIT 1'
+            ).fetchone()
+        if row is None:
+            return None
+        return row['batch_key'], self.get_order_results(row['batch_key'])
+
+    def iter_order_results(self):
+        with self.lock:
+            rows = self.connection.execute('SELECT batch_key, result FROM order_results ORDER BY id').fetchall()
+        for row in rows:
+            yield row['batch_key'], json.loads(row['result'])
+
+class WriteBehindWriter:
+    """Achtergrond writer zodat opslag nooit op het order pad zit.
+
+    Handlers zetten records in een wachtrij, een thread schrijft ze in
+    batches weg zodra `max_batch_size` records klaarstaan of uiterlijk na
+    `flush_interval` seconden. Het fsync beleid bepaalt hoe duurzaam een
+    batch is:
+
+    - 'batch': iedere batch commit doet een fsync (synchronous=FULL).
+    - 'interval': commits zonder fsync, elke `fsync_interval` seconden een
+      WAL checkpoint met fsync (synchronous=NORMAL).
+
+    Berichtversies en signalen die nog niet zijn weggeschreven blijven via
+    `pending_messages`, `pending_latest` en `pending_signals` leesbaar, zodat
+    een edit direct na een nieuw bericht de juiste versie en het signaal ziet.
+
+    Mislukt een batch, dan probeert de writer het opnieuw na elke wachttijd
+    in `retry_delays` en daarna record voor record. Een record dat zelf niet
+    te schrijven is (constraint, verkeerd type) wordt gelogd en verworpen;
+    records die alleen op een onbereikbare database stuiten
+    (`sqlite3.OperationalError`, bijvoorbeeld locked of disk I/O) gaan mee
+    met de volgende flush, tot maximaal `max_unwritten` records. Tot dan
+    blijven ze via de pending records leesbaar.
+    """
+    FSYNC_POLICIES = ('batch', 'interval')
+
+    def __init__(self, store, flush_interval=1.0, max_batch_size=500, fsync_policy='batch', fsync_interval=5.0,
+                 retry_delays=(0.1, 0.5, 2.0), max_unwritten=5000):
+        if fsync_policy not in self.FSYNC_POLICIES:
+            raise ValueError(f"Invalid fsync policy: {fsync_policy}. Use one of {', '.join(self.FSYNC_POLICIES)}.")
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.retry_delays = tuple(retry_delays)
+        self.max_unwritten = max_unwritten
+        self.queue = queue.Queue()
+        self.unwritten = []  # records van een mislukte flush, gaan voor bij de volgende
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.pending_messages = {}
+        self.pending_latest = {}  # (channel id, message id) -> args van de laatste toegevoegde versie
+        self.pending_signals = {}  # (channel id, message id) -> args van het laatste signaal
+        self.pending_lock = threading.Lock()
+        self.last_fsync = time.monotonic()
+        self.thread = None
+        self.store.set_synchronous('FULL' if fsync_policy == 'batch' else 'NORMAL')
+
+    @property
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='write-behind', daemon=True)
+            self.thread.start()
+
+    def enqueue(self, kind, *args):
+        if kind == 'message_versions':
+            channel_id, message_id, versions = args
+            args = (channel_id, message_id, list(versions))
+            with self.pending_lock:
+                self.pending_messages[(channel_id, message_id)] = args[2]
+                # een volledige set versies vervangt ook eerder toegevoegde versies
+                self.pending_latest.pop((channel_id, message_id), None)
+        elif kind == 'message_version':
+            with self.pending_lock:
+                self.pending_latest[(args[0], args[1])] = args
+        elif kind == 'signal':
+            with self.pending_lock:
+                self.pending_signals[(args[0], args[1])] = args
+        self.queue.put((kind, args))
+
+    def get_pending_latest_message_version(self, channel_id, message_id):
+        with self.pending_lock:
+            args = self.pending_latest.get((channel_id, message_id))
+            if args is not None:
+                return args[2]
+            versions = self.pending_messages.get((channel_id, message_id))
+        return versions[-1] if versions else None
+
+    def get_pending_signal(self, channel_id, message_id):
+        with self.pending_lock:
+            args = self.pending_signals.get((channel_id, message_id))
+        return None if args is None else args[2]
+
+    def get_pending_message_versions(self, message_id, channel_id=None):
+        with self.pending_lock:
+            for (pending_channel_id, pending_message_id), versions in self.pending_messages.items():
+                if pending_message_id == message_id and channel_id in (None, pending_channel_id):
+                    return list(versions)
+        return None
+
+    def run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self.unwritten:
+                    self.flush([])
+                self.maybe_fsync()
+                continue
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.max_batch_size:
+                try:
+                    record = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            self.flush(batch)
+            if stop:
+                break
+        # alles wat na het stop signaal nog binnenkwam ook wegschrijven
+        remaining = []
+        while not self.queue.empty():
+            record = self.queue.get_nowait()
+            if record is not None:
+                remaining.append(record)
+        if remaining or self.unwritten:
+            self.flush(remaining)
+        self.store.checkpoint()
+
+    def flush(self, batch):
+        """Schrijft de batch weg, na eerder mislukte records; False als niet alles is weggeschreven."""
+        batch = self.unwritten + batch
+        self.unwritten = []
+        for attempt, delay in enumerate(self.retry_delays + (None,)):
+            try:
+                self.store.write_batch(batch)
+                self.clear_pending(batch)
+                self.maybe_fsync()
+                return True
+            except Exception as e:
+                self.failed_flushes += 1
+                if delay is None:
+                    logger.error("Write-behind flush of %d records failed after %d attempts, writing them one by one: %s",
+                                 len(batch), attempt + 1, e)
+                    break
+                logger.warning("Write-behind flush of %d records failed, retrying in %.1fs: %s", len(batch), delay, e)
+                time.sleep(delay)
+
+        # record voor record, zodat een record dat nooit lukt de rest niet tegenhoudt
+        done = []  # weggeschreven of verworpen
+        dropped = 0
+        for record in batch:
+            try:
+                self.store.write_batch([record])
+            except sqlite3.OperationalError:
+                self.unwritten.append(record)
+                continue
+            except Exception as e:
+                dropped += 1
+                logger.error("Write-behind dropped a %s record that cannot be written: %s", record[0], e)
+            done.append(record)
+        if len(self.unwritten) > self.max_unwritten:
+            overflow = len(self.unwritten) - self.max_unwritten
+            dropped += overflow
+            logger.error("Write-behind dropped the %d oldest unwritten records (max %d).", overflow, self.max_unwritten)
+            done.extend(self.unwritten[:overflow])
+            self.unwritten = self.unwritten[overflow:]
+        if self.unwritten:
+            logger.error("Write-behind keeps %d records for the next flush.", len(self.unwritten))
+        self.dropped += dropped
+        self.clear_pending(done)
+        self.maybe_fsync()
+        return not self.unwritten and not dropped
+
+    def clear_pending(self, records):
+        """Haalt weggeschreven (of verworpen) records uit de pending records."""
+        with self.pending_lock:
+            for kind, args in records:
+                if kind == 'message_versions':
+                    key = (args[0], args[1])
+                    # alleen verwijderen als er intussen geen nieuwere versie is
+                    if self.pending_messages.get(key) is args[2]:
+                        del self.pending_messages[key]
+                elif kind == 'message_version':
+                    if self.pending_latest.get((args[0], args[1])) is args:
+                        del self.pending_latest[(args[0], args[1])]
+                elif kind == 'signal':
+                    if self.pending_signals.get((args[0], args[1])) is args:
+                        del self.pending_signals[(args[0], args[1])]
+
+    def maybe_fsync(self):
+        if self.fsync_policy == 'interval' and time.monotonic() - self.last_fsync >= self.fsync_interval:
+            self.store.checkpoint()
+            self.last_fsync = time.monotonic()
+
+    def stop(self, timeout=10.0):
+        """Schrijft alle openstaande records weg en stopt de thread."""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            logger.error("Write-behind writer did not stop within %s seconds.", timeout)
+        self.thread = None
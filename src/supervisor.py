@@ -0,0 +1,87 @@
+import asyncio
+import random
+import time
+from collections import deque
+import logger_setup
+
+logger = logger_setup.LoggerSingleton.get_logger()
+
+class ReconnectSupervisor:
+    """Houdt een verbinding in de lucht met exponentiele backoff en jitter.
+
+    `run` verbindt (`connect`) en draait daarna `serve` totdat die normaal
+    stopt. Een verbindingsfout in een van beide start een incident: er
+    wordt opnieuw verbonden met wachttijden van base_delay, base_delay *
+    factor, ... tot max_delay, ieder met een willekeurige korting van
+    maximaal `jitter` zodat meerdere processen niet tegelijk terugkomen.
+    Alles draait op dezelfde event loop en met dezelfde client; er is geen
+    recursie, dus een lange storing laat de stack niet groeien.
+
+    De downtime per incident (van de fout tot de geslaagde verbinding) wordt
+    bijgehouden in `incidents`.
+    """
+    RETRY_ON = (OSError, asyncio.TimeoutError)  # ConnectionError is een OSError
+
+    def __init__(self, base_delay=1.0, max_delay=60.0, factor=2.0, jitter=0.5, history=100):
+        if base_delay <= 0 or max_delay < base_delay:
+            raise ValueError(f"Invalid delays: base {base_delay}, max {max_delay}.")
+        if not 0 <= jitter < 1:
+            raise ValueError(f"Invalid jitter: {jitter}. Must be between 0 and 1.")
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.incidents = deque(maxlen=history)  # downtime in seconden per incident
+        self.outage_started = None
+        self.attempts = 0
+        self.reconnects = 0
+
+    def next_delay(self, attempt):
+        delay = min(self.max_delay, self.base_delay * self.factor ** attempt)
+        return delay * (1 - self.jitter * random.random())
+
+    @property
+    def last_downtime(self):
+        return self.incidents[-1] if self.incidents else None
+
+    def connection_lost(self, error):
+        if self.outage_started is None:
+            self.outage_started = time.monotonic()
+            logger.warning("Connection lost: %r. Reconnecting...", error)
+
+    async def connect(self, connect):
+        """Roept `connect()` aan totdat die slaagt en sluit een lopend incident af."""
+        attempt = 0
+        while True:
+            try:
+                await connect()
+                break
+            except self.RETRY_ON as e:
+                self.connection_lost(e)
+                delay = self.next_delay(attempt)
+                attempt += 1
+                self.attempts += 1
+                logger.info("Connect attempt %d failed (%r), retrying in %.1f seconds.", attempt, e, delay)
+                await asyncio.sleep(delay)
+
+        if self.outage_started is not None:
+            downtime = time.monotonic() - self.outage_started
+            self.outage_started = None
+            self.incidents.append(downtime)
+            self.reconnects += 1
+            logger.info("Reconnected after %.1f seconds (%d attempts).", downtime, attempt + 1)
+
+    async def run(self, connect, serve, connected=False):
+        """Verbindt en draait `serve()`; verbindt opnieuw na iedere verbindingsfout.
+
+        Met connected=True is de eerste verbinding al gemaakt.
+        """
+        while True:
+            if not connected:
+                await self.connect(connect)
+            connected = False
+            try:
+                await serve()
+                return
+            except self.RETRY_ON as e:
+                self.connection_lost(e)
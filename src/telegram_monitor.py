@@ -7,34 +7,79 @@ import tradingbot
 import logger
 import pdb
 import logger_setup
-from tradesignalparser import TradeSignalParser1000PipBuilder, get_parser
+from tradesignalparser import ParserRegistry, parse_failure_reason
+from notifier import TelegramNotifier
+from tracing import LatencyTracer, StartupTimer
+from processedindex import ProcessedMessageIndex
+from entitycache import EntityCache
+from signaldiff import SignalDiff
+from gaprecovery import LateSignalPolicy, fetch_missed_messages
+from pipeline import PipelineStage, SignalJob, SignalPipeline
+from metrics import MetricsRegistry, latency_summary
+from mt5handler import TickStore
 from telethon.sync import TelegramClient, events
-from telethon.errors import FloodWaitError
-from telethon.tl.types import PeerChannel
-from telethon import functions
-
-from telegram import Update, Bot
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes
-from telegram.error import TelegramError
+from telethon import utils as telethon_utils
+from telethon.errors import ChannelInvalidError, ChannelPrivateError, FloodWaitError, PeerIdInvalidError
 
 from datetime import datetime
 
 logger = logger_setup.LoggerSingleton.get_logger()
 
+LOG_BANNER = "=" * 61
+
 class MessageFilter:
     pass
 
 class ChannelMonitor:
 
-    def __init__(self, config_file, mt5, strategy, channel_params):
+    def __init__(self, config_file, mt5, strategy, channel_params, account_pool=None):
         self.tb = tradingbot.ProcessTradeSignal(mt5)
         self.mt5 = mt5
         self.strategy = strategy
         self.tradingbot = tradingbot.ProcessTradeSignal(mt5)
         self.channel_ids = self.load_channels(config_file, channel_params)
+        self.channels = [channel for channel in config_file['channels'] if channel['id'] in self.channel_ids]
+        self.parsers = ParserRegistry(self.channels)
+        # met een account pool gaan de orders naar de worker processen in plaats van naar mt5
+        self.account_pool = account_pool
+        # voorkomt dubbele orders als catch_up of een reconnect een bericht opnieuw aflevert
+        self.processed = ProcessedMessageIndex(config_file.get('processed_index', {}).get('capacity', 10000))
+        # input peers van de gevolgde channels, zodat ze niet bij iedere start worden opgezocht
+        self.entities = EntityCache()
+        self.input_peers = {}
+        self.force_update_task = None
+        self.tracer = LatencyTracer.get_tracer()
+        self.latency_dump_file = config_file.get('tracing', {}).get('dump_file', 'data/latency.json')
+        self.stop_loss_update = config_file.get('stop_loss_update', {})
+        # berichten die tijdens een storing zijn gemist worden na een (her)verbinding opgehaald
+        gap_recovery = config_file.get('gap_recovery', {})
+        self.gap_recovery_limit = gap_recovery.get('max_messages', 100)
+        self.late_signals = LateSignalPolicy(
+            max_signal_age=gap_recovery.get('max_signal_age', 300.0),
+            max_price_drift=gap_recovery.get('max_price_drift', 0.002)
+        )
+        # ingest -> parse -> sizing -> execution, met per symbool een signaal tegelijk
+        pipeline_params = config_file.get('pipeline', {})
+        workers = pipeline_params.get('workers', 4)
+        queue_size = pipeline_params.get('queue_size', 100)
+        self.pipeline = SignalPipeline([
+            PipelineStage('parse', self.parse_stage, queue_size=pipeline_params.get('ingest_queue_size', 1000)),
+            PipelineStage('sizing', self.sizing_stage, workers=workers, queue_size=queue_size, gated=True),
+            PipelineStage('execution', self.execution_stage, workers=workers, queue_size=queue_size),
+        ], key=lambda job: job.key)
+        self.ref_symbols = {}  # ref nummer -> symbool, voor de gate van een stop loss update
 
         self.telegram_token = config_file['api_token']
         self.telegram_chat_id = config_file['telegram_chat_id']        
+        notifier_params = config_file.get('notifier', {})
+        self.notifier = TelegramNotifier(
+            self.telegram_token, self.telegram_chat_id,
+            coalesce_window=notifier_params.get('coalesce_window', 0.5),
+            min_interval=notifier_params.get('min_interval', 1.0),
+            max_queue_size=notifier_params.get('max_queue_size', 1000)
+        )
+
+        self.register_metrics(MetricsRegistry.get_registry())
 
         self.api_id = float(config_file['api_id'])
         self.api_hash = config_file['api_hash']
@@ -57,134 +102,491 @@ class ChannelMonitor:
 
         return filtered_channels
     
-    async def send_bot_message(self, message):
-        bot = Bot(token=self.telegram_token)
-        try:
-            await bot.send_message(chat_id=self.telegram_chat_id, text=message)
-            logger.info("Bot message sent successfully.")
-        except TelegramError as e:
-            logger.error(f"Failed to send the bot message: {e}")    
+    def send_bot_message(self, message):
+        # de notifier verstuurt het bericht op de achtergrond, buiten het order pad
+        self.notifier.notify(message)
     
     async def load_messages_from_channel(self, channel, limit=10):
         try:
-            entity = await self.client.get_entity(channel)
-            print(f"Fetching messages from: {entity.username}")
+            entity = self.input_peers.get(channel) or await self.resolve_channel(channel)
+            print(f"Fetching messages from: {self.entities.title(channel) or channel}")
 
             async for message in self.client.iter_messages(entity, limit=limit):
                 timestamp = message.date.strftime('%Y-%m-%d %H:%M:%S')
                 print(f"[{timestamp}] {message.sender_id}: {message.text}")
 
+        except (ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError) as e:
+            # de opgeslagen access hash is niet (meer) geldig
+            print(f"Error fetching messages from {channel}: {e}")
+            self.entities.invalidate(channel)
+            self.input_peers.pop(channel, None)
         except Exception as e:
             print(f"Error fetching messages from {channel}: {e}")
 
     async def handle_edited_message(self, event):
+        # edits lopen door dezelfde pipeline als nieuwe berichten: de parse stage
+        # ziet ze na het oorspronkelijke signaal en de gate laat ze pas door als
+        # de orders van dat signaal geplaatst zijn
+        await self.pipeline.submit(SignalJob(event, kind='edit'))
+
+    def parse_edit(self, job):
+        """Parse stage voor een edit: versie opslaan en het verschil met het opgeslagen signaal bepalen."""
+        event = job.event
         message = event.message.text
         messageId = event.message.id
-        channelName = event.chat.title or event.chat.username
-        channelNameStripped = channelName.encode('ascii', 'ignore').decode('ascii').strip()
-
-        parser = get_parser(channelNameStripped)
-        message_stripped = parser.clean_message(message).encode('ascii', 'ignore').decode('ascii').strip()
-
-        existing_message = manage_shelve.get_item(manage_shelve.SIGNALS_DB, str(messageId))
-        if existing_message:
-            last_existing_message = existing_message[len(existing_message) - 1]
-            if last_existing_message != message_stripped:
-                existing_message.append(message_stripped)
-                manage_shelve.store_data(manage_shelve.SIGNALS_DB, str(messageId), existing_message)
-                await self.send_bot_message(
-                    f"Een bestaand trade signal in '{channelNameStripped}' "
-                    f"werd zojuist aangepast!\n"
-                    f"New value:\n{message_stripped}\n"
-                    f"Old value:\n{last_existing_message}"
-                )
-                
-                logger.info(f"A trade message (ID: {messageId}) was edited.")
-                logger.info(f"Old value: \n{existing_message}")
-                logger.info(f"New value: \n{message_stripped}")
+
+        # de parser is bij het opstarten al aan het chat id gekoppeld
+        parser = self.parsers.get(event.chat_id)
+        channelNameStripped = parser.channel_name
+        message_stripped = parser.clean_message(message)
+        job.parser = parser
+        job.message = message_stripped
+
+        # alleen de laatste versie is nodig, een edit voegt een versie toe in plaats van alles te herschrijven
+        last_existing_message = manage_shelve.get_latest_message_version(event.chat_id, messageId)
+        if last_existing_message is None or last_existing_message == message_stripped:
+            return None
+        manage_shelve.append_message_version(event.chat_id, messageId, message_stripped)
+        self.send_bot_message(
+            f"Een bestaand trade signal in '{channelNameStripped}' "
+            f"werd zojuist aangepast!\n"
+            f"New value:\n{message_stripped}\n"
+            f"Old value:\n{last_existing_message}"
+        )
+        logger.info("A trade message (ID: %s) was edited.\nOld value: \n%s\nNew value: \n%s",
+                    messageId, last_existing_message, message_stripped,
+                    extra={'channel': channelNameStripped, 'stage': 'edited'})
+
+        stored = manage_shelve.get_signal(event.chat_id, messageId)
+        if stored is None:
+            return None
+        try:
+            edited = parser.parse_trade_signal(message_stripped)
+        except ValueError as e:
+            logger.info("Edited message of %s is no longer a valid signal: %s", stored['ref_number'], e,
+                        extra={'ref': stored['ref_number'], 'channel': channelNameStripped, 'stage': 'edited'})
+            return None
+
+        diff = SignalDiff(stored, edited)
+        if diff.is_empty():
+            return None
+        logger.info("Signal edit: %s", diff, extra={'ref': diff.ref_number, 'channel': channelNameStripped, 'stage': 'edited'})
+        if diff.other_changes():
+            self.send_bot_message(f"Signal {diff.ref_number} edit is not applied automatically: {diff}")
+        if not diff.can_apply():
+            return None
+
+        # het aangepaste signaal wordt de nieuwe referentie voor volgende edits
+        edited.ref_number = diff.ref_number
+        manage_shelve.store_signal(event.chat_id, messageId, edited)
+        job.diff = diff
+        job.ref_number = diff.ref_number
+        # wacht op hetzelfde symbool als de orders van het oorspronkelijke signaal
+        job.key = stored['symbol']
+        return job
+
+    async def apply_signal_edit(self, job):
+        """Execution stage voor een edit: de gewijzigde SL of TP op de open legs zetten."""
+        diff = job.diff
+        channelNameStripped = job.parser.channel_name
+        if self.account_pool:
+            logger.warning("Signal edits are not forwarded to the account workers, %s is not adjusted.",
+                           diff.ref_number, extra={'ref': diff.ref_number, 'channel': channelNameStripped, 'stage': 'modify'})
+            return
+        summary = await self.tradingbot.adjust_positions(
+            diff.ref_number, stop_loss=diff.new_stop_loss, take_profits=diff.new_target_profits,
+            retries=self.stop_loss_update.get('retries', 2),
+            retry_delay=self.stop_loss_update.get('retry_delay', 0.25),
+            max_stop_distance=self.stop_loss_update.get('max_distance', 0.05)
+        )
+        self.send_bot_message(
+            f"Edit {diff}: {summary['modified']}/{summary['legs']} legs adjusted, "
+            f"{len(summary['failed'])} failed ({summary['elapsed'] * 1000:.0f} ms)."
+        )
 
     async def handle_new_message(self, event):
+        # de Telethon callback zet het bericht alleen in de ingest queue, de
+        # pipeline doet de rest; bij een volle queue wacht de callback
+        trace = self.tracer.start(event.chat_id, event.message.id, event.message.date)
+        # de titel komt uit de entity cache van Telethon, zonder extra request
+        self.entities.update_title(event.chat_id, getattr(event.chat, 'title', None))
+        self.messages_received.inc(self.parsers.get(event.chat_id).channel_name)
+        await self.pipeline.submit(SignalJob(event, trace))
+
+    async def parse_stage(self, job):
+        """Parse stage: normaliseren, parsen, dedup, opslaan en melden.
+
+        Een worker, zodat de berichten in volgorde van binnenkomst worden
+        verwerkt en een update of edit altijd na zijn signaal komt.
+        """
+        if job.kind == 'edit':
+            return self.parse_edit(job)
+        event, trace = job.event, job.trace
         message = event.message.text
         messageId = event.message.id
-        channelName = event.chat.title or event.chat.username
-        channelNameStripped = channelName.encode('ascii', 'ignore').decode('ascii').strip()
+        self.processed.mark_seen(event.chat_id, messageId)
 
-        parser = get_parser(channelNameStripped)
-        message_stripped = parser.clean_message(message).encode('ascii', 'ignore').decode('ascii').strip()
+        # de parser is bij het opstarten al aan het chat id gekoppeld
+        parser = self.parsers.get(event.chat_id)
+        channelNameStripped = parser.channel_name
+        message_stripped = parser.clean_message(message)
+        job.parser = parser
+        job.message = message_stripped
 
         try:
             tradeSignal = parser.parse_trade_signal(message_stripped)
-            manage_shelve.store_data(manage_shelve.SIGNALS_DB, str(messageId), [message_stripped])
-            logger.info(f"=============================================================")
-            logger.info(f"Received a valid trade signal in '{channelNameStripped}' :\n{message_stripped}")
-            logger.info(f'Created a trade signal:\n{tradeSignal}')
-            logger.info(f"=============================================================")
-            await self.send_bot_message(f"Trade signal \n{tradeSignal} gevormd voor bericht \n{message_stripped}.")
-            self.tradingbot.start_order_entry_process(tradeSignal, self.strategy)
         except ValueError as e:
-            if channelNameStripped == 'GTMO VIP':
-                # check if it's an update on a sl or tp levl
-                if message_stripped.lower().startswith('adjust sl'):
-                    await self.send_bot_message(f"Adjusting SL: \n'{message_stripped}'!")
-                    logger.info(f"Adjusting SL: \n'{message_stripped}")
-                else:
-                    logger.info(f"Skipping irrelevant message in {channelNameStripped}.")
-            elif channelNameStripped == 'Forex Signals - 1000 pip Builder':
-                if message_stripped.startswith('The 1:1 Risk:Reward Target has been reached'):
-                    await self.send_bot_message(f"Adjusting stop losses for 1000 pip builder: \n{message_stripped}!")
-                    logger.info(f"Adjusting SL is justified for 1000 pip builder: \n{message_stripped}")
-            else:
-                logger.info(f"Skipping irrelevant message.")
-                # print('stripped message: \n' + message_stripped)
+            # check if it's an update on a sl or tp level
+            if parser.is_stop_loss_update(message_stripped):
+                ref_number = self.resolve_referenced_signal(event)
+                if ref_number is None:
+                    # niet de gate in: zonder signaal zouden alle updates op dezelfde sleutel wachten
+                    logger.info("No signal found to adjust for a stop loss update in %s.", channelNameStripped,
+                                extra={'channel': channelNameStripped, 'stage': 'stop_loss_update'})
+                    return None
+                self.send_bot_message(f"Adjusting stop losses for {channelNameStripped}: \n{message_stripped}!")
+                logger.info("Adjusting SL is justified for %s: \n%s", channelNameStripped, message_stripped,
+                            extra={'ref': ref_number, 'channel': channelNameStripped, 'stage': 'stop_loss_update'})
+                job.kind = 'stop_loss_update'
+                job.ref_number = ref_number
+                # op hetzelfde symbool wachten als de orders van het signaal
+                job.key = self.ref_symbols.get(ref_number, ref_number)
+                return job
+            logger.info("Skipping irrelevant message in %s.", channelNameStripped,
+                        extra={'channel': channelNameStripped, 'stage': 'irrelevant'})
+            self.parse_failures.inc(channelNameStripped, parse_failure_reason(e))
+            return None
 
-    async def force_update(self):
-        """Force updates for all configured channels."""
+        trace.mark('parsed')
+        trace.ref_number = tradeSignal.ref_number
+        if not self.processed.claim(event.chat_id, messageId, tradeSignal.ref_number):
+            logger.info("Message %s in %s was already processed as %s, skipping.", messageId, channelNameStripped,
+                        self.processed.get(event.chat_id, messageId),
+                        extra={'ref': tradeSignal.ref_number, 'channel': channelNameStripped, 'stage': 'duplicate'})
+            return None
+        manage_shelve.append_message_version(event.chat_id, messageId, message_stripped)
+        manage_shelve.store_signal(event.chat_id, messageId, tradeSignal)
+        # een record in plaats van vier, opgemaakt door de log listener
+        logger.info("%s\nReceived a valid trade signal in '%s' :\n%s\nCreated a trade signal:\n%s\n%s",
+                    LOG_BANNER, channelNameStripped, message_stripped, tradeSignal, LOG_BANNER,
+                    extra={'ref': tradeSignal.ref_number, 'channel': channelNameStripped, 'stage': 'parsed'})
+        self.send_bot_message(f"Trade signal \n{tradeSignal} gevormd voor bericht \n{message_stripped}.")
+
+        job.kind = 'signal'
+        job.tradeSignal = tradeSignal
+        job.ref_number = tradeSignal.ref_number
+        job.key = tradeSignal.forexSymbol
+        self.ref_symbols[tradeSignal.ref_number] = tradeSignal.forexSymbol
+        if len(self.ref_symbols) > self.processed.capacity:
+            del self.ref_symbols[next(iter(self.ref_symbols))]
+        return job
+
+    async def sizing_stage(self, job):
+        """Sizing stage: late signaal check en de positiegrootte, in de MT5 thread.
+
+        De stage is gated: vanaf hier is er per symbool een signaal tegelijk
+        onderweg, tot en met de execution stage.
+        """
+        if job.kind != 'signal':
+            return job
+        tradeSignal = job.tradeSignal
+        reason = await self.check_late_signal(job.event, tradeSignal)
+        if reason:
+            channelNameStripped = job.parser.channel_name
+            logger.info("Skipping late signal %s in %s: %s.", tradeSignal.ref_number, channelNameStripped, reason,
+                        extra={'ref': tradeSignal.ref_number, 'channel': channelNameStripped, 'stage': 'late'})
+            self.send_bot_message(f"Signal {tradeSignal.ref_number} not traded: {reason}.")
+            return None
+        if self.account_pool:
+            # de workers bepalen de positiegrootte per account zelf
+            return job
+        job.plan = await self.tradingbot.mt5handler.run(
+            self.tradingbot.prepare_order_entry, tradeSignal, self.strategy, job.trace,
+            manage_shelve.order_key(job.event.chat_id, job.event.message.id)
+        )
+        return job if job.plan is not None else None
+
+    async def execution_stage(self, job):
+        """Execution stage: de orders van het signaal, of de aanpassing van de stop losses."""
+        if job.kind == 'edit':
+            await self.apply_signal_edit(job)
+            return job
+        if job.kind == 'stop_loss_update':
+            await self.adjust_stop_losses(job.event, job.parser, job.message, job.ref_number)
+            return job
+        tradeSignal, trace = job.tradeSignal, job.trace
+        if self.account_pool:
+            accountResults = await self.account_pool.submit(tradeSignal)
+            trace.mark('order_send')
+            self.tracer.finish(trace)
+            self.send_bot_message(self.account_pool.format_summary(tradeSignal, accountResults))
+            return job
+        orderResults = await self.tradingbot.execute_order_plan(job.plan, trace)
+        self.tracer.finish(trace)
+        for result in orderResults or []:
+            self.send_bot_message(f"Order {result.request.comment}: {result.volume} {tradeSignal.forexSymbol} @ {result.price}")
+        return job
+
+    async def check_late_signal(self, event, tradeSignal):
+        """Reden om een (te laat) signaal niet meer uit te voeren, of None.
+
+        De leeftijd wordt bij ieder signaal gecontroleerd. De prijs alleen bij
+        opgehaalde berichten en niet in fan-out mode, waar de monitor zelf
+        geen MT5 verbinding heeft.
+        """
+        reason = self.late_signals.check_age(event.message.date)
+        if reason or not getattr(event, 'recovered', False) or self.account_pool:
+            return reason
+        price = await self.tradingbot.mt5handler.run(self.tradingbot.get_trade_price, tradeSignal)
+        return self.late_signals.check_drift(tradeSignal.open_price, price)
+
+    async def recover_gaps(self):
+        """Haalt de berichten op die sinds het laatst geziene bericht zijn gemist.
+
+        Per channel een `iter_messages` vanaf het high-water mark (de nieuwste
+        `max_messages`), die daarna oudste eerst door `handle_new_message`
+        gaan. Signalen die ook nog live binnenkomen worden door de processed
+        index tegengehouden. Een channel zonder high-water mark (eerste start)
+        wordt overgeslagen: oude signalen worden niet alsnog uitgevoerd.
+        """
         for channel in self.channel_ids:
             try:
-                entity = await self.client.get_input_entity(channel)
-                logger.info(f"Forcing updates for: {', '.join(str(channel_id) for channel_id in self.channel_ids)}")
-                await self.client.catch_up()  # Synchronize session state
+                # gemiste berichten krijgen hetzelfde (marked) chat id als live berichten
+                recovered = await fetch_missed_messages(
+                    self.client, self.processed, channel, self.input_peers.get(channel), self.gap_recovery_limit
+                )
             except FloodWaitError as e:
-                logger.info(f"FloodWaitError: Waiting for {e.seconds} seconds before retrying...")
-                await asyncio.sleep(e.seconds)
-            except Exception as e:
-                logger.info(f"Error forcing update for {channel}: {e}")
+                logger.info("FloodWaitError during gap recovery of %s, skipping (%ss).", channel, e.seconds)
+                continue
+            except (ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError) as e:
+                logger.info("Gap recovery of %s failed: %s", channel, e)
+                continue
+            if not recovered:
+                continue
+            logger.info("Recovering %d missed messages in %s from message %s.", len(recovered), channel,
+                        recovered[0].message.id)
+            if len(recovered) == self.gap_recovery_limit:
+                logger.warning("Gap recovery of %s reached the limit of %d messages.", channel, self.gap_recovery_limit)
+            for event in recovered:
+                if not event.message.text:
+                    self.processed.mark_seen(event.chat_id, event.message.id)
+                    continue
+                try:
+                    await self.handle_new_message(event)
+                except Exception as e:
+                    logger.error("Recovered message %s in %s failed: %s", event.message.id, channel, e)
+
+    def resolve_referenced_signal(self, event):
+        """Ref nummer van het signaal waar een update bij hoort.
+
+        Meestal is de update een reply op het signaal; anders het laatst
+        verwerkte signaal in hetzelfde channel.
+        """
+        replyTo = getattr(event.message, 'reply_to_msg_id', None)
+        if replyTo:
+            ref_number = self.processed.get(event.chat_id, replyTo)
+            if ref_number:
+                return ref_number
+        return self.processed.latest_ref(event.chat_id)
+
+    async def adjust_stop_losses(self, event, parser, message, ref_number=None):
+        channelNameStripped = parser.channel_name
+        ref_number = ref_number or self.resolve_referenced_signal(event)
+        if ref_number is None:
+            logger.info("No signal found to adjust for a stop loss update in %s.", channelNameStripped,
+                        extra={'channel': channelNameStripped, 'stage': 'modify'})
+            return
+        if self.account_pool:
+            # de worker processen voeren (nog) alleen nieuwe signalen uit
+            logger.warning("Stop loss updates are not forwarded to the account workers, %s is not adjusted.",
+                           ref_number, extra={'ref': ref_number, 'channel': channelNameStripped, 'stage': 'modify'})
+            return
+        try:
+            stopLoss = parser.parse_stop_loss_update(message)
+        except ValueError as e:
+            # liever niets aanpassen dan een verkeerd niveau naar MT5 sturen
+            logger.info("Stop loss update for %s not applied: %s", ref_number, e,
+                        extra={'ref': ref_number, 'channel': channelNameStripped, 'stage': 'modify'})
+            self.send_bot_message(f"SL {ref_number}: no unambiguous level in the update, nothing adjusted.")
+            return
+        summary = await self.tradingbot.adjust_positions(
+            ref_number, stop_loss=tradingbot.BREAK_EVEN if stopLoss is None else stopLoss,
+            retries=self.stop_loss_update.get('retries', 2),
+            retry_delay=self.stop_loss_update.get('retry_delay', 0.25),
+            max_stop_distance=self.stop_loss_update.get('max_distance', 0.05)
+        )
+        self.send_bot_message(
+            f"SL {ref_number}: {summary['modified']}/{summary['legs']} legs adjusted, "
+            f"{len(summary['failed'])} failed ({summary['elapsed'] * 1000:.0f} ms)."
+        )
+
+    def register_metrics(self, registry):
+        """Metrics van de monitor; de endpoint zelf wordt (optioneel) in main gestart."""
+        self.messages_received = registry.counter(
+            'messages_received_total', 'Ontvangen berichten per channel.', ('channel',)
+        )
+        self.parse_failures = registry.counter(
+            'parse_failures_total', 'Berichten die geen signaal of update zijn, per channel en reden.', ('channel', 'reason')
+        )
+        registry.gauge('queue_depth', 'Aantal items in de interne queues.', ('queue',), callback=self.queue_depths)
+        registry.gauge('tick_age_seconds', 'Leeftijd van de laatste tick per symbool.', ('symbol',), callback=self.tick_ages)
+        registry.gauge('signals_in_flight', 'Symbolen met een signaal in de sizing of execution stage.',
+                       callback=lambda: len(self.pipeline.gate.in_flight()))
+        registry.add_collector('latency', self.collect_latencies)
+
+    def queue_depths(self):
+        depths = {stage.name: stage.depth() for stage in self.pipeline.stages}
+        depths['notifier'] = self.notifier.queue_depth
+        if manage_shelve.writer is not None:
+            depths['write_behind'] = manage_shelve.writer.queue_depth
+        return depths
+
+    @staticmethod
+    def tick_ages():
+        store = TickStore.get_store()
+        return {symbol: store.age(symbol) for symbol in store.symbols()}
+
+    def collect_latencies(self):
+        lines = latency_summary(
+            'signal_stage_seconds', 'Duur per stage van een signaal, uit de latency traces.',
+            [((('channel', channel), ('stage', stage)), histogram)
+             for (channel, stage), histogram in list(self.tracer.histograms.items())]
+        )
+        lines += latency_summary(
+            'pipeline_stage_seconds', 'Tijd in de handler per pipeline stage.',
+            [((('stage', stage.name),), stage.handler_time) for stage in self.pipeline.stages]
+        )
+        lines += latency_summary(
+            'pipeline_queue_seconds', 'Wachttijd in de queue per pipeline stage.',
+            [((('stage', stage.name),), stage.queue_time) for stage in self.pipeline.stages]
+        )
+        return lines
+
+    def dump_latency_traces(self):
+        if self.latency_dump_file:
+            self.tracer.dump(self.latency_dump_file, extra={'pipeline': self.pipeline.stats()})
+
+    async def force_update(self):
+        """Force updates for all configured channels."""
+        # catch_up synchroniseert de hele sessie, een keer is genoeg voor alle channels;
+        # de channels zelf staan al in de entity cache en hoeven niet opnieuw te worden opgezocht
+        try:
+            logger.info("Forcing updates for: %s", ', '.join(str(channel_id) for channel_id in self.channel_ids))
+            await self.client.catch_up()  # Synchronize session state
+        except FloodWaitError as e:
+            logger.info("FloodWaitError: Waiting for %s seconds before retrying...", e.seconds)
+            await asyncio.sleep(e.seconds)
+        except Exception as e:
+            logger.info("Error forcing updates: %s", e)
 
     async def start_monitoring(self):
-        await self.client.start()
-        dialogs = await self.client.get_dialogs() # refresh/update cache
-        logger.info(f"Monitoring channels: {', '.join(str(channel_id) for channel_id in self.channel_ids)}")
+        await self.connect()
+        await self.monitor()
+
+    async def connect(self, timer=None):
+        """Verbindt met Telegram en zoekt alleen de geconfigureerde channels op."""
+        timer = timer or StartupTimer()
+        with timer.measure('telegram_connect'):
+            await self.client.start()
+        with timer.measure('notifier'):
+            await self.notifier.start()
+        with timer.measure('processed_index'):
+            self.processed.load()
+        with timer.measure('resolve_channels'):
+            self.entities.load()
+            await self.resolve_channels()
+
+    async def resolve_channels(self):
+        """Haalt de input peers van de gevolgde channels uit de entity cache.
+
+        Alleen channels die niet in de cache staan worden bij Telegram
+        opgezocht. Staat een channel ook niet in de sessie van Telethon,
+        bijvoorbeeld bij de eerste start met een nieuwe sessie, dan worden
+        eenmalig de dialogs opgehaald.
+        """
+        missing = []
+        for channel in self.channel_ids:
+            peer = self.entities.input_peer(channel)
+            if peer is None:
+                missing.append(channel)
+            else:
+                self.input_peers[channel] = peer
+        if not missing:
+            return
+
+        results = await asyncio.gather(*(self.resolve_channel(channel) for channel in missing), return_exceptions=True)
+        unresolved = [channel for channel, result in zip(missing, results) if isinstance(result, Exception)]
+        if unresolved:
+            logger.info("Channels not in the session cache: %s, fetching dialogs.",
+                        ', '.join(str(channel) for channel in unresolved))
+            await self.client.get_dialogs()
+            for channel in unresolved:
+                await self.resolve_channel(channel)
+
+    async def resolve_channel(self, channel):
+        """Zoekt een channel op bij Telegram en legt de input peer en titel vast in de cache."""
+        entity = await self.client.get_entity(channel)
+        peer = telethon_utils.get_input_peer(entity)
+        self.entities.put(channel, peer, getattr(entity, 'title', None))
+        self.input_peers[channel] = peer
+        return peer
+
+    async def monitor(self):
+        logger.info("Monitoring channels: %s", ', '.join(str(channel_id) for channel_id in self.channel_ids))
 
         # Schedule periodic updates
         # sometimes the program halts and gets stuk in waiting for telegram
-        asyncio.create_task(self.periodic_force_update())
+        # (na een reconnect loopt de taak van de vorige verbinding nog)
+        if self.force_update_task is None or self.force_update_task.done():
+            self.force_update_task = asyncio.create_task(self.periodic_force_update())
+        # de pipeline draait door over reconnects heen
+        self.pipeline.start()
 
         # just force tradingbot to start 
         # self.tb.start_process()
 
         async with self.client:
-            for channel in self.channel_ids:
-                await self.client.get_input_entity(channel)
-
-            self.client.add_event_handler(self.handle_new_message, events.NewMessage(chats=self.channel_ids))
-            self.client.add_event_handler(self.handle_edited_message, events.MessageEdited(chats=self.channel_ids))
+            # met de input peers hoeft Telethon de channels niet zelf meer op te zoeken
+            chats = [self.input_peers.get(channel, channel) for channel in self.channel_ids]
+            self.client.add_event_handler(self.handle_new_message, events.NewMessage(chats=chats))
+            self.client.add_event_handler(self.handle_edited_message, events.MessageEdited(chats=chats))
 
-            # Houd de hoofdloop actief en controleer de vlag
-            while self.is_running:
-                await asyncio.sleep(1)
+            try:
+                # pas na het registreren van de handlers, zodat er tussen de gap en live geen bericht wegvalt
+                await self.recover_gaps()
+                # Houd de hoofdloop actief en controleer de vlag
+                while self.is_running:
+                    await asyncio.sleep(1)
+                    if self.is_running and not self.client.is_connected():
+                        # Telethon heeft zelf opgegeven, de supervisor verbindt opnieuw
+                        raise ConnectionError('Telegram connection lost')
+            finally:
+                # bij een reconnect worden de handlers opnieuw geregistreerd
+                self.client.remove_event_handler(self.handle_new_message)
+                self.client.remove_event_handler(self.handle_edited_message)
 
     async def periodic_force_update(self, interval=900):
         """Periodically force updates every `interval` seconds."""
         while self.is_running:  # Controleer de vlag
             await asyncio.sleep(interval)
             await self.force_update()
+            self.pipeline.log_stats()
 
     async def graceful_shutdown(self):
         """Zorg voor een nette afsluiting."""
         print("Shutting down TelegramTrader...")
         self.is_running = False  # Zet de vlag op False
-        self.mt5.shutdown()
+        self.pipeline.log_stats()
+        await self.pipeline.stop()
+        if self.account_pool:
+            self.account_pool.stop()
+        else:
+            self.mt5.shutdown()
 
+        # openstaande records wegschrijven voordat het proces stopt
+        manage_shelve.stop_write_behind()
+        self.dump_latency_traces()
+        await self.notifier.stop()
         await self.client.disconnect()  # Ontkoppel de Telegram-client
         print("Client disconnected. Goodbye!")
 
@@ -0,0 +1,189 @@
+import contextlib
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+import logger_setup
+
+logger = logger_setup.LoggerSingleton.get_logger()
+
+class LatencyHistogram:
+    """Histogram met logaritmische buckets (ca. 5% breed) voor latencies in seconden.
+
+    Geheugengebruik is begrensd door het aantal buckets, niet door het aantal
+    metingen, zodat het histogram de hele looptijd van de bot mee kan.
+    """
+    MIN_VALUE = 0.0001  # 0.1 ms
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        value = max(value, 0.0)
+        if value <= self.MIN_VALUE:
+            index = 0
+        else:
+            index = int(math.log(value / self.MIN_VALUE) / math.log(self.GROWTH)) + 1
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def bucket_upper_bound(self, index):
+        return self.MIN_VALUE * self.GROWTH ** index
+
+    def percentile(self, percentage):
+        if self.count == 0:
+            return None
+        rank = math.ceil(self.count * percentage / 100)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.bucket_upper_bound(index), self.max)
+        return self.max
+
+    def summary(self):
+        if self.count == 0:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean_ms': round(1000 * self.total / self.count, 3),
+            'p50_ms': round(1000 * self.percentile(50), 3),
+            'p95_ms': round(1000 * self.percentile(95), 3),
+            'p99_ms': round(1000 * self.percentile(99), 3),
+            'max_ms': round(1000 * self.max, 3),
+        }
+
+class SignalTrace:
+    """Tijdstempels van een enkel bericht door de stages van de bot.
+
+    De eerste stage, 'telegram', is de tijd tussen `message.date` en het
+    binnenkomen in de handler (wall clock, seconde resolutie van Telegram).
+    De overige stages meten de tijd sinds de vorige stage met een monotone klok.
+    """
+
+    def __init__(self, chat_id, message_id, message_date=None):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.ref_number = None
+        self.started_wall = time.time()
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.stages = []
+        if message_date is not None:
+            self.stages.append(('telegram', max(self.started_wall - message_date.timestamp(), 0.0)))
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+
+    @property
+    def total(self):
+        return self.last - self.started
+
+    def to_dict(self):
+        return {
+            'chat_id': self.chat_id,
+            'message_id': self.message_id,
+            'ref_number': self.ref_number,
+            'started': self.started_wall,
+            'stages_ms': [(stage, round(duration * 1000, 3)) for stage, duration in self.stages],
+            'total_ms': round(self.total * 1000, 3),
+        }
+
+class LatencyTracer:
+    """Verzamelt signal traces in histogrammen per stage en per channel."""
+    _instance = None
+
+    def __init__(self, max_traces=500):
+        self.histograms = {}
+        self.recent_traces = deque(maxlen=max_traces)
+
+    @staticmethod
+    def get_tracer():
+        if LatencyTracer._instance is None:
+            LatencyTracer._instance = LatencyTracer()
+        return LatencyTracer._instance
+
+    def start(self, chat_id, message_id, message_date=None):
+        return SignalTrace(chat_id, message_id, message_date)
+
+    def histogram(self, channel, stage):
+        key = (channel, stage)
+        if key not in self.histograms:
+            self.histograms[key] = LatencyHistogram()
+        return self.histograms[key]
+
+    def finish(self, trace):
+        """Legt een afgeronde trace vast, per channel en over alle channels samen."""
+        for channel in (trace.chat_id, 'all'):
+            for stage, duration in trace.stages:
+                self.histogram(channel, stage).record(duration)
+            self.histogram(channel, 'handler_total').record(trace.total)
+        self.recent_traces.append(trace)
+        if logger.isEnabledFor(logging.INFO):
+            # de stages alleen opmaken als de regel ook gelogd wordt, dit draait voor ieder signaal
+            logger.info("Latency trace for message %s (%s): %s", trace.message_id, trace.ref_number,
+                        ', '.join(f'{stage} {duration * 1000:.1f} ms' for stage, duration in trace.stages))
+
+    def summary(self):
+        summary = {}
+        for (channel, stage), histogram in sorted(self.histograms.items(), key=lambda item: str(item[0])):
+            summary.setdefault(str(channel), {})[stage] = histogram.summary()
+        return summary
+
+    def dump(self, path, extra=None):
+        with open(path, 'w') as dump_file:
+            json.dump({
+                'generated': time.time(),
+                'histograms': self.summary(),
+                'recent_traces': [trace.to_dict() for trace in self.recent_traces],
+                **(extra or {}),
+            }, dump_file, indent=2)
+        logger.info("Latency traces written to %s.", path)
+
+class StartupTimer:
+    """Duur van de opstartstappen, voor een breakdown in de log na een (her)start.
+
+    Stappen kunnen tegelijk in verschillende threads lopen (MT5 in de MT5
+    thread, Telegram in de event loop); de breakdown toont per stap het
+    begin ten opzichte van de start van het proces en de duur.
+    """
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.stages = []  # (stap, begin, duur) in seconden
+        self.lock = threading.Lock()
+
+    def record(self, stage, start, end=None):
+        end = time.perf_counter() if end is None else end
+        with self.lock:
+            self.stages.append((stage, start - self.started, end - start))
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, start)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        with self.lock:
+            stages = sorted(self.stages, key=lambda stage: stage[1])
+        return ', '.join(f"{stage} {duration * 1000:.0f} ms (at {offset * 1000:.0f} ms)"
+                         for stage, offset, duration in stages)
+
+    def log(self, what='Startup'):
+        logger.info("%s finished in %.0f ms: %s", what, self.elapsed() * 1000, self.summary())
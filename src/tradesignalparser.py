@@ -20,9 +20,38 @@ class TradeSignal:
                 f"stop_loss={self.stop_loss}, target_profits={self.target_profits}, ref_number={self.ref_number}), tp_level_hist={self.tp_level_hit}")
 
 class BaseTradeSignalParser:
+    channel_name = None
+
+    # patronen worden eenmalig bij het laden van de class gecompileerd
+    IMAGE_URL_PATTERN = re.compile(r'http[s]?://\S+\.(?:jpg|jpeg|png|gif)')
+    NON_ASCII_PATTERN = re.compile(r'[^\x00-\x7F]+')
+    # alleen een prijs direct na 'to', '@' of 'SL:'; geen pips, punten, procenten of een R:R verhouding
+    STOP_LOSS_LEVEL_PATTERN = re.compile(
+        r'(?:\bto\b|@|\bsl\s*:)\s*(\d+(?:\.\d+)?)(?![\d.:/]|\s*(?:pips?|points?|%|r\b))', re.IGNORECASE
+    )
+    BREAK_EVEN_PATTERN = re.compile(r'\b(?:break\s*-?\s*even|be|entry)\b', re.IGNORECASE)
+
     def parse_trade_signal(self, message):
         raise NotImplementedError("Subclasses should implement this method.")
 
+    def is_stop_loss_update(self, message):
+        """Geeft aan of een (niet-signaal) bericht een aanpassing van de stop loss aankondigt."""
+        return False
+
+    def parse_stop_loss_update(self, message):
+        """Nieuwe stop loss uit een update bericht, of None voor break-even (de open prijs).
+
+        Geeft een ValueError als het bericht geen eenduidig niveau noemt,
+        bijvoorbeeld 'Adjust SL +30 pips' of 'move sl 1:1'; zo'n update
+        wordt niet uitgevoerd.
+        """
+        match = self.STOP_LOSS_LEVEL_PATTERN.search(message)
+        if match:
+            return float(match.group(1))
+        if self.BREAK_EVEN_PATTERN.search(message):
+            return None
+        raise ValueError(f"No stop loss level found: {message}")
+
     def _prefix_reference_number(self, referenceNumber: str) -> str:
         # Haal de huidige datum en tijd op
         now = datetime.now()
@@ -44,10 +73,10 @@ class BaseTradeSignalParser:
 
     def clean_message(self, message):
         # Remove image URLs (assuming they start with http or https)
-        message = re.sub(r'http[s]?://\S+\.(?:jpg|jpeg|png|gif)', '', message)
+        message = self.IMAGE_URL_PATTERN.sub('', message)
 
         # Remove any non-ASCII characters (or specify a different character set if needed)
-        message = re.sub(r'[^\x00-\x7F]+', '', message)
+        message = self.NON_ASCII_PATTERN.sub('', message)
 
         # Optionally, you can also strip leading/trailing whitespace
         return message.strip()
@@ -57,6 +86,17 @@ class BaseTradeSignalParser:
         pass
 
 class TradeSignalParser1000PipBuilder(BaseTradeSignalParser):
+    channel_name = "Forex Signals - 1000 pip Builder"
+
+    # Regex pattern for 6 uppercase letters followed by 'long' or 'short'
+    FIRST_LINE_PATTERN = re.compile(r'^\s*([A-Z]{6})\s+(Long|Short)\s*$', re.IGNORECASE)
+
+    def is_stop_loss_update(self, message):
+        return message.startswith('The 1:1 Risk:Reward Target has been reached')
+
+    def parse_stop_loss_update(self, message):
+        # na het bereiken van 1:1 gaat de stop loss naar break-even
+        return None
 
     def parse_trade_signal(self, message):
 
@@ -68,8 +108,7 @@ class TradeSignalParser1000PipBuilder(BaseTradeSignalParser):
 
         # Check the first line for the forex symbol and trade direction
         firstLine = lines[0]
-        pattern = r'^\s*([A-Z]{6})\s+(Long|Short)\s*$'  # Regex pattern for 6 uppercase letters followed by 'long' or 'short'
-        match = re.match(pattern, firstLine, re.IGNORECASE)
+        match = self.FIRST_LINE_PATTERN.match(firstLine)
 
         if not match:
             raise ValueError("Invalid trade signal format: first line must contain a valid forex symbol and trade direction")
@@ -108,6 +147,14 @@ class TradeSignalParser1000PipBuilder(BaseTradeSignalParser):
         return TradeSignal(forexSymbol, tradeDirection, open_price, stop_loss, target_profits, ref_number, tp_level_hit)
 
 class GTMO(BaseTradeSignalParser):
+    channel_name = "GTMO VIP"
+
+    # find two decimals (entry prices) separated by dash
+    PRICE_RANGE_PATTERN = re.compile(r"\b(\d+(?:\.\d{1,3})?)\s{0,2}-\s{0,2}(\d+(?:\.\d{1,3})?)\b")
+
+    def is_stop_loss_update(self, message):
+        return message.lower().startswith('adjust sl')
+
     def parse_trade_signal(self, message):
         lines = [line.strip() for line in message.strip().split('\n') if line.strip()]
         
@@ -124,9 +171,7 @@ class GTMO(BaseTradeSignalParser):
         direction = "Buy" if "buy" in first_line else "Sell"
         forexSymbol = "XAUUSD"  # Aangenomen dat dit altijd zo is voor goud
 
-        # find two decimals (entry prices) separated by dash
-        pattern = r"\b(\d+(?:\.\d{1,3})?)\s{0,2}-\s{0,2}(\d+(?:\.\d{1,3})?)\b"
-        match = re.search(pattern, first_line)    
+        match = self.PRICE_RANGE_PATTERN.search(first_line)
 
         if match:
             signal_bid = match.group(1)
@@ -171,14 +216,79 @@ class GTMO(BaseTradeSignalParser):
 
         return TradeSignal(forexSymbol, direction, open_price, stop_loss, target_profits, ref_number, tp_level_hit)
 
+PARSER_CLASSES = {
+    parser_class.__name__: parser_class
+    for parser_class in (TradeSignalParser1000PipBuilder, GTMO)
+}
+PARSERS_BY_CHANNEL_NAME = {
+    parser_class.channel_name: parser_class
+    for parser_class in PARSER_CLASSES.values()
+}
+_parser_instances = {}
+
+def _get_parser_instance(parser_class):
+    # parsers hebben geen state, een instantie per class is voldoende
+    if parser_class not in _parser_instances:
+        _parser_instances[parser_class] = parser_class()
+    return _parser_instances[parser_class]
+
 # Factory function to get the appropriate parser
 def get_parser(channelName):
-    if channelName == "Forex Signals - 1000 pip Builder":
-        return TradeSignalParser1000PipBuilder()
-    elif channelName == "GTMO VIP":
-        return GTMO()
-    else:
+    parser_class = PARSERS_BY_CHANNEL_NAME.get(channelName)
+    if parser_class is None:
         raise ValueError("Unknown channel name")
+    return _get_parser_instance(parser_class)
+
+def parse_failure_reason(error):
+    """Korte, vaste reden van een mislukte parse, bruikbaar als metrics label.
+
+    Het deel na de laatste dubbele punt bevat vaak de regel uit het bericht
+    en wordt weggelaten.
+    """
+    parts = [part.strip() for part in str(error).split(':')]
+    if len(parts) > 1 and parts[0] == 'Invalid trade signal format':
+        return parts[1]
+    return parts[0] or 'unknown'
+
+class ParserRegistry:
+    """Koppelt numerieke chat ids eenmalig aan een parser.
+
+    Wordt bij het opstarten opgebouwd uit de `channels` config. Per channel
+    bepaalt de optionele sleutel `parser` (bijv. "GTMO") welke parser wordt
+    gebruikt, anders wordt de `title` van het channel gebruikt. Omdat op id
+    wordt gezocht blijft een hernoemd channel gewoon werken.
+    """
+
+    def __init__(self, channels):
+        self.parsers = {}
+        for channel in channels:
+            parser = self.resolve_parser(channel)
+            for chat_id in self.get_chat_ids(channel['id']):
+                self.parsers[chat_id] = parser
+
+    @staticmethod
+    def resolve_parser(channel):
+        parser_name = channel.get('parser')
+        if parser_name:
+            parser_class = PARSER_CLASSES.get(parser_name)
+            if parser_class is None:
+                raise ValueError(f"Unknown parser '{parser_name}' for channel {channel['id']}")
+            return _get_parser_instance(parser_class)
+        return get_parser(channel.get('title'))
+
+    @staticmethod
+    def get_chat_ids(channel_id):
+        # Telethon gebruikt voor channels het 'marked' id (-100 + id)
+        channel_id = int(channel_id)
+        if channel_id > 0:
+            return [channel_id, -1000000000000 - channel_id]
+        return [channel_id]
+
+    def get(self, chat_id):
+        parser = self.parsers.get(chat_id)
+        if parser is None:
+            raise ValueError(f"No parser registered for chat id {chat_id}")
+        return parser
 
 # Example usage
 if __name__ == '__main__':
@@ -1,21 +1,32 @@
 import logging
 import time
+import asyncio
 import pdb
 import logger_setup
 import manage_shelve
 from strategy import Strategy
-from mt5handler import MT5Handler
-import MetaTrader5 as mt5
+from mt5handler import AccountSnapshot, MT5Handler
+from ratelimiter import OrderRateLimiter
+from exposure import ExposureBook
 
 logger = logger_setup.LoggerSingleton.get_logger()
 
+# stop loss waarde voor `adjust_positions`: iedere leg naar zijn eigen open prijs
+BREAK_EVEN = 'break-even'
+
+class PercentageList(list):
+    """Lijst die pas bij het loggen als '1.23%, 4.56%' wordt weergegeven."""
+
+    def __str__(self):
+        return ", ".join(f"{value:.2f}%" for value in self)
+
 class PositionSize:
 
     def calculate_position_size(self, lot_size, account_equity, strategy, stop_loss_price, eur_base_price, 
                     symbol_price):
         stopLossPips = round(abs(symbol_price - float(stop_loss_price)), 5)
         stopLossPipsEur = stopLossPips / eur_base_price
-        logger.info(f'Stop Losses:\nstoploss: {round(stopLossPips, 5)}\nstoploss in EUR: {round(stopLossPipsEur, 5)}')
+        logger.info('Stop Losses:\nstoploss: %s\nstoploss in EUR: %s', round(stopLossPips, 5), round(stopLossPipsEur, 5))
 
         if strategy.useFixedRiskAmount:
             riskLevelAmount = round(strategy.fixedRiskAmount / stopLossPipsEur / lot_size, 2)
@@ -24,22 +35,187 @@ class PositionSize:
         
         return riskLevelAmount
 
+class OrderPlan:
+    """Uitkomst van de sizing stage: alles wat nodig is om de orders van een signaal te plaatsen."""
+
+    def __init__(self, tradeSignal, strategy, price, bidEURBase, accountInfo, lot_size, positionSize, newRisk, key=None):
+        self.tradeSignal = tradeSignal
+        self.strategy = strategy
+        self.price = price
+        self.bidEURBase = bidEURBase
+        self.accountInfo = accountInfo
+        self.lot_size = lot_size
+        self.positionSize = positionSize  # lijst, een size per leg
+        self.newRisk = newRisk
+        self.key = key  # sleutel van de order resultaten, zie `manage_shelve.order_key`
+
 class ProcessTradeSignal:
     log_width = 30
 
-    def __init__(self, mt5):
-        self.mt5handler = MT5Handler(mt5)
+    def __init__(self, mt5, order_limiter=None, mt5handler=None, exposure_book=None):
+        self.mt5handler = mt5handler or MT5Handler(mt5)
         self.positionSizer = PositionSize()
+        # een limiter die gedeeld wordt door alle signalen en alle channels
+        self.orderLimiter = order_limiter or OrderRateLimiter.get_limiter()
+        # open risico van het account, voor de portfolio heat check
+        self.exposureBook = exposure_book or ExposureBook.get_book()
 
-    def adjust_positions(self, position_attribute_type):
+    async def adjust_positions(self, ref_number, stop_loss=None, take_profits=None, retries=2, retry_delay=0.25,
+                               max_stop_distance=0.05):
+        """Verplaatst de SL (en eventueel de TP) van alle open legs van een signaal.
+
+        Parameters
+        ----------
+        ref_number: str
+            Ref nummer van het signaal; de legs hebben als comment `ref_number`
+            of `ref_number_<leg>`.
+
+        stop_loss: float or BREAK_EVEN, optional
+            Nieuwe stop loss. Met BREAK_EVEN gaat iedere leg naar zijn eigen
+            open prijs, zonder stop loss blijft de SL van iedere leg staan.
+
+        take_profits: list, optional
+            Nieuwe target profits, een per leg zoals bij het plaatsen van de
+            orders: leg `_N` krijgt de N-de waarde, een enkele positie de
+            laatste. Zonder take profits blijft de TP van iedere leg staan.
+
+        retries: int, optional
+            Aantal extra pogingen per leg bij een mislukte aanpassing.
+
+        max_stop_distance: float, optional
+            Maximale afstand van een nieuwe stop loss tot de open prijs van de
+            leg, als fractie. Een stop loss aan de verkeerde kant van de koers
+            of verder weg wordt niet naar MT5 gestuurd; die leg telt als failed.
+
+        De TRADE_ACTION_SLTP requests van alle legs worden tegelijk ingepland en
+        gedoseerd door dezelfde limiter als de orders.
+
+        Returns
+        -------
+        dict
+            Aantallen modified, unchanged en de tickets die failed zijn, plus
+            de totale tijd in seconden (elapsed).
         """
-        Based on the position attribute (SL or TP), adjust
-        the corresponding attribute.
+        started = time.perf_counter()
+        positions = await self.mt5handler.run(self.mt5handler.get_positions, None, ref_number)
+        summary = {'ref': ref_number, 'legs': len(positions), 'modified': 0, 'unchanged': 0, 'failed': []}
+        if not positions:
+            logger.info('No open positions found for %s, nothing to adjust.', ref_number,
+                        extra={'ref': ref_number, 'stage': 'modify'})
+            summary['elapsed'] = time.perf_counter() - started
+            return summary
+
+        eurRates = {}
+        for position in positions:
+            quoteCurrency = position.symbol[-3:]
+            if quoteCurrency not in eurRates:
+                eurRates[quoteCurrency] = 1.0 if quoteCurrency == 'EUR' else await self.mt5handler.run(
+                    self.get_bid_eur_base, quoteCurrency
+                )
+
+        outcomes = await asyncio.gather(*(
+            self.adjust_leg(position, stop_loss, take_profits, eurRates[position.symbol[-3:]], retries, retry_delay,
+                            max_stop_distance)
+            for position in positions
+        ))
+        for position, outcome in zip(positions, outcomes):
+            if outcome is None:
+                summary['failed'].append(position.ticket)
+            else:
+                summary[outcome] += 1
+        # de snapshot bevat nog de oude SL en TP
+        self.mt5handler.accountSnapshot.invalidate()
+        summary['elapsed'] = time.perf_counter() - started
+
+        logger.info('Adjusted %d/%d legs of %s (%d unchanged, %d failed) in %.1f ms.',
+                    summary['modified'], len(positions), ref_number, summary['unchanged'], len(summary['failed']),
+                    summary['elapsed'] * 1000, extra={'ref': ref_number, 'stage': 'modify'})
+        return summary
+
+    async def adjust_leg(self, position, stop_loss, take_profits, eurRate, retries, retry_delay, max_stop_distance=0.05):
+        """Past een leg aan. Geeft 'modified', 'unchanged' of None (mislukt) terug."""
+        digits = self.mt5handler.get_digts(position.symbol)
+        if stop_loss == BREAK_EVEN:
+            newStopLoss = round(position.price_open, digits)
+        else:
+            newStopLoss = round(position.sl if stop_loss is None else stop_loss, digits)
+        if stop_loss not in (None, BREAK_EVEN):
+            reason = self.implausible_stop_loss(position, newStopLoss, max_stop_distance)
+            if reason:
+                logger.info('Stop loss %s for %s rejected: %s.', newStopLoss, position.comment, reason,
+                            extra={'ref': position.comment, 'stage': 'modify'})
+                return None
+        newTakeProfit = round(position.tp, digits)
+        if take_profits:
+            leg = AccountSnapshot.leg_number(position.comment)
+            newTakeProfit = round(take_profits[leg - 1] if leg and leg <= len(take_profits) else take_profits[-1], digits)
+        if round(position.sl, digits) == newStopLoss and round(position.tp, digits) == newTakeProfit:
+            return 'unchanged'
+
+        for attempt in range(retries + 1):
+            await self.orderLimiter.acquire()
+            result = await self.mt5handler.run(self.mt5handler.modify_position, position, newStopLoss, newTakeProfit)
+            if result is not None and result.retcode == self.mt5handler.mt5.TRADE_RETCODE_DONE:
+                self.exposureBook.add(position.ticket, position.symbol, ExposureBook.position_risk(
+                    position.volume, self.mt5handler.get_contract_size(position.symbol), position.price_open,
+                    newStopLoss, eurRate
+                ))
+                return 'modified'
+            if result is not None and result.retcode in (self.mt5handler.mt5.TRADE_RETCODE_INVALID_STOPS,
+                                                         self.mt5handler.mt5.TRADE_RETCODE_POSITION_CLOSED):
+                # opnieuw proberen helpt hier niet
+                logger.info('Modification of %s rejected, retcode=%s.', position.comment, result.retcode,
+                            extra={'ref': position.comment, 'stage': 'modify'})
+                return None
+            if attempt < retries:
+                await asyncio.sleep(retry_delay * (attempt + 1))
+        logger.info('Modification of %s failed after %d attempts.', position.comment, retries + 1,
+                    extra={'ref': position.comment, 'stage': 'modify'})
+        return None
+
+    def start_order_entry_process(self, tradeSignal, strategy, trace=None):
+        """Synchrone variant van `start_order_entry_process_async` voor gebruik
+        buiten een draaiende event loop (scripts, tests).
         """
-        pass
+        return asyncio.run(self.start_order_entry_process_async(tradeSignal, strategy, trace))
+
+    def implausible_stop_loss(self, position, stop_loss, max_distance):
+        """Reden waarom een nieuwe stop loss niet klopt voor een positie, of None.
+
+        De stop loss moet aan de verliezende kant van de huidige koers liggen
+        (bij een buy eronder, bij een sell erboven; zonder koers telt de open
+        prijs) en niet meer dan max_distance (fractie) van de open prijs af.
+        """
+        price = getattr(position, 'price_current', None) or position.price_open
+        if position.type == self.mt5handler.mt5.POSITION_TYPE_BUY and stop_loss >= price:
+            return f'not below the current price {price} of a buy'
+        if position.type != self.mt5handler.mt5.POSITION_TYPE_BUY and stop_loss <= price:
+            return f'not above the current price {price} of a sell'
+        distance = abs(stop_loss - position.price_open) / position.price_open
+        if max_distance is not None and distance > max_distance:
+            return f'{distance:.1%} from the open price {position.price_open} (max {max_distance:.1%})'
+        return None
+
+    async def start_order_entry_process_async(self, tradeSignal, strategy, trace=None, key=None):
+        """Bepaalt de positiegrootte en plaatst de (gesplitste) orders.
+
+        Als er een `SignalTrace` wordt meegegeven worden de stages price_fetched,
+        size_computed en per leg order_queued en order_send daarin vastgelegd.
+        De order resultaten worden onder `key` bewaard, zonder key onder het
+        ref number van het signaal.
+        """
+        plan = self.prepare_order_entry(tradeSignal, strategy, trace, key)
+        if plan is None:
+            return
+        return await self.execute_order_plan(plan, trace)
 
-    def start_order_entry_process(self, tradeSignal, strategy):
-        logger.info("Starting the order entry process.")
+    def prepare_order_entry(self, tradeSignal, strategy, trace=None, key=None):
+        """Sizing: haalt de prijzen en account gegevens op en bepaalt de size per leg.
+
+        Doet blokkerende MT5 calls; de signal pipeline draait dit in de MT5
+        thread. Geeft een `OrderPlan` terug, of None als er geen prijs is.
+        """
+        logger.info("Starting the order entry process.", extra={'ref': tradeSignal.ref_number, 'stage': 'order_entry'})
 
         baseCurrency = tradeSignal.forexSymbol[-3:]
         bidEURBase = self.get_bid_eur_base(baseCurrency)
@@ -49,13 +225,15 @@ class ProcessTradeSignal:
         price = self.get_trade_price(tradeSignal)
         if price is None:
             return
+        if trace:
+            trace.mark('price_fetched')
 
         accountInfo = self.mt5handler.get_account_info()
         lot_size = self.mt5handler.get_contract_size(tradeSignal.forexSymbol)
         min_volume_size = self.mt5handler.get_minimal_volume_size(tradeSignal.forexSymbol) 
 
         positionSize = self.calculate_position_size(lot_size, accountInfo, tradeSignal, strategy, bidEURBase, price)
-        logger.info(f'Original position size: {positionSize}')
+        logger.info('Original position size: %s', positionSize, extra={'ref': tradeSignal.ref_number, 'stage': 'size_computed'})
 
         if strategy.splitPositionSize:
             # we can only split if the position size is 'splittable'
@@ -68,14 +246,38 @@ class ProcessTradeSignal:
 
         if not isinstance(positionSize, list):
             positionSize = [positionSize]
+        if trace:
+            trace.mark('size_computed')
+
+        newRisk = ExposureBook.position_risk(sum(positionSize), lot_size, price, tradeSignal.stop_loss, bidEURBase)
+        return OrderPlan(tradeSignal, strategy, price, bidEURBase, accountInfo, lot_size, positionSize, newRisk, key)
+
+    async def execute_order_plan(self, plan, trace=None):
+        """Execution: heat check en het plaatsen van de orders van een `OrderPlan`.
+
+        De heat check en de reservering gebeuren zonder await ertussen, zodat
+        signalen die tegelijk worden uitgevoerd niet allebei door de check komen.
+        """
+        tradeSignal, strategy, price = plan.tradeSignal, plan.strategy, plan.price
+        bidEURBase, accountInfo, lot_size = plan.bidEURBase, plan.accountInfo, plan.lot_size
+        positionSize, newRisk = plan.positionSize, plan.newRisk
+
+        if not self.can_place_order(strategy, len(positionSize), accountInfo.equity, newRisk):
+            logger.info('Portfolio heat reached for %s: open risk %.2f + %.2f EUR exceeds %.1f%% of equity %s.',
+                        tradeSignal.ref_number, self.exposureBook.total, newRisk, strategy.portfolioheat * 100,
+                        accountInfo.equity, extra={'ref': tradeSignal.ref_number, 'stage': 'heat_check'})
+            return
 
-        if self.can_place_order(strategy, len(positionSize)):
-            is_single_position_size = len(positionSize) == 1
-            tpLevel = tradeSignal.target_profits[-1]
-            refNumber = tradeSignal.ref_number
-            orderResults = []
-            orderResultsDict = []
+        is_single_position_size = len(positionSize) == 1
+        tpLevel = tradeSignal.target_profits[-1]
+        refNumber = tradeSignal.ref_number
+        orderResults = []
+        orderResultsDict = []
 
+        # het risico vasthouden totdat de fills in de exposure book staan
+        reservation = object()
+        self.exposureBook.reserve(reservation, tradeSignal.forexSymbol, newRisk)
+        try:
             for index, size in enumerate(positionSize):
                 # Check for more than 1 position size
                 # if true, modify tpLevel and ref number
@@ -83,24 +285,44 @@ class ProcessTradeSignal:
                     tradeSignal.ref_number = f"{refNumber}_{index + 1}"
                     tpLevel = tradeSignal.target_profits[index]
 
-                placeOrderResult = self.place_order(tradeSignal, price, size, strategy, tpLevel)
-                time.sleep(0.4)  # Wacht om overbelasting van de server te voorkomen
+                # wacht op een token zonder de event loop te blokkeren, de eerste
+                # order gaat direct weg, volgende orders worden gedoseerd
+                queuedSeconds = await self.orderLimiter.acquire()
+                logger.info('Order %d/%d for %s queued %.1f ms.', index + 1, len(positionSize), tradeSignal.ref_number,
+                            queuedSeconds * 1000, extra={'ref': tradeSignal.ref_number, 'stage': 'order_queued'})
+                if trace:
+                    trace.mark('order_queued')
+                placeOrderResult = await self.mt5handler.run(self.place_order, tradeSignal, price, size, strategy, tpLevel)
+                if trace:
+                    trace.mark('order_send')
 
                 if placeOrderResult:
+                    legRisk = ExposureBook.position_risk(placeOrderResult.volume, lot_size, placeOrderResult.price,
+                                                         tradeSignal.stop_loss, bidEURBase)
+                    # het risico verhuist van de reservering naar de positie
+                    self.exposureBook.add(placeOrderResult.order, tradeSignal.forexSymbol, legRisk)
+                    self.exposureBook.consume(reservation, legRisk)
                     order_dict = placeOrderResult._asdict()
                     order_dict['request'] = placeOrderResult.request._asdict()
+                    order_dict['queued_seconds'] = queuedSeconds
                     orderResults.append(placeOrderResult)
                     orderResultsDict.append(order_dict)
                     # save the order result somewhere
+        finally:
+            self.exposureBook.release(reservation)
+            if orderResults:
+                # de snapshot bevat de nieuwe legs nog niet; een update direct na het signaal moet ze wel zien
+                self.mt5handler.accountSnapshot.invalidate()
+
+        # check zero prices
+        # orderResultsChecked = self.check_zero_prices(orderResults)
 
-            # check zero prices
-            # orderResultsChecked = self.check_zero_prices(orderResults)
+        self.log_order_summary(orderResults, tradeSignal, accountInfo, strategy, bidEURBase, lot_size)
 
-            self.log_order_summary(orderResults, tradeSignal, accountInfo, strategy, bidEURBase, lot_size)
+        # store the placed orders for future reference
+        manage_shelve.store_data(manage_shelve.TRADES_POSITIONS_DB, plan.key or refNumber, orderResultsDict)
 
-            # store the placed orders for future reference
-            key = int(time.time()) # epoch time
-            manage_shelve.store_data(manage_shelve.TRADES_POSITIONS_DB, str(key), orderResultsDict)
+        return orderResults
 
     def check_zero_prices(self, orderResults):
         pass
@@ -108,14 +330,14 @@ class ProcessTradeSignal:
     def get_bid_eur_base(self, baseCurrency: str) -> float:
         bidEURBasePrices = self.mt5handler.get_price("EUR" + baseCurrency)
         if not bidEURBasePrices:
-            logger.info(f"Error: Could not retrieve tick info for symbol EUR{baseCurrency}.")
+            logger.info("Error: Could not retrieve tick info for symbol EUR%s.", baseCurrency)
             return None
         return bidEURBasePrices[1]
 
     def get_trade_price(self, tradeSignal) -> float:
         bidaskPrice = self.mt5handler.get_price(tradeSignal.forexSymbol)
         if not bidaskPrice:
-            logger.info(f'Could not get prices for {tradeSignal.forexSymbol}.')
+            logger.info('Could not get prices for %s.', tradeSignal.forexSymbol)
             return None
         return bidaskPrice[1] if tradeSignal.tradeDirection == "Long" else bidaskPrice[0]
 
@@ -127,30 +349,33 @@ class ProcessTradeSignal:
             tradeSignal.stop_loss, bidEURBase, price
         )
 
-    def can_place_order(self, strategy: Strategy, multiplier: int=1) -> bool:
+    def can_place_order(self, strategy: Strategy, multiplier: int=1, equity: float=None, new_risk: float=0.0) -> bool:
         """Checks if portfolio is too hot, i.e. no more positions allowed
 
-        IMPORTANT: this function return True by default until a sufficient
-        enough portfolioheat checking mechanism is implemented.
+        The open risk comes from the exposure book, which is kept up to date
+        with our own fills and periodic reconciliation against the broker, so
+        this is a lookup and not a broker round trip.
 
         Parameters
         ----------
         strategy: Strategy
             The strategy that is used on the account. Is read from config.json
-            at app startup
+            at app startup. `portfolioheat` is the maximum open risk as a
+            fraction of the account equity.
 
         multiplier: int, optional
-            If position size is split into sub-position sizes we have to
-            multiply the number of allowed position in the portfolio
-            by the number of parts the position size was divided into.
-        """
+            Number of parts the position size was divided into. Only used
+            for logging, the risk of all parts is included in `new_risk`.
 
-        return True
+        equity: float, optional
+            Account equity. Without equity the check is skipped.
 
-        # as for the reason why the lines below are commented out
-        # please refer to the documentation of the function itself
-        # nrOpenPositions = self.mt5handler.get_open_positions()
-        # return (nrOpenPositions * strategy.risklevel) < multiplier * strategy.portfolioheat
+        new_risk: float, optional
+            Risk in EUR of the orders that are about to be placed.
+        """
+        if equity is None:
+            return True
+        return self.exposureBook.can_add(new_risk, equity, strategy.portfolioheat)
 
     def place_order(self, tradeSignal, price, positionSize, strategy, tp_level):
         """Places the order at the broker
@@ -182,31 +407,29 @@ class ProcessTradeSignal:
             if not isinstance(parts_count, int) or parts_count <= 0:
                 raise ValueError(f"Invalid parts_count: {parts_count}. Must be a positive integer.")
 
-            # Zorg dat het getal twee decimalen heeft
+            # Reken in centen (0.01 lot): het basisdeel en de afrondingsafwijking
+            # volgen direct uit de deling, zonder stapjes van 0.01 en sorteren
             number = round(number, 2)
+            cents = round(number * 100)
+            baseCents = round(round(number / parts_count, 2) * 100)
+            difference = cents - baseCents * parts_count
 
-            # Verdeel het getal in gelijke delen
-            base = round(number / parts_count, 2)
-
-            # Bereken de som van de basisdelen en de afwijking
-            parts = [base] * parts_count
-            difference = round(number - sum(parts), 2)
+            if largest_at_end:
+                centParts = [baseCents] * (parts_count - 1) + [baseCents + difference]
+                centParts.sort()
+            elif difference >= 0:
+                # het hele verschil gaat naar het eerste (grootste) deel
+                centParts = [baseCents + difference] + [baseCents] * (parts_count - 1)
+            else:
+                # de laatste delen worden ieder een cent kleiner
+                centParts = [baseCents] * (parts_count + difference) + [baseCents - 1] * -difference
 
-            # Wijs de afwijking toe aan delen
-            for i in range(abs(int(difference * 100))):
-                index = -1 if largest_at_end else 0
-                parts[index] += 0.01 if difference > 0 else -0.01
-                if not largest_at_end:
-                    parts.sort(reverse=True)
+            parts = [part / 100 for part in centParts]
 
             # Controleer of de som correct is
-            if round(sum(parts), 2) != number:
+            if sum(centParts) != cents:
                 raise ValueError("Rounding error: Sum of parts does not match original number.")
 
-            # Sorteer de delen indien nodig
-            if largest_at_end:
-                parts.sort()
-
             return parts
 
         except Exception as e:
@@ -217,6 +440,9 @@ class ProcessTradeSignal:
         if not orderResults:
             logger.info("No orders received, skip logging output.")
             return
+        if not logger.isEnabledFor(logging.INFO):
+            # de samenvatting dient alleen voor de log
+            return
         averagePrice = sum(result.price for result in orderResults) / len(orderResults)
         prices = [result.price for result in orderResults]
         volumes = [result.volume for result in orderResults]
@@ -235,18 +461,23 @@ class ProcessTradeSignal:
         netRR = [round((net_t / netAbsStoploss), 3) for net_t in netTargetProfits]
         averageRR = sum(netRR) / len(netRR) if netRR else 0
 
+        # lazy: de tekst wordt pas in de log listener samengesteld
         logger.info(
             'SUMMARY:\n'
-            f'Successfully placed {volumes} units of {tradeSignal.forexSymbol}.\n'
-            f'Account Balance: {accountInfo.balance}\n'
-            f'Account Equity: {accountInfo.equity}\n'
-            f'Average price: {averagePrice:.5f}\n'
-            f"Weighted average price: {weighted_average_price:.5f}\n"
-            f'Net positions risk: {", ".join(f"{positionRisk:.2f}%" for positionRisk in realPositionsRisk)}\n'
-            f'Net Risk Rewards: {netRR}\n'
-            f'Average Risk Reward: {averageRR:.2f}\n'
-            f'Net stop loss: {round(netAbsStoploss, 5)}\n'
-            f'Net stop loss (EUR): {round(netAbsStoplossEUR, 5)}\n'
+            'Successfully placed %s units of %s.\n'
+            'Account Balance: %s\n'
+            'Account Equity: %s\n'
+            'Average price: %.5f\n'
+            'Weighted average price: %.5f\n'
+            'Net positions risk: %s\n'
+            'Net Risk Rewards: %s\n'
+            'Average Risk Reward: %.2f\n'
+            'Net stop loss: %s\n'
+            'Net stop loss (EUR): %s\n',
+            volumes, tradeSignal.forexSymbol, accountInfo.balance, accountInfo.equity, averagePrice,
+            weighted_average_price, PercentageList(realPositionsRisk), netRR, averageRR,
+            round(netAbsStoploss, 5), round(netAbsStoplossEUR, 5),
+            extra={'ref': tradeSignal.ref_number, 'stage': 'order_summary'}
         )
 
 class OrderEntry():
@@ -267,6 +498,7 @@ class PositionSizing():
 
 if __name__ == '__main__':
 
+    import MetaTrader5 as mt5
     if not mt5.initialize():
         logger.info("initialize mt5 failed")
         mt5.shutdown()
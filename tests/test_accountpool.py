@@ -0,0 +1,97 @@
+import asyncio
+import importlib
+import queue
+import unittest
+from src import accountpool
+from src.accountpool import AccountPool, account_worker
+from src.tradesignalparser import TradeSignal
+
+def make_signal():
+    return TradeSignal('EURUSD', 'Long', open_price=1.0800, stop_loss=1.0750,
+                       target_profits=[1.0850, 1.0900, 1.0950], ref_number='EURUSD1.08', tp_level_hit=3)
+
+class TestAccountWorker(unittest.TestCase):
+
+    def setUp(self):
+        # de worker importeert de modules zoals een los proces dat doet
+        self.mt5 = importlib.import_module('mt5sim')
+        self.mt5.reset(balance=10000)
+        self.mt5.set_tick('EURUSD', 1.0800, 1.0801)
+        manage_shelve = importlib.import_module('manage_shelve')
+        manage_shelve.set_store(importlib.import_module('signalstore').SignalStore(':memory:'))
+        self.settings = {
+            'mt5_module': 'mt5sim', 'login': '1001', 'password': 'secret', 'server': 'Demo',
+            'strategy': {
+                'risklevel': 0.01, 'portfolioheat': 0.1, 'select_tp_level': 3, 'select_tp_level_explanation': '',
+                'split_position_size': True, 'use_fixed_risk_amount': True, 'fixed_risk_amount': 50
+            },
+            'symbols': ['EURUSD'], 'order_rate_limit': {'orders_per_second': 1000, 'burst': 10},
+            'symbol_cache_ttl': 3600, 'tick_feed': {'interval': 0.01}, 'persistence': {'flush_interval': 0.01},
+            'exposure': {}, 'account_snapshot': {'interval': 0.01},
+        }
+
+    def test_worker_places_orders_and_reports_fills(self):
+        jobs, results = queue.Queue(), queue.Queue()
+        jobs.put((1, make_signal()))
+        jobs.put(None)
+
+        account_worker('connection_1', self.settings, jobs, results)
+
+        self.assertEqual(results.get_nowait(), ('ready', 'connection_1', True, None))
+        kind, job_id, name, result = results.get_nowait()
+        self.assertEqual((kind, job_id, name), ('result', 1, 'connection_1'))
+        self.assertEqual(len(result['fills']), 3)
+        self.assertEqual(result['fills'][0]['comment'], 'EURUSD1.08_1')
+        # na het stoppen is de terminal afgesloten, dus direct in de simulator kijken
+        self.assertEqual(len(self.mt5.simulator.positions), 3)
+
+    def test_failed_login_is_reported(self):
+        self.mt5.simulator.fail_login = True
+        results = queue.Queue()
+
+        account_worker('connection_1', self.settings, queue.Queue(), results)
+
+        kind, name, ok, error = results.get_nowait()
+        self.assertFalse(ok)
+        self.assertIn('login failed', error)
+
+class TestAccountPool(unittest.TestCase):
+
+    def make_pool(self, order_timeout=1.0):
+        pool = AccountPool({'a': {}, 'b': {}}, order_timeout=order_timeout)
+        pool.ready = ['a', 'b']
+        pool.jobs = {'a': queue.Queue(), 'b': queue.Queue()}
+        return pool
+
+    def test_submit_collects_all_accounts(self):
+        pool = self.make_pool()
+
+        async def run():
+            task = asyncio.create_task(pool.submit(make_signal()))
+            await asyncio.sleep(0)
+            job_id, _ = pool.jobs['a'].get_nowait()
+            self.assertEqual(pool.jobs['b'].get_nowait()[0], job_id)
+            pool.deliver(job_id, 'a', {'fills': [], 'elapsed': 0.01})
+            pool.deliver(job_id, 'b', {'fills': [], 'elapsed': 0.02})
+            return await task
+
+        results = asyncio.run(run())
+        self.assertEqual(set(results), {'a', 'b'})
+        self.assertEqual(pool.pending, {})
+
+    def test_missing_account_times_out(self):
+        pool = self.make_pool(order_timeout=0.05)
+
+        async def run():
+            task = asyncio.create_task(pool.submit(make_signal()))
+            await asyncio.sleep(0)
+            job_id, _ = pool.jobs['a'].get_nowait()
+            pool.deliver(job_id, 'a', {'fills': [], 'elapsed': 0.01})
+            return await task
+
+        results = asyncio.run(run())
+        self.assertEqual(results['b'], {'error': 'timeout'})
+        self.assertIn('b: FAILED (timeout)', AccountPool.format_summary(make_signal(), results))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import random
+import unittest
+import numpy as np
+from src.batchsizing import BatchPositionSize
+from src.strategy import Strategy
+from src.tradingbot import PositionSize, ProcessTradeSignal
+
+class TestBatchPositionSize(unittest.TestCase):
+
+    def setUp(self):
+        self.batch = BatchPositionSize()
+        self.random = random.Random(7)
+
+    def test_position_sizes_match_scalar(self):
+        sizer = PositionSize()
+        rows = []
+        for _ in range(200):
+            price = self.random.uniform(0.5, 3000)
+            stop_loss = price * (1 + self.random.choice([-1, 1]) * self.random.uniform(0.001, 0.02))
+            rows.append((self.random.uniform(1000, 50000), self.random.choice([0.005, 0.01]), price, stop_loss,
+                         self.random.uniform(0.8, 170), self.random.choice([100, 100000]), self.random.random() < 0.5,
+                         self.random.uniform(10, 200)))
+        expected = [
+            sizer.calculate_position_size(lot, equity, Strategy(risk, 0.1, 3, '', True, fixed, amount), stop_loss, eur, price)
+            for equity, risk, price, stop_loss, eur, lot, fixed, amount in rows
+        ]
+        columns = list(zip(*rows))
+
+        sizes = self.batch.calculate_position_sizes(
+            np.array(columns[0]), np.array(columns[1]), np.abs(np.array(columns[2]) - np.array(columns[3])),
+            np.array(columns[4]), np.array(columns[5]), np.array(columns[6]), np.array(columns[7])
+        )
+
+        np.testing.assert_allclose(sizes, expected)
+
+    def test_split_matches_scalar(self):
+        processor = ProcessTradeSignal(None)
+        volumes = [round(self.random.uniform(0.1, 20), 2) for _ in range(500)] + [13.11, 9.09, 3.98, 18.42]
+        parts = [self.random.randint(1, 6) for _ in range(500)] + [6, 6, 4, 4]
+
+        legs = self.batch.split_volumes(volumes, parts, volume_min=0.01)
+
+        for row, (volume, count) in enumerate(zip(volumes, parts)):
+            expected = processor.split_position_size(volume, count)
+            np.testing.assert_allclose(legs[row, :count], expected, err_msg=f'{volume} in {count} parts')
+            self.assertTrue(np.all(legs[row, count:] == 0))
+
+    def test_minimum_volume_and_limits(self):
+        legs = self.batch.split_volumes([0.03, 1.0, 200.0], [4, 1, 2], volume_min=0.01, volume_max=[100, 100, 50])
+
+        # te klein om te splitsen: iedere leg het minimale volume
+        np.testing.assert_allclose(legs[0], [0.01, 0.01, 0.01, 0.01])
+        np.testing.assert_allclose(legs[1], [1.0, 0, 0, 0])
+        np.testing.assert_allclose(legs[2], [50, 50, 0, 0])
+
+    def test_size_legs_for_many_strategies(self):
+        strategies = [Strategy(0.01, 0.1, 3, '', True, True, 50), Strategy(0.02, 0.1, 3, '', False, False, 0)]
+        arrays = BatchPositionSize.strategy_arrays(strategies)
+
+        legs = self.batch.size_legs(
+            10000.0, arrays['risklevel'], 0.005, 1.08, 100000, 3,
+            arrays['use_fixed_risk_amount'], arrays['fixed_risk_amount'], arrays['split']
+        )
+
+        self.assertEqual(legs.shape, (2, 3))
+        np.testing.assert_allclose(legs[0], [0.04, 0.04, 0.03])
+        np.testing.assert_allclose(legs[1], [0.43, 0, 0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from collections import namedtuple
+from src import entitycache
+from src.entitycache import EntityCache
+
+# dezelfde modules als die de cache zelf gebruikt
+manage_shelve = entitycache.manage_shelve
+
+# dezelfde velden als de Telethon types
+InputPeerChannel = namedtuple('InputPeerChannel', ['channel_id', 'access_hash'])
+InputPeerSelf = namedtuple('InputPeerSelf', [])
+
+class TestEntityCache(unittest.TestCase):
+
+    def setUp(self):
+        self.store = manage_shelve.SignalStore(':memory:')
+        manage_shelve.set_store(self.store)
+
+    def test_survives_restart(self):
+        EntityCache().put(-1001234, InputPeerChannel(1234, 987654321), 'GTMO VIP')
+
+        cache = EntityCache()
+        cache.load()
+
+        self.assertEqual(cache.get(-1001234), ('InputPeerChannel', 1234, 987654321, 'GTMO VIP'))
+        self.assertIsNone(cache.get(-1005678))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_title_update_keeps_peer(self):
+        cache = EntityCache()
+        cache.put(-1001234, InputPeerChannel(1234, 987654321), 'GTMO VIP')
+
+        self.assertFalse(cache.update_title(-1001234, 'GTMO VIP'))
+        self.assertTrue(cache.update_title(-1001234, 'GTMO VIP Gold'))
+        cache.put(-1001234, InputPeerChannel(1234, 987654321))
+
+        self.assertEqual(self.store.get_channel_entities()[-1001234][3], 'GTMO VIP Gold')
+
+    def test_invalidate_and_unsupported_peer(self):
+        cache = EntityCache()
+        cache.put(-1001234, InputPeerChannel(1234, 987654321), 'GTMO VIP')
+        cache.invalidate(-1001234)
+
+        self.assertFalse(cache.put(1, InputPeerSelf()))
+        self.assertEqual(self.store.get_channel_entities(), {})
+        self.assertIsNone(cache.input_peer(-1001234))
+
+if __name__ == '__main__':
+    unittest.main()
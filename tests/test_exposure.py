@@ -0,0 +1,129 @@
+import asyncio
+import time
+import unittest
+from src import mt5sim, tradingbot
+from src.exposure import ExposureBook
+from src.mt5handler import MT5Handler, SymbolSpecCache, TickStore
+from src.ratelimiter import TokenBucket
+from src.strategy import Strategy
+from src.tradesignalparser import TradeSignal
+from src.tradingbot import ProcessTradeSignal
+
+class TestExposureBook(unittest.TestCase):
+
+    def test_risk_per_symbol_currency_and_total(self):
+        book = ExposureBook()
+        book.add(1, 'EURUSD', 50.0)
+        book.add(2, 'GBPUSD', 30.0)
+        book.add(3, 'XAUUSD', 20.0)
+
+        self.assertEqual(book.symbol_risk('EURUSD'), 50.0)
+        self.assertEqual(book.currency_risk('USD'), 100.0)
+        self.assertEqual(book.currency_risk('EUR'), 50.0)
+        self.assertEqual(book.total, 100.0)
+
+        book.remove(1)
+        self.assertEqual(book.currency_risk('EUR'), 0.0)
+        self.assertEqual(book.total, 50.0)
+
+    def test_heat_check(self):
+        book = ExposureBook()
+        book.add(1, 'EURUSD', 800.0)
+
+        self.assertTrue(book.can_add(200.0, 10000.0, 0.1))
+        self.assertFalse(book.can_add(201.0, 10000.0, 0.1))
+
+    def test_reconcile_keeps_fills_newer_than_snapshot(self):
+        book = ExposureBook()
+        book.add(1, 'EURUSD', 50.0)  # inmiddels gesloten bij de broker
+        started = time.time()
+        book.add(2, 'GBPUSD', 30.0)  # na de snapshot gevuld
+        book.reserve('signal', 'AUDCAD', 10.0)
+
+        book.reconcile([(3, 'XAUUSD', 20.0)], started)
+
+        self.assertEqual(set(book.positions), {2, 3})
+        self.assertEqual(book.total, 60.0)
+        book.release('signal')
+        self.assertEqual(book.total, 50.0)
+
+class TestPortfolioHeatGate(unittest.TestCase):
+
+    def setUp(self):
+        # order resultaten in een in-memory store, via de manage_shelve module van de tradingbot
+        self.manage_shelve = tradingbot.manage_shelve
+        self.manage_shelve.set_store(self.manage_shelve.SignalStore(':memory:'))
+        self.mt5 = mt5sim.SimulatedMT5(balance=10000)
+        self.mt5.set_tick('EURUSD', 1.0800, 1.0800)
+        self.book = ExposureBook()
+        self.handler = MT5Handler(self.mt5, spec_cache=SymbolSpecCache(self.mt5), tick_store=TickStore(max_staleness=-1))
+        self.processor = ProcessTradeSignal(
+            self.mt5, order_limiter=TokenBucket(rate=1e9, capacity=1e9), mt5handler=self.handler, exposure_book=self.book
+        )
+
+    def tearDown(self):
+        self.manage_shelve.get_store().close()
+        self.manage_shelve.set_store(None)
+
+    def signal(self, ref):
+        return TradeSignal('EURUSD', 'Long', 1.0800, 1.0700, [1.0900], ref, 1)
+
+    def test_orders_stop_when_portfolio_is_hot(self):
+        # vast risico van 100 EUR per signaal, maximaal 2.5% van 10000 EUR open
+        strategy = Strategy(0.01, 0.025, 1, '', False, True, 100)
+
+        self.assertTrue(self.processor.start_order_entry_process(self.signal('A'), strategy))
+        self.assertTrue(self.processor.start_order_entry_process(self.signal('B'), strategy))
+        self.assertIsNone(self.processor.start_order_entry_process(self.signal('C'), strategy))
+        self.assertEqual(self.mt5.positions_total(), 2)
+        self.assertLessEqual(self.book.total, 0.025 * 10000)
+        self.assertEqual(self.book.reservations, {})
+
+    def test_concurrent_signals_on_other_symbols_are_not_blocked(self):
+        # twee signalen van ca. 102 EUR risico passen precies binnen 2.1% van 10000 EUR
+        strategy = Strategy(0.01, 0.021, 3, '', True, True, 100)
+        self.mt5.set_tick('GBPUSD', 1.2700, 1.2700)
+        # volgende legs wachten op de limiter, zodat B halverwege A wordt gecontroleerd
+        self.processor.orderLimiter = TokenBucket(rate=20, capacity=1)
+
+        async def scenario():
+            async def delayed():
+                await asyncio.sleep(0.02)
+                return await self.processor.start_order_entry_process_async(
+                    TradeSignal('GBPUSD', 'Long', 1.2700, 1.2600, [1.28, 1.29, 1.30], 'B', 1), strategy
+                )
+            return await asyncio.gather(
+                self.processor.start_order_entry_process_async(
+                    TradeSignal('EURUSD', 'Long', 1.0800, 1.0700, [1.09, 1.10, 1.11], 'A', 1), strategy
+                ),
+                delayed()
+            )
+
+        resultsA, resultsB = asyncio.run(scenario())
+
+        self.assertEqual((len(resultsA), len(resultsB)), (3, 3))
+        self.assertEqual(self.book.reservations, {})
+        self.assertLessEqual(self.book.total, 0.021 * 10000)
+
+    def test_consume_moves_risk_from_reservation_to_position(self):
+        book = ExposureBook()
+        book.reserve('signal', 'EURUSD', 90.0)
+        book.add(1, 'EURUSD', 30.0)
+        book.consume('signal', 30.0)
+
+        self.assertAlmostEqual(book.total, 90.0)
+        book.release('signal')
+        self.assertAlmostEqual(book.total, 30.0)
+
+    def test_reconcile_from_broker_positions(self):
+        strategy = Strategy(0.01, 0.1, 1, '', False, True, 100)
+        self.processor.start_order_entry_process(self.signal('A'), strategy)
+        ticket = self.mt5.positions_get()[0].ticket
+        self.mt5.close_position(ticket, 1.0800, 'manual')
+
+        self.book.reconcile(self.handler.get_exposure_positions())
+
+        self.assertEqual(self.book.total, 0.0)
+
+if __name__ == '__main__':
+    unittest.main()
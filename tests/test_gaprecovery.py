@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from src import processedindex
+from src.gaprecovery import LateSignalPolicy, RecoveredEvent, fetch_missed_messages, marked_chat_id
+
+class TestLateSignalPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = LateSignalPolicy(max_signal_age=300.0, max_price_drift=0.002)
+        self.now = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+    def test_fresh_signal_passes(self):
+        self.assertIsNone(self.policy.check_age(self.now - timedelta(seconds=10), self.now))
+        self.assertIsNone(self.policy.check_drift(1.0800, 1.0815))
+        self.assertEqual(self.policy.rejected, 0)
+
+    def test_old_signal_is_rejected(self):
+        reason = self.policy.check_age(self.now - timedelta(minutes=10), self.now)
+
+        self.assertIn('600s old', reason)
+        self.assertEqual(self.policy.rejected, 1)
+
+    def test_naive_date_is_utc(self):
+        self.assertEqual(LateSignalPolicy.signal_age(datetime(2024, 5, 1, 11, 59), self.now), 60.0)
+
+    def test_price_drift_is_rejected(self):
+        # 0.5% van de open prijs, in beide richtingen
+        self.assertIsNotNone(self.policy.check_drift(2300.0, 2311.5))
+        self.assertIsNotNone(self.policy.check_drift('2300.0', 2288.5))
+        self.assertEqual(self.policy.rejected, 2)
+
+    def test_unknown_price_or_disabled_limits_pass(self):
+        self.assertIsNone(self.policy.check_drift(1.08, None))
+        self.assertIsNone(self.policy.check_drift(None, 1.08))
+
+        unlimited = LateSignalPolicy(max_signal_age=None, max_price_drift=None)
+        self.assertIsNone(unlimited.check_age(self.now - timedelta(days=1), self.now))
+        self.assertIsNone(unlimited.check_drift(1.0, 2.0))
+
+    def test_recovered_event(self):
+        message = SimpleNamespace(id=7, text='signal', date=self.now)
+        event = RecoveredEvent(-1001, message)
+
+        self.assertTrue(event.recovered)
+        self.assertEqual((event.chat_id, event.message.id, event.chat), (-1001, 7, None))
+
+class FakeClient:
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.requests = []
+
+    async def iter_messages(self, peer, min_id=0, limit=None):
+        self.requests.append((peer, min_id, limit))
+        # Telethon geeft de nieuwste berichten eerst
+        for message in sorted(self.messages, key=lambda message: -message.id):
+            if message.id > min_id:
+                yield message
+
+class TestFetchMissedMessages(unittest.TestCase):
+
+    def setUp(self):
+        # dezelfde modules als die de index zelf gebruikt
+        self.manage_shelve = processedindex.manage_shelve
+        self.manage_shelve.set_store(self.manage_shelve.SignalStore(':memory:'))
+        self.processed = processedindex.ProcessedMessageIndex()
+
+    def tearDown(self):
+        self.manage_shelve.get_store().close()
+        self.manage_shelve.set_store(None)
+
+    def test_plain_config_id_resumes_from_the_live_chat_id(self):
+        # de live handler legt het bericht vast onder event.chat_id, het marked id
+        self.processed.mark_seen(-1000000000082, 500)
+        client = FakeClient([SimpleNamespace(id=message_id, text='m') for message_id in (499, 501, 502)])
+
+        events = asyncio.run(fetch_missed_messages(client, self.processed, 82, limit=10))
+
+        self.assertEqual(client.requests, [(-1000000000082, 500, 10)])
+        self.assertEqual([event.message.id for event in events], [501, 502])
+        self.assertEqual({event.chat_id for event in events}, {-1000000000082})
+
+    def test_channel_without_position_is_skipped(self):
+        client = FakeClient([SimpleNamespace(id=1, text='m')])
+
+        self.assertEqual(asyncio.run(fetch_missed_messages(client, self.processed, 82)), [])
+        self.assertEqual(client.requests, [])
+
+    def test_marked_chat_id(self):
+        self.assertEqual(marked_chat_id(82), -1000000000082)
+        self.assertEqual(marked_chat_id(-1000000000082), -1000000000082)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import io
+import json
+import logging
+import os
+import tempfile
+import unittest
+from src.logger_setup import JsonLinesFormatter, LazyQueueHandler, LoggerSingleton
+
+class Signal:
+    def __init__(self, ref_number):
+        self.ref_number = ref_number
+
+    def __str__(self):
+        return f'Signal({self.ref_number})'
+
+class TestStructuredLogging(unittest.TestCase):
+
+    def make_record(self, msg, args=(), **extra):
+        record = logging.LogRecord('test', logging.INFO, __file__, 1, msg, args, None)
+        for key, value in extra.items():
+            setattr(record, key, value)
+        return record
+
+    def test_json_lines_contain_structured_fields(self):
+        line = JsonLinesFormatter().format(self.make_record('Order %d sent', (2,), ref='EURUSD1.08_2', stage='order_send'))
+
+        entry = json.loads(line)
+        self.assertEqual(entry['message'], 'Order 2 sent')
+        self.assertEqual(entry['ref'], 'EURUSD1.08_2')
+        self.assertEqual(entry['stage'], 'order_send')
+        self.assertNotIn('channel', entry)
+
+    def test_queue_handler_defers_formatting_but_snapshots_args(self):
+        signal = Signal('REF')
+        prepared = LazyQueueHandler(None).prepare(self.make_record('Created %s', (signal,)))
+        signal.ref_number = 'REF_1'
+
+        # niet geformatteerd in de aanroepende thread, wel de waarde van dat moment
+        self.assertEqual(prepared.msg, 'Created %s')
+        self.assertEqual(prepared.getMessage(), 'Created Signal(REF)')
+
+    def test_configure_writes_through_listener(self):
+        handle, json_file = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, json_file)
+        logger = LoggerSingleton.get_logger()
+        original_handlers, original_level = list(logger.handlers), logger.level
+
+        LoggerSingleton.configure(json_file=json_file)
+        try:
+            logger.info('Skipping irrelevant message in %s.', 'GTMO', extra={'channel': 'GTMO', 'stage': 'irrelevant'})
+        finally:
+            LoggerSingleton.stop()
+            for handler in list(logger.handlers):
+                if handler not in original_handlers:
+                    logger.removeHandler(handler)
+                    handler.close()
+            logger.setLevel(original_level)
+
+        with open(json_file) as log_file:
+            entry = json.loads(log_file.readline())
+        self.assertEqual(entry['message'], 'Skipping irrelevant message in GTMO.')
+        self.assertEqual(entry['channel'], 'GTMO')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from src import mt5handler
+from src.metrics import EventLoopLagMonitor, MetricsRegistry, MetricsServer, latency_summary
+from src.tracing import LatencyHistogram
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_with_labels(self):
+        counter = self.registry.counter('messages_received_total', 'Ontvangen berichten.', ('channel',))
+        counter.inc('GTMO')
+        counter.inc('GTMO')
+        counter.inc('say "hi"\n')
+
+        text = self.registry.render()
+
+        self.assertIn('# TYPE autosignaltrader_messages_received_total counter', text)
+        self.assertIn('autosignaltrader_messages_received_total{channel="GTMO"} 2', text)
+        self.assertIn('autosignaltrader_messages_received_total{channel="say \\"hi\\"\\n"} 1', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram('order_send_seconds', 'Duur.', ('action',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(value, 'deal')
+
+        text = self.registry.render()
+
+        self.assertIn('autosignaltrader_order_send_seconds_bucket{action="deal",le="0.1"} 1', text)
+        self.assertIn('autosignaltrader_order_send_seconds_bucket{action="deal",le="1.0"} 3', text)
+        self.assertIn('autosignaltrader_order_send_seconds_bucket{action="deal",le="+Inf"} 4', text)
+        self.assertIn('autosignaltrader_order_send_seconds_sum{action="deal"} 4.25', text)
+        self.assertIn('autosignaltrader_order_send_seconds_count{action="deal"} 4', text)
+
+    def test_gauge_callback_is_evaluated_on_render(self):
+        depths = {'parse': 3}
+        self.registry.gauge('queue_depth', 'Queue diepte.', ('queue',), callback=lambda: dict(depths))
+        self.registry.gauge('tick_age_seconds', 'Tick leeftijd.', ('symbol',), callback=lambda: {'EURUSD': None})
+
+        depths['parse'] = 5
+        text = self.registry.render()
+
+        self.assertIn('autosignaltrader_queue_depth{queue="parse"} 5', text)
+        self.assertNotIn('tick_age_seconds{', text)
+
+    def test_registering_twice_returns_the_same_metric(self):
+        counter = self.registry.counter('order_send_total', 'Orders.', ('retcode',))
+
+        self.assertIs(self.registry.counter('order_send_total', 'Orders.', ('retcode',)), counter)
+        with self.assertRaises(ValueError):
+            self.registry.counter('order_send_total', 'Orders.', ('action', 'retcode'))
+        with self.assertRaises(ValueError):
+            counter.inc()
+
+    def test_latency_summary(self):
+        histogram = LatencyHistogram()
+        for value in (0.01, 0.02, 0.03):
+            histogram.record(value)
+
+        lines = latency_summary('signal_stage_seconds', 'Stages.', [((('stage', 'parsed'),), histogram), ((), LatencyHistogram())])
+
+        self.assertIn('# TYPE autosignaltrader_signal_stage_seconds summary', lines)
+        self.assertIn('autosignaltrader_signal_stage_seconds_count{stage="parsed"} 3', lines)
+        self.assertEqual(len([line for line in lines if 'quantile=' in line]), 3)
+
+class TestMetricsServer(unittest.TestCase):
+
+    def request(self, path):
+        registry = MetricsRegistry()
+        registry.counter('messages_received_total', 'Ontvangen berichten.', ('channel',)).inc('GTMO')
+
+        async def scenario():
+            server = MetricsServer(registry, port=0)
+            await server.start()
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+                writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+                await writer.drain()
+                response = await reader.read()
+                writer.close()
+                return response.decode(), server.scrapes
+            finally:
+                await server.stop()
+
+        return asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    def test_scrape(self):
+        response, scrapes = self.request('/metrics')
+
+        self.assertTrue(response.startswith('HTTP/1.1 200 OK'))
+        self.assertIn('Content-Type: text/plain; version=0.0.4', response)
+        self.assertIn('autosignaltrader_messages_received_total{channel="GTMO"} 1', response)
+        self.assertEqual(scrapes, 1)
+
+    def test_unknown_path(self):
+        response, scrapes = self.request('/')
+
+        self.assertTrue(response.startswith('HTTP/1.1 404'))
+        self.assertEqual(scrapes, 0)
+
+    def test_event_loop_lag(self):
+        registry = MetricsRegistry()
+
+        async def scenario():
+            monitor = EventLoopLagMonitor(interval=0.01, registry=registry)
+            monitor.start()
+            await asyncio.sleep(0.02)
+            import time
+            time.sleep(0.05)  # blokkeert de loop
+            await asyncio.sleep(0.02)
+            monitor.stop()
+            return monitor
+
+        monitor = asyncio.run(scenario())
+
+        self.assertGreaterEqual(monitor.histogram.count(), 2)
+        self.assertIn('autosignaltrader_event_loop_lag_seconds_bucket', registry.render())
+
+class TestOrderSendMetrics(unittest.TestCase):
+
+    def test_retcodes_and_latency_are_recorded(self):
+        mt5 = MagicMock()
+        mt5.order_send.side_effect = [SimpleNamespace(retcode=10009), SimpleNamespace(retcode=10016), None]
+        handler = mt5handler.MT5Handler(mt5, spec_cache=MagicMock(), tick_store=MagicMock())
+        done = mt5handler.ORDER_SEND_RESULTS.get('deal', 10009)
+        invalidStops = mt5handler.ORDER_SEND_RESULTS.get('sltp', 10016)
+        sent = mt5handler.ORDER_SEND_SECONDS.count('sltp')
+
+        handler.send_order('deal', {})
+        handler.send_order('sltp', {})
+        handler.send_order('sltp', {})
+
+        self.assertEqual(mt5handler.ORDER_SEND_RESULTS.get('deal', 10009), done + 1)
+        self.assertEqual(mt5handler.ORDER_SEND_RESULTS.get('sltp', 10016), invalidStops + 1)
+        self.assertGreaterEqual(mt5handler.ORDER_SEND_RESULTS.get('sltp', 'none'), 1)
+        self.assertEqual(mt5handler.ORDER_SEND_SECONDS.count('sltp'), sent + 2)
+
+if __name__ == '__main__':
+    unittest.main()
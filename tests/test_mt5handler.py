@@ -0,0 +1,142 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+from src.mt5handler import AccountSnapshot, MT5Handler, SymbolSpecCache, TickStore
+
+class TestSymbolSpecCache(unittest.TestCase):
+
+    def setUp(self):
+        self.mt5_mock = MagicMock()
+        self.mt5_mock.symbol_info.return_value = MagicMock(
+            digits=5, trade_contract_size=100000, volume_min=0.01,
+            volume_step=0.01, volume_max=100, trade_stops_level=0
+        )
+        self.cache = SymbolSpecCache(self.mt5_mock, ttl=60)
+        self.handler = MT5Handler(self.mt5_mock, spec_cache=self.cache)
+
+    def test_symbol_info_is_fetched_once(self):
+        """Digits, contract size en minimale volume kosten samen een enkele call"""
+        self.assertEqual(self.handler.get_digts('EURUSD'), 5)
+        self.assertEqual(self.handler.get_contract_size('EURUSD'), 100000)
+        self.assertEqual(self.handler.get_minimal_volume_size('EURUSD'), 0.01)
+
+        self.mt5_mock.symbol_info.assert_called_once_with('EURUSD')
+
+    @patch('src.mt5handler.time.monotonic')
+    def test_expired_entry_is_refreshed(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        self.handler.get_digts('EURUSD')
+        mock_monotonic.return_value = 61
+        self.handler.get_digts('EURUSD')
+
+        self.assertEqual(self.mt5_mock.symbol_info.call_count, 2)
+
+    def test_invalidate(self):
+        self.handler.get_digts('EURUSD')
+        self.cache.invalidate('EURUSD')
+        self.handler.get_digts('EURUSD')
+
+        self.assertEqual(self.mt5_mock.symbol_info.call_count, 2)
+
+    def test_symbols_to_prewarm_adds_eur_conversion_pairs(self):
+        channels = [{'symbols': ['GBPUSD', 'XAUUSD']}, {'symbols': ['EURCAD']}, {}]
+
+        symbols = SymbolSpecCache.symbols_to_prewarm(channels)
+
+        self.assertEqual(symbols, ['GBPUSD', 'XAUUSD', 'EURCAD', 'EURUSD'])
+
+    def test_get_cache_from_two_threads_returns_one_cache(self):
+        init = SymbolSpecCache.__init__
+
+        def slow_init(cache, *args, **kwargs):
+            time.sleep(0.05)  # het venster tussen de check en de toewijzing
+            init(cache, *args, **kwargs)
+
+        SymbolSpecCache._instance = None
+        with patch.object(SymbolSpecCache, '__init__', slow_init), ThreadPoolExecutor(2) as pool:
+            caches = list(pool.map(lambda _: SymbolSpecCache.get_cache(self.mt5_mock), range(2)))
+        SymbolSpecCache._instance = None
+
+        self.assertIs(caches[0], caches[1])
+
+class TestTickStore(unittest.TestCase):
+
+    def setUp(self):
+        self.mt5_mock = MagicMock()
+        self.mt5_mock.symbol_info_tick.return_value = MagicMock(bid=1.1, ask=1.2, time_msc=1700000000000)
+        self.store = TickStore(['EURUSD'], history=4, max_staleness=2.0)
+        self.handler = MT5Handler(self.mt5_mock, spec_cache=MagicMock(), tick_store=self.store)
+
+    def test_latest_tick_after_wrap_around(self):
+        for i in range(10):
+            self.store.put('EURUSD', 1.0 + i, 2.0 + i, i, received=i)
+
+        self.assertEqual(self.store.latest('EURUSD'), (9.0, 9.0, 10.0, 11.0))
+
+    def test_fresh_tick_avoids_live_call(self):
+        self.store.put('EURUSD', 1.05, 1.06, 0)
+
+        self.assertEqual(self.handler.get_price('EURUSD'), (1.05, 1.06))
+        self.mt5_mock.symbol_info_tick.assert_not_called()
+
+    @patch('src.mt5handler.time.monotonic')
+    def test_stale_tick_falls_back_to_live_call(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        self.store.put('EURUSD', 1.05, 1.06, 0)
+        mock_monotonic.return_value = 103.0
+
+        self.assertEqual(self.handler.get_price('EURUSD'), (1.1, 1.2))
+        self.mt5_mock.symbol_info_tick.assert_called_once_with('EURUSD')
+        self.assertEqual(self.store.latest('EURUSD')[2:], (1.1, 1.2))
+
+if __name__ == '__main__':
+    unittest.main()
+
+class TestAccountSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.mt5_mock = MagicMock()
+        self.mt5_mock.account_info.return_value = MagicMock(equity=10000, balance=9000)
+        self.mt5_mock.positions_get.return_value = (
+            MagicMock(ticket=1, symbol='EURUSD', comment='GTMO#3416.2_1', magic=7),
+            MagicMock(ticket=2, symbol='EURUSD', comment='GTMO#3416.2_2', magic=7),
+            MagicMock(ticket=3, symbol='XAUUSD', comment='GTMO#3417.1_1', magic=8),
+        )
+        self.snapshot = AccountSnapshot(self.mt5_mock, max_staleness=2.0)
+        self.handler = MT5Handler(self.mt5_mock, spec_cache=MagicMock(), account_snapshot=self.snapshot)
+
+    def test_positions_are_indexed(self):
+        self.assertTrue(self.snapshot.refresh())
+
+        self.assertEqual([p.ticket for p in self.handler.get_positions(ref_number='GTMO#3416.2')], [1, 2])
+        self.assertEqual([p.ticket for p in self.handler.get_positions(symbol='XAUUSD')], [3])
+        self.assertEqual([p.ticket for p in self.handler.get_positions(magic=7)], [1, 2])
+        self.assertEqual([p.ticket for p in self.snapshot.positions_for_comment('GTMO#3416.2_2')], [2])
+        self.assertEqual(self.mt5_mock.positions_get.call_count, 1)
+
+    def test_fresh_snapshot_replaces_live_calls(self):
+        self.snapshot.refresh()
+
+        self.assertEqual(self.handler.get_account_info().equity, 10000)
+        self.assertEqual(self.handler.get_open_positions(), 3)
+        self.mt5_mock.positions_total.assert_not_called()
+        self.assertEqual(self.mt5_mock.account_info.call_count, 1)
+
+    @patch('src.mt5handler.time.monotonic')
+    def test_stale_snapshot_falls_back_to_terminal(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        self.snapshot.refresh()
+        mock_monotonic.return_value = 3
+
+        self.assertEqual(self.snapshot.age(), 3)
+        self.assertFalse(self.snapshot.is_fresh())
+        self.handler.get_account_info()
+        self.assertEqual(self.mt5_mock.account_info.call_count, 2)
+
+    def test_failed_refresh_keeps_previous_snapshot(self):
+        self.snapshot.refresh()
+        self.mt5_mock.positions_get.return_value = None
+
+        self.assertFalse(self.snapshot.refresh())
+        self.assertEqual(len(self.snapshot.positions), 3)
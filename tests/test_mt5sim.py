@@ -0,0 +1,71 @@
+import time
+import unittest
+from src import mt5sim
+from src.mt5handler import MT5Handler, SymbolSpecCache, TickStore
+
+class TestSimulatedMT5(unittest.TestCase):
+
+    def setUp(self):
+        self.mt5 = mt5sim.SimulatedMT5(balance=10000)
+        self.mt5.set_tick('EURUSD', 1.0800, 1.0801)
+        self.handler = MT5Handler(self.mt5, spec_cache=SymbolSpecCache(self.mt5), tick_store=TickStore(max_staleness=-1))
+
+    def place_order(self, ref='REF_1'):
+        return self.handler.place_trade_order('EURUSD', 1.0801, 1.0750, 1.0850, 0.1, 'Long', ref)
+
+    def test_order_opens_position(self):
+        result = self.place_order()
+
+        self.assertEqual(result.retcode, mt5sim.TRADE_RETCODE_DONE)
+        self.assertEqual(result.price, 1.0801)
+        positions = self.mt5.positions_get(symbol='EURUSD')
+        self.assertEqual(len(positions), 1)
+        self.assertEqual(positions[0].comment, 'REF_1')
+        self.assertEqual(positions[0].sl, 1.075)
+
+    def test_requote_injection(self):
+        self.mt5.fail_next_orders(mt5sim.TRADE_RETCODE_REQUOTE)
+
+        self.assertIsNone(self.place_order())
+        self.assertIsNotNone(self.place_order())
+        self.assertEqual(self.mt5.retcode_counts[mt5sim.TRADE_RETCODE_REQUOTE], 1)
+
+    def test_requote_rate(self):
+        self.mt5.configure(requote_rate=1.0, seed=1)
+
+        self.assertIsNone(self.place_order())
+        self.assertEqual(self.mt5.positions_total(), 0)
+
+    def test_latency_injection(self):
+        self.mt5.configure(latency={'order_send': 0.05})
+
+        start = time.perf_counter()
+        self.place_order()
+
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+        self.assertEqual(self.mt5.call_counts['order_send'], 1)
+
+    def test_calls_fail_without_connection(self):
+        self.mt5.shutdown()
+
+        self.assertIsNone(self.mt5.account_info())
+        self.assertEqual(self.mt5.last_error()[0], mt5sim.RES_E_NO_IPC)
+
+    def test_take_profit_closes_position(self):
+        self.place_order()
+        self.mt5.set_tick('EURUSD', 1.0851, 1.0852)
+
+        self.assertEqual(self.mt5.positions_total(), 0)
+        self.assertEqual(self.mt5.closed_positions[0].reason, 'tp')
+        self.assertGreater(self.mt5.account_info().balance, 10000)
+
+    def test_module_level_drop_in(self):
+        mt5sim.reset()
+        mt5sim.set_tick('XAUUSD', 3416.0, 3416.2)
+
+        self.assertTrue(mt5sim.initialize())
+        self.assertEqual(mt5sim.symbol_info('XAUUSD').digits, 2)
+        self.assertEqual(mt5sim.symbol_info_tick('XAUUSD').ask, 3416.2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import asyncio
+import unittest
+from src.pipeline import KeyedGate, PipelineStage, SignalPipeline
+
+class Job:
+
+    def __init__(self, key, name):
+        self.key = key
+        self.name = name
+
+class TestSignalPipeline(unittest.TestCase):
+
+    def run_async(self, coroutine):
+        return asyncio.run(asyncio.wait_for(coroutine, 5))
+
+    def test_items_pass_all_stages_in_order(self):
+        seen = []
+
+        async def parse(job):
+            seen.append(('parse', job.name))
+            return job if job.name != 'irrelevant' else None
+
+        async def execute(job):
+            seen.append(('execute', job.name))
+            return job
+
+        async def scenario():
+            pipeline = SignalPipeline([PipelineStage('parse', parse), PipelineStage('execution', execute)])
+            pipeline.start()
+            for name in ('a', 'irrelevant', 'b'):
+                await pipeline.submit(Job('EURUSD', name))
+            await pipeline.join()
+            await pipeline.stop()
+            return pipeline.stats()
+
+        stats = self.run_async(scenario())
+
+        self.assertEqual([name for stage, name in seen if stage == 'parse'], ['a', 'irrelevant', 'b'])
+        self.assertEqual([name for stage, name in seen if stage == 'execute'], ['a', 'b'])
+        self.assertEqual(stats['stages']['parse']['dropped'], 1)
+        self.assertEqual(stats['stages']['execution']['processed'], 2)
+        self.assertEqual(stats['in_flight'], [])
+
+    def test_one_item_per_key_in_flight(self):
+        running = {}
+        overlap = []
+        maxParallel = []
+
+        async def sizing(job):
+            return job
+
+        async def execute(job):
+            running[job.key] = running.get(job.key, 0) + 1
+            overlap.append(running[job.key])
+            maxParallel.append(sum(running.values()))
+            await asyncio.sleep(0.01)
+            running[job.key] -= 1
+            return job
+
+        async def scenario():
+            pipeline = SignalPipeline([
+                PipelineStage('sizing', sizing, workers=4, gated=True),
+                PipelineStage('execution', execute, workers=4),
+            ], key=lambda job: job.key)
+            pipeline.start()
+            for index in range(3):
+                for symbol in ('EURUSD', 'XAUUSD'):
+                    await pipeline.submit(Job(symbol, index))
+            await pipeline.join()
+            await pipeline.stop()
+
+        self.run_async(scenario())
+
+        # nooit twee signalen voor hetzelfde symbool tegelijk, wel verschillende symbolen
+        self.assertEqual(max(overlap), 1)
+        self.assertEqual(max(maxParallel), 2)
+
+    def test_edit_waits_for_its_signal(self):
+        events = []
+
+        async def sizing(job):
+            return job
+
+        async def execute(job):
+            events.append(('start', job.name))
+            if job.name == 'signal':
+                await asyncio.sleep(0.02)  # legs worden nog geplaatst
+            events.append(('done', job.name))
+            return job
+
+        async def scenario():
+            pipeline = SignalPipeline([
+                PipelineStage('sizing', sizing, workers=4, gated=True),
+                PipelineStage('execution', execute, workers=4),
+            ], key=lambda job: job.key)
+            pipeline.start()
+            await pipeline.submit(Job('XAUUSD', 'signal'))
+            await pipeline.submit(Job('XAUUSD', 'edit'))
+            await pipeline.join()
+            await pipeline.stop()
+
+        self.run_async(scenario())
+
+        self.assertEqual(events, [('start', 'signal'), ('done', 'signal'), ('start', 'edit'), ('done', 'edit')])
+
+    def test_full_queue_applies_backpressure(self):
+        release = None
+
+        async def slow(job):
+            await release.wait()
+            return job
+
+        async def scenario():
+            nonlocal release
+            release = asyncio.Event()
+            stage = PipelineStage('parse', slow, queue_size=1)
+            pipeline = SignalPipeline([stage])
+            pipeline.start()
+            await pipeline.submit(Job(None, 1))  # wordt door de worker opgepakt
+            await asyncio.sleep(0)
+            await pipeline.submit(Job(None, 2))  # vult de queue
+            blocked = asyncio.create_task(pipeline.submit(Job(None, 3)))
+            await asyncio.sleep(0.01)
+            waiting = not blocked.done()
+            release.set()
+            await blocked
+            await pipeline.join()
+            await pipeline.stop()
+            return waiting, stage.stats()
+
+        waiting, stats = self.run_async(scenario())
+
+        self.assertTrue(waiting)
+        self.assertEqual(stats['blocked'], 1)
+        self.assertEqual(stats['processed'], 3)
+        self.assertEqual(stats['max_depth'], 1)
+
+    def test_failing_stage_releases_the_key(self):
+        attempts = []
+
+        async def execute(job):
+            attempts.append(job.name)
+            if job.name == 'bad':
+                raise RuntimeError('order failed')
+            return job
+
+        async def scenario():
+            pipeline = SignalPipeline([PipelineStage('execution', execute, gated=True)], key=lambda job: job.key)
+            pipeline.start()
+            await pipeline.submit(Job('EURUSD', 'bad'))
+            await pipeline.submit(Job('EURUSD', 'good'))
+            await pipeline.join()
+            await pipeline.stop()
+            return pipeline.stats()
+
+        stats = self.run_async(scenario())
+
+        self.assertEqual(attempts, ['bad', 'good'])
+        self.assertEqual(stats['stages']['execution']['failed'], 1)
+        self.assertEqual(stats['in_flight'], [])
+
+    def test_invalid_stage(self):
+        with self.assertRaises(ValueError):
+            PipelineStage('parse', None, workers=0)
+
+    def test_keyed_gate(self):
+        async def scenario():
+            gate = KeyedGate()
+            await gate.acquire('EURUSD')
+            await gate.acquire('XAUUSD')
+            inFlight = gate.in_flight()
+            gate.release('EURUSD')
+            return inFlight, gate.in_flight()
+
+        self.assertEqual(self.run_async(scenario()), (['EURUSD', 'XAUUSD'], ['XAUUSD']))
+
+if __name__ == '__main__':
+    unittest.main()
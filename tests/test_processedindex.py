@@ -0,0 +1,73 @@
+import unittest
+from src import processedindex
+from src.processedindex import ProcessedMessageIndex
+
+# dezelfde modules als die de index zelf gebruikt
+manage_shelve = processedindex.manage_shelve
+
+class TestProcessedMessageIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.store = manage_shelve.SignalStore(':memory:')
+        manage_shelve.set_store(self.store)
+
+    def test_duplicate_is_rejected(self):
+        index = ProcessedMessageIndex()
+
+        self.assertTrue(index.claim(-1001, 42, 'EURUSD1.08'))
+        self.assertFalse(index.claim(-1001, 42, 'EURUSD1.08'))
+        self.assertTrue(index.claim(-1002, 42, 'GS'))
+        self.assertEqual(index.get(-1001, 42), 'EURUSD1.08')
+        self.assertEqual(index.duplicates, 1)
+
+    def test_survives_restart(self):
+        ProcessedMessageIndex().claim(-1001, 42, 'EURUSD1.08')
+
+        index = ProcessedMessageIndex()
+        index.load()
+
+        self.assertFalse(index.claim(-1001, 42, 'EURUSD1.08'))
+        self.assertTrue(index.claim(-1001, 43, 'EURUSD1.09'))
+
+    def test_evicted_entry_is_found_in_store(self):
+        index = ProcessedMessageIndex(capacity=2)
+        for message_id in (1, 2, 3):
+            index.claim(-1001, message_id, f'REF{message_id}')
+
+        self.assertNotIn((-1001, 1), index.recent)
+        self.assertEqual(index.get(-1001, 1), 'REF1')
+
+    def test_new_message_above_high_water_mark_skips_store(self):
+        index = ProcessedMessageIndex()
+        index.claim(-1001, 10, 'REF10')
+        self.store.close()
+
+        # een hoger id is altijd nieuw, de (gesloten) store wordt niet geraadpleegd
+        self.assertIsNone(index.get(-1001, 11))
+
+    def test_resume_from_last_seen_message(self):
+        index = ProcessedMessageIndex()
+        index.claim(-1001, 10, 'REF10')
+        index.mark_seen(-1001, 14)
+        index.mark_seen(-1001, 12)  # ouder bericht, bijvoorbeeld uit gap recovery
+
+        self.assertEqual(index.resume_from(-1001), 14)
+        self.assertIsNone(index.resume_from(-1002))
+
+        restarted = ProcessedMessageIndex()
+        restarted.load()
+        self.assertEqual(restarted.resume_from(-1001), 14)
+
+    def test_claim_with_write_behind(self):
+        writer = manage_shelve.WriteBehindWriter(self.store, flush_interval=0.01)
+        writer.start()
+        manage_shelve.writer = writer
+        try:
+            ProcessedMessageIndex().claim(-1001, 7, 'GS')
+        finally:
+            manage_shelve.stop_write_behind()
+
+        self.assertEqual(self.store.get_processed(-1001, 7), 'GS')
+
+if __name__ == '__main__':
+    unittest.main()
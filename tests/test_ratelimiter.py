@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+from src.ratelimiter import TokenBucket
+
+class TestTokenBucket(unittest.TestCase):
+
+    @patch('src.ratelimiter.time.monotonic')
+    def test_first_order_is_not_delayed(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        bucket = TokenBucket(rate=2.5, capacity=1)
+
+        self.assertEqual(bucket.reserve(), 0.0)
+
+    @patch('src.ratelimiter.time.monotonic')
+    def test_following_orders_are_paced(self, mock_monotonic):
+        """Vier orders op hetzelfde moment worden op 0.4s van elkaar gezet"""
+        mock_monotonic.return_value = 100.0
+        bucket = TokenBucket(rate=2.5, capacity=1)
+
+        delays = [bucket.reserve() for _ in range(4)]
+
+        for delay, expected in zip(delays, [0.0, 0.4, 0.8, 1.2]):
+            self.assertAlmostEqual(delay, expected)
+
+    @patch('src.ratelimiter.time.monotonic')
+    def test_tokens_refill_over_time(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        bucket = TokenBucket(rate=2.5, capacity=1)
+        bucket.reserve()
+
+        mock_monotonic.return_value = 100.4
+        self.assertAlmostEqual(bucket.reserve(), 0.0)
+
+    def test_acquire_does_not_block_the_loop(self):
+        """Andere taken lopen door terwijl een order in de wachtrij staat"""
+        bucket = TokenBucket(rate=20, capacity=1)
+        ticks = []
+
+        async def ticker():
+            for _ in range(3):
+                ticks.append(True)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            bucket.reserve()
+            queued, _ = await asyncio.gather(bucket.acquire(), ticker())
+            return queued
+
+        queued = asyncio.run(run())
+
+        self.assertGreater(queued, 0.03)
+        self.assertEqual(len(ticks), 3)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+if __name__ == '__main__':
+    unittest.main()
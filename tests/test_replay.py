@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from src import replay
+from src.replay import ReplayEngine, iter_messages, TICK, MESSAGE, EDIT
+from src.strategy import Strategy
+
+GTMO_SIGNAL = """Gold buy now 3416.2 - 3420
+
+SL: 3405.1
+
+TP: 3435
+TP: 3450"""
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        # dezelfde modules als die de replay zelf gebruikt
+        replay.manage_shelve.set_store(replay.SignalStore(':memory:'))
+        self.channels = [{'id': 2222, 'title': 'GTMO VIP'}]
+        self.strategy = Strategy(0.01, 0.1, 3, '', True, True, 50)
+
+    def write_messages(self, records):
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(handle, 'w') as messages_file:
+            for record in records:
+                messages_file.write(json.dumps(record) + '\n')
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_edits_are_streamed_in_time_order(self):
+        path = self.write_messages([
+            {'timestamp': 100, 'chat_id': 1, 'message_id': 1, 'text': 'a', 'edits': [{'timestamp': 250, 'text': 'a2'}]},
+            {'timestamp': 200, 'chat_id': 1, 'message_id': 2, 'text': 'b'},
+            {'timestamp': 300, 'chat_id': 1, 'message_id': 3, 'text': 'c'},
+        ])
+
+        events = [(event[0], event[1]) for event in iter_messages(path)]
+
+        self.assertEqual(events, [(100, MESSAGE), (200, MESSAGE), (250, EDIT), (300, MESSAGE)])
+
+    def test_tp_and_sl_hits_from_recorded_ticks(self):
+        """Eerste leg raakt TP1, daarna raakt de tweede leg de stop loss"""
+        path = self.write_messages([
+            {'timestamp': 100, 'chat_id': -1000000002222, 'message_id': 1, 'text': GTMO_SIGNAL},
+            {'timestamp': 150, 'chat_id': -1000000002222, 'message_id': 2, 'text': 'Good morning!'},
+        ])
+        ticks = [
+            (90, TICK, 'EURUSD', 1.08, 1.08),
+            (90, TICK, 'XAUUSD', 3416.0, 3416.2),
+            (110, TICK, 'XAUUSD', 3436.0, 3436.2),
+            (120, TICK, 'XAUUSD', 3405.0, 3405.2),
+        ]
+        engine = ReplayEngine(self.channels, {'s1': self.strategy})
+
+        asyncio.run(engine.run(iter_messages(path), iter(ticks)))
+
+        run = engine.runs[0]
+        self.assertEqual([fill['tp'] for fill in run.fills], [3435.0, 3450.0])
+        self.assertEqual([hit['hit'] for hit in run.hits], ['TP1', 'SL'])
+        self.assertEqual(engine.counters['signals'], 1)
+        self.assertEqual(engine.counters['irrelevant'], 1)
+        summary = run.summary()
+        self.assertEqual(summary['open'], 0)
+        self.assertAlmostEqual(summary['realized_pnl'], sum(hit['profit'] for hit in run.hits))
+
+    def test_edit_moves_the_stop_loss_of_open_legs(self):
+        """De edit zet de SL op 3410; zonder de edit blijven beide legs open"""
+        path = self.write_messages([{
+            'timestamp': 100, 'chat_id': -1000000002222, 'message_id': 1, 'text': GTMO_SIGNAL,
+            'edits': [{'timestamp': 105, 'text': GTMO_SIGNAL.replace('3405.1', '3410')}],
+        }])
+        ticks = [
+            (90, TICK, 'EURUSD', 1.08, 1.08),
+            (90, TICK, 'XAUUSD', 3416.0, 3416.2),
+            (110, TICK, 'XAUUSD', 3409.0, 3409.2),
+        ]
+        engine = ReplayEngine(self.channels, {'s1': self.strategy})
+
+        asyncio.run(engine.run(iter_messages(path), iter(ticks)))
+
+        run = engine.runs[0]
+        self.assertEqual((engine.counters['edits'], engine.counters['edits_applied']), (1, 1))
+        self.assertEqual([hit['hit'] for hit in run.hits], ['SL', 'SL'])
+        self.assertEqual(run.summary()['open'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
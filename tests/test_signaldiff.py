@@ -0,0 +1,43 @@
+import unittest
+from src.signaldiff import SignalDiff
+from src.tradesignalparser import TradeSignal
+
+class TestSignalDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.stored = {
+            'ref_number': 'GTMO#3416.2', 'symbol': 'XAUUSD', 'direction': 'Buy', 'open_price': '3416.2',
+            'stop_loss': 3405.1, 'target_profits': [3435.0, 3450.0, 3475.0]
+        }
+
+    def edited(self, stop_loss=3405.1, target_profits=(3435.0, 3450.0, 3475.0), direction='Buy'):
+        return TradeSignal('XAUUSD', direction, '3416.2', stop_loss, list(target_profits), 'GTMO#3416.2', [])
+
+    def test_unchanged_signal(self):
+        diff = SignalDiff(self.stored, self.edited())
+
+        self.assertTrue(diff.is_empty())
+        self.assertFalse(diff.can_apply())
+
+    def test_stop_loss_and_target_profit_changes(self):
+        diff = SignalDiff(self.stored, self.edited(stop_loss=3410.0, target_profits=(3435.0, 3455.0, 3475.0)))
+
+        self.assertTrue(diff.can_apply())
+        self.assertEqual(diff.new_stop_loss, 3410.0)
+        self.assertEqual(diff.new_target_profits, [3435.0, 3455.0, 3475.0])
+        self.assertEqual(diff.other_changes(), {})
+
+    def test_only_target_profits_keep_stop_loss(self):
+        diff = SignalDiff(self.stored, self.edited(target_profits=(3440.0, 3450.0, 3475.0)))
+
+        self.assertIsNone(diff.new_stop_loss)
+        self.assertTrue(diff.can_apply())
+
+    def test_direction_change_is_not_applied(self):
+        diff = SignalDiff(self.stored, self.edited(stop_loss=3430.0, direction='Sell'))
+
+        self.assertFalse(diff.can_apply())
+        self.assertIn('direction', diff.other_changes())
+
+if __name__ == '__main__':
+    unittest.main()
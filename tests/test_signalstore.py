@@ -0,0 +1,175 @@
+import sqlite3
+import unittest
+from src.signalstore import SignalStore, WriteBehindWriter
+from src.tradesignalparser import TradeSignal
+
+class TestSignalStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = SignalStore(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_message_versions_are_keyed_by_channel_and_message(self):
+        self.store.store_message_versions(-1001, 10, ['v1'])
+        self.store.store_message_versions(-1002, 10, ['other channel'])
+        self.store.store_message_versions(-1001, 10, ['v1', 'v2'])
+
+        self.assertEqual(self.store.get_message_versions(10, -1001), ['v1', 'v2'])
+        self.assertEqual(self.store.get_message_versions(10, -1002), ['other channel'])
+        self.assertIsNone(self.store.get_message_versions(11))
+
+    def test_appended_versions(self):
+        self.store.append_message_version(-1001, 10, 'v1')
+        self.store.append_message_version(-1001, 10, 'v2')
+        self.store.append_message_version(-1002, 10, 'other channel')
+
+        self.assertEqual(self.store.get_message_versions(10, -1001), ['v1', 'v2'])
+        self.assertEqual(self.store.get_latest_message_version(-1001, 10), 'v2')
+        self.assertIsNone(self.store.get_latest_message_version(-1001, 11))
+
+    def test_orders_in_the_same_second_do_not_overwrite(self):
+        """Twee signalen met dezelfde epoch sleutel blijven allebei bewaard"""
+        self.store.store_order_results(1700000000, [{'order': 1, 'request': {'comment': 'A_1'}}])
+        self.store.store_order_results(1700000000, [{'order': 2, 'request': {'comment': 'B_1'}}])
+
+        self.assertEqual([r['order'] for r in self.store.get_order_results(1700000000)], [1, 2])
+
+    def test_latest_order_results(self):
+        self.store.store_order_results(1, [{'order': 1}])
+        self.store.store_order_results(2, [{'order': 2}, {'order': 3}])
+
+        key, results = self.store.get_latest_order_results()
+
+        self.assertEqual(key, '2')
+        self.assertEqual([r['order'] for r in results], [2, 3])
+
+    def test_store_signal(self):
+        signal = TradeSignal('XAUUSD', 'Buy', 3416.2, 3405.1, [3435.0, 3450.0], 'GTMO#3416.2', [False, False])
+        self.store.store_signals([(-1001, 42, signal)])
+
+        stored = self.store.get_signal(-1001, 42)
+
+        self.assertEqual(stored['ref_number'], 'GTMO#3416.2')
+        self.assertEqual(stored['target_profits'], [3435.0, 3450.0])
+
+class TestWriteBehindWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.store = SignalStore(':memory:')
+        self.writer = WriteBehindWriter(self.store, flush_interval=60)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_pending_records_are_flushed_on_stop(self):
+        """Met een lang flush interval wordt alles bij het stoppen weggeschreven"""
+        self.writer.start()
+        self.writer.enqueue('message_versions', -1001, 10, ['v1'])
+        self.writer.enqueue('order_results', 1, [{'order': 1}])
+        self.writer.stop()
+
+        self.assertEqual(self.store.get_message_versions(10, -1001), ['v1'])
+        self.assertEqual(self.store.get_order_results(1), [{'order': 1}])
+        self.assertEqual(self.writer.pending_messages, {})
+
+    def test_pending_message_is_readable_before_flush(self):
+        self.writer.enqueue('message_versions', -1001, 10, ['v1', 'v2'])
+
+        self.assertEqual(self.writer.get_pending_message_versions(10), ['v1', 'v2'])
+        self.assertIsNone(self.store.get_message_versions(10))
+
+    def test_pending_edit_and_signal_are_readable_before_flush(self):
+        signal = TradeSignal('XAUUSD', 'Buy', 3416.2, 3405.1, [3435.0], 'GTMO#3416.2', [False])
+        self.writer.enqueue('message_version', -1001, 10, 'v1')
+        self.writer.enqueue('signal', -1001, 10, signal)
+        self.writer.enqueue('message_version', -1001, 10, 'v2')
+
+        self.assertEqual(self.writer.get_pending_latest_message_version(-1001, 10), 'v2')
+        self.assertIs(self.writer.get_pending_signal(-1001, 10), signal)
+
+        self.writer.start()
+        self.writer.stop()
+        self.assertEqual(self.store.get_message_versions(10, -1001), ['v1', 'v2'])
+        self.assertIsNone(self.writer.get_pending_latest_message_version(-1001, 10))
+        self.assertIsNone(self.writer.get_pending_signal(-1001, 10))
+
+    def test_failed_flush_is_retried(self):
+        writer = WriteBehindWriter(self.store, flush_interval=60, retry_delays=(0,))
+        write_batch = self.store.write_batch
+        calls = []
+
+        def fail_once(records):
+            calls.append(list(records))
+            if len(calls) == 1:
+                raise sqlite3.OperationalError('database is locked')
+            write_batch(records)
+
+        self.store.write_batch = fail_once
+        writer.enqueue('message_versions', -1001, 10, ['v1'])
+        writer.enqueue('order_results', 1, [{'order': 1}])
+
+        self.assertTrue(writer.flush([writer.queue.get_nowait(), writer.queue.get_nowait()]))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.store.get_message_versions(10, -1001), ['v1'])
+        self.assertEqual(self.store.get_order_results(1), [{'order': 1}])
+        self.assertEqual(writer.pending_messages, {})
+
+    def test_unwritten_batch_goes_with_the_next_flush(self):
+        writer = WriteBehindWriter(self.store, flush_interval=60, retry_delays=())
+        write_batch = self.store.write_batch
+
+        def fail(records):
+            raise sqlite3.OperationalError('disk I/O error')
+
+        self.store.write_batch = fail
+        writer.enqueue('message_versions', -1001, 10, ['v1'])
+
+        self.assertFalse(writer.flush([writer.queue.get_nowait()]))
+        # niet weggeschreven, dus nog steeds leesbaar via de pending records
+        self.assertEqual(writer.get_pending_message_versions(10), ['v1'])
+
+        self.store.write_batch = write_batch
+        writer.start()
+        writer.stop()
+        self.assertEqual(self.store.get_message_versions(10, -1001), ['v1'])
+        self.assertEqual(writer.pending_messages, {})
+
+    def test_record_that_cannot_be_written_does_not_block_the_rest(self):
+        writer = WriteBehindWriter(self.store, flush_interval=60, retry_delays=(0,))
+        writer.enqueue('message_versions', -1001, 10, ['v1'])
+        writer.enqueue('order_results', 1, [{'order': object()}])  # niet naar JSON te schrijven
+        writer.enqueue('order_results', 2, [{'order': 2}])
+
+        self.assertFalse(writer.flush([writer.queue.get_nowait() for _ in range(3)]))
+        self.assertEqual(self.store.get_message_versions(10, -1001), ['v1'])
+        self.assertEqual(self.store.get_order_results(2), [{'order': 2}])
+        self.assertIsNone(self.store.get_order_results(1))
+        self.assertEqual((writer.dropped, writer.unwritten, writer.pending_messages), (1, [], {}))
+
+        # het verworpen record gaat niet mee met de volgende flush
+        writer.enqueue('order_results', 3, [{'order': 3}])
+        self.assertTrue(writer.flush([writer.queue.get_nowait()]))
+
+    def test_unwritten_records_are_capped(self):
+        writer = WriteBehindWriter(self.store, flush_interval=60, retry_delays=(), max_unwritten=2)
+
+        def fail(records):
+            raise sqlite3.OperationalError('database is locked')
+
+        self.store.write_batch = fail
+        for message_id in (10, 11, 12):
+            writer.enqueue('message_versions', -1001, message_id, ['v1'])
+
+        self.assertFalse(writer.flush([writer.queue.get_nowait() for _ in range(3)]))
+        self.assertEqual([args[1] for _, args in writer.unwritten], [11, 12])
+        self.assertEqual(writer.dropped, 1)
+        self.assertIsNone(writer.get_pending_message_versions(10))
+
+    def test_invalid_fsync_policy(self):
+        with self.assertRaises(ValueError):
+            WriteBehindWriter(self.store, fsync_policy='never')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+from src.supervisor import ReconnectSupervisor
+
+class TestReconnectSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.supervisor = ReconnectSupervisor(base_delay=0.001, max_delay=0.004, jitter=0.5)
+
+    def test_backoff_is_capped_and_jittered(self):
+        supervisor = ReconnectSupervisor(base_delay=1.0, max_delay=8.0, jitter=0.5)
+
+        with patch('src.supervisor.random.random', return_value=0.0):
+            self.assertEqual([supervisor.next_delay(attempt) for attempt in range(5)], [1.0, 2.0, 4.0, 8.0, 8.0])
+        with patch('src.supervisor.random.random', return_value=1.0):
+            self.assertEqual(supervisor.next_delay(3), 4.0)
+
+    def test_reconnects_after_connection_loss(self):
+        calls = []
+        failures = [ConnectionError('down'), ConnectionRefusedError('refused')]
+
+        async def connect():
+            calls.append('connect')
+            if len(calls) > 1 and failures:
+                raise failures.pop(0)
+
+        async def serve():
+            calls.append('serve')
+            if calls.count('serve') == 1:
+                raise ConnectionError('lost')
+
+        asyncio.run(self.supervisor.run(connect, serve))
+
+        self.assertEqual(calls, ['connect', 'serve', 'connect', 'connect', 'connect', 'serve'])
+        self.assertEqual((self.supervisor.reconnects, self.supervisor.attempts), (1, 2))
+        self.assertEqual(len(self.supervisor.incidents), 1)
+        self.assertGreater(self.supervisor.last_downtime, 0)
+
+    def test_other_errors_are_not_retried(self):
+        async def serve():
+            raise ValueError('bug')
+
+        async def connect():
+            pass
+
+        with self.assertRaises(ValueError):
+            asyncio.run(self.supervisor.run(connect, serve))
+
+if __name__ == '__main__':
+    unittest.main()
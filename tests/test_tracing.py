@@ -0,0 +1,54 @@
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+from src.tracing import LatencyHistogram, LatencyTracer, StartupTimer
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentiles_within_bucket_precision(self):
+        histogram = LatencyHistogram()
+        for ms in range(1, 101):
+            histogram.record(ms / 1000)
+
+        self.assertAlmostEqual(histogram.percentile(50), 0.050, delta=0.050 * 0.05)
+        self.assertAlmostEqual(histogram.percentile(95), 0.095, delta=0.095 * 0.05)
+        self.assertEqual(histogram.percentile(100), 0.1)
+        self.assertEqual(histogram.count, 100)
+
+    def test_empty_histogram(self):
+        self.assertIsNone(LatencyHistogram().percentile(50))
+
+class TestLatencyTracer(unittest.TestCase):
+
+    @patch('src.tracing.time.perf_counter')
+    def test_stages_are_recorded_per_channel(self, mock_perf_counter):
+        mock_perf_counter.side_effect = [10.0, 10.002, 10.010, 10.110]
+        tracer = LatencyTracer()
+
+        trace = tracer.start(-1001, 42, datetime.now(timezone.utc))
+        trace.mark('parsed')
+        trace.mark('price_fetched')
+        trace.mark('order_send')
+        tracer.finish(trace)
+
+        summary = tracer.summary()
+        self.assertEqual(set(summary), {'-1001', 'all'})
+        self.assertEqual(summary['-1001']['order_send']['count'], 1)
+        self.assertAlmostEqual(summary['all']['handler_total']['max_ms'], 110, places=3)
+        self.assertIn('telegram', summary['all'])
+
+class TestStartupTimer(unittest.TestCase):
+
+    @patch('src.tracing.time.perf_counter')
+    def test_stages_are_ordered_by_start(self, mock_perf_counter):
+        mock_perf_counter.return_value = 10.0
+        timer = StartupTimer(started=9.0)
+        timer.record('mt5_login', 10.5, 12.0)
+        with timer.measure('telegram_connect'):
+            mock_perf_counter.return_value = 10.8
+
+        self.assertEqual(timer.summary(), 'telegram_connect 800 ms (at 1000 ms), mt5_login 1500 ms (at 1500 ms)')
+        self.assertAlmostEqual(timer.elapsed(), 1.8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import patch
 from datetime import datetime  # Voeg deze import toe
-from src.tradesignalparser import TradeSignalParser1000PipBuilder, TradeSignal
+from src.tradesignalparser import TradeSignalParser1000PipBuilder, GTMO, TradeSignal, ParserRegistry, parse_failure_reason
 
 class Test1000PipBuilderParser(unittest.TestCase):
 
@@ -46,5 +46,63 @@ Ref#: EURUSD1.2000"""
         with self.assertRaises(ValueError):
             self.parser.parse_trade_signal(message)
 
+class TestStopLossUpdate(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = GTMO()
+
+    def test_price_after_to_at_or_sl(self):
+        self.assertEqual(self.parser.parse_stop_loss_update('Adjust SL to 2315.5'), 2315.5)
+        self.assertEqual(self.parser.parse_stop_loss_update('adjust sl @ 2310'), 2310.0)
+        self.assertEqual(self.parser.parse_stop_loss_update('Adjust SL: 2308.20 now'), 2308.2)
+
+    def test_break_even(self):
+        self.assertIsNone(self.parser.parse_stop_loss_update('Adjust SL to entry'))
+        self.assertIsNone(self.parser.parse_stop_loss_update('adjust sl to break even'))
+        self.assertIsNone(TradeSignalParser1000PipBuilder().parse_stop_loss_update(
+            'The 1:1 Risk:Reward Target has been reached'))
+
+    def test_pip_counts_and_ratios_are_rejected(self):
+        for message in ('Adjust SL +30 pips', 'Adjust SL to 30 pips', 'move sl 1:1', 'Adjust SL to 1:1',
+                        'adjust sl to 2R', 'Adjust SL 50% closer', 'Adjust SL to +20'):
+            with self.subTest(message=message):
+                with self.assertRaises(ValueError):
+                    self.parser.parse_stop_loss_update(message)
+
+class TestParseFailureReason(unittest.TestCase):
+
+    def test_reason_without_message_content(self):
+        parser = GTMO()
+        with self.assertRaises(ValueError) as context:
+            parser.parse_trade_signal('Gold buy now\nhold on')
+
+        self.assertNotIn('hold on', parse_failure_reason(context.exception))
+        self.assertEqual(parse_failure_reason(ValueError('Invalid trade signal format: not enough lines')), 'not enough lines')
+        self.assertEqual(parse_failure_reason(ValueError('Invalid stop loss format: SL 2300x')), 'Invalid stop loss format')
+
+class TestParserRegistry(unittest.TestCase):
+
+    def setUp(self):
+        channels = [
+            {'id': 1234, 'title': 'Forex Signals - 1000 pip Builder'},
+            {'id': 5678, 'title': 'Renamed channel', 'parser': 'GTMO'},
+        ]
+        self.registry = ParserRegistry(channels)
+
+    def test_lookup_by_marked_and_plain_chat_id(self):
+        self.assertIsInstance(self.registry.get(1234), TradeSignalParser1000PipBuilder)
+        self.assertIs(self.registry.get(-1000000001234), self.registry.get(1234))
+
+    def test_parser_from_config_overrides_title(self):
+        self.assertIsInstance(self.registry.get(-1000000005678), GTMO)
+
+    def test_unknown_chat_id(self):
+        with self.assertRaises(ValueError):
+            self.registry.get(999)
+
+    def test_unknown_parser_name(self):
+        with self.assertRaises(ValueError):
+            ParserRegistry([{'id': 1, 'title': 'GTMO VIP', 'parser': 'Unknown'}])
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,13 @@
+import asyncio
 import unittest
 from unittest.mock import MagicMock, patch
+from src import mt5sim, tradingbot
+from src.exposure import ExposureBook
+from src.mt5handler import AccountSnapshot, MT5Handler, SymbolSpecCache, TickStore
+from src.ratelimiter import TokenBucket
+from src.strategy import Strategy
 from src.tradesignalparser import TradeSignal
-from src.tradingbot import ProcessTradeSignal, logger_setup
+from src.tradingbot import BREAK_EVEN, ProcessTradeSignal, logger_setup
 import src.logger_setup 
 
 class TestProcessTradeSignal(unittest.TestCase):
@@ -63,5 +69,127 @@ class TestProcessTradeSignal(unittest.TestCase):
         self.tradeProcessor.calculate_position_size.assert_not_called()
         self.tradeProcessor.place_order.assert_not_called()
 
+class TestOrderResults(unittest.TestCase):
+
+    def setUp(self):
+        # dezelfde manage_shelve module als die de tradingbot gebruikt
+        self.manage_shelve = tradingbot.manage_shelve
+        self.manage_shelve.set_store(self.manage_shelve.SignalStore(':memory:'))
+        self.mt5 = mt5sim.SimulatedMT5(balance=10000)
+        self.mt5.set_tick('EURUSD', 1.0800, 1.0800)
+        self.processor = ProcessTradeSignal(
+            self.mt5, order_limiter=TokenBucket(rate=1e9, capacity=1e9), exposure_book=ExposureBook(),
+            mt5handler=MT5Handler(self.mt5, spec_cache=SymbolSpecCache(self.mt5), tick_store=TickStore(max_staleness=-1),
+                                  account_snapshot=AccountSnapshot(self.mt5, max_staleness=-1))
+        )
+        self.strategy = Strategy(0.01, 0.1, 3, '', True, True, 100)
+
+    def tearDown(self):
+        self.manage_shelve.get_store().close()
+        self.manage_shelve.set_store(None)
+
+    def signal(self):
+        return TradeSignal('EURUSD', 'Long', 1.0800, 1.0700, [1.0850, 1.0900, 1.0950], 'REF', 1)
+
+    def test_results_are_keyed_by_message(self):
+        """Twee signalen in dezelfde seconde krijgen elk hun eigen resultaten"""
+        for message_id in (10, 11):
+            asyncio.run(self.processor.start_order_entry_process_async(
+                self.signal(), self.strategy, key=self.manage_shelve.order_key(-1001, message_id)
+            ))
+
+        first = self.manage_shelve.get_item(self.manage_shelve.TRADES_POSITIONS_DB, '-1001:10')
+        second = self.manage_shelve.get_item(self.manage_shelve.TRADES_POSITIONS_DB, '-1001:11')
+        self.assertEqual([r['request']['comment'] for r in first], ['REF_1', 'REF_2', 'REF_3'])
+        self.assertEqual(len(second), 3)
+        self.assertTrue({r['order'] for r in first}.isdisjoint(r['order'] for r in second))
+
+    def test_results_without_key_use_the_ref_number(self):
+        self.processor.start_order_entry_process(self.signal(), self.strategy)
+
+        self.assertEqual(len(self.manage_shelve.get_item(self.manage_shelve.TRADES_POSITIONS_DB, 'REF')), 3)
+
+class TestAdjustPositions(unittest.TestCase):
+
+    def setUp(self):
+        self.manage_shelve = tradingbot.manage_shelve
+        self.manage_shelve.set_store(self.manage_shelve.SignalStore(':memory:'))
+        self.mt5 = mt5sim.SimulatedMT5(balance=10000)
+        self.mt5.set_tick('EURUSD', 1.0800, 1.0800)
+        self.book = ExposureBook()
+        self.handler = MT5Handler(
+            self.mt5, spec_cache=SymbolSpecCache(self.mt5), tick_store=TickStore(max_staleness=-1),
+            account_snapshot=AccountSnapshot(self.mt5, max_staleness=-1)
+        )
+        self.processor = ProcessTradeSignal(
+            self.mt5, order_limiter=TokenBucket(rate=1e9, capacity=1e9), mt5handler=self.handler, exposure_book=self.book
+        )
+        strategy = Strategy(0.01, 0.1, 3, '', True, True, 100)
+        signal = TradeSignal('EURUSD', 'Long', 1.0800, 1.0700, [1.0850, 1.0900, 1.0950], 'REF', 1)
+        self.processor.start_order_entry_process(signal, strategy)
+
+    def tearDown(self):
+        self.manage_shelve.get_store().close()
+        self.manage_shelve.set_store(None)
+
+    def test_all_legs_move_to_break_even(self):
+        summary = asyncio.run(self.processor.adjust_positions('REF', stop_loss=BREAK_EVEN, retry_delay=0))
+
+        self.assertEqual((summary['legs'], summary['modified'], summary['failed']), (3, 3, []))
+        self.assertEqual({position.sl for position in self.mt5.positions_get()}, {1.08})
+        self.assertEqual([position.tp for position in self.mt5.positions_get()], [1.085, 1.09, 1.095])
+        self.assertAlmostEqual(self.book.total, 0.0)
+
+    def test_failed_modification_is_retried(self):
+        self.mt5.fail_next_orders(mt5sim.TRADE_RETCODE_REQUOTE, count=2)
+
+        summary = asyncio.run(self.processor.adjust_positions('REF', stop_loss=1.0750, retry_delay=0))
+
+        self.assertEqual(summary['modified'], 3)
+        self.assertEqual({position.sl for position in self.mt5.positions_get()}, {1.075})
+
+    def test_target_profits_per_leg_keep_stop_loss(self):
+        summary = asyncio.run(self.processor.adjust_positions('REF', take_profits=[1.0860, 1.0910, 1.0960], retry_delay=0))
+
+        self.assertEqual(summary['modified'], 3)
+        self.assertEqual({position.sl for position in self.mt5.positions_get()}, {1.07})
+        self.assertEqual([position.tp for position in self.mt5.positions_get()], [1.086, 1.091, 1.096])
+
+    def test_rejected_and_unchanged_legs(self):
+        asyncio.run(self.processor.adjust_positions('REF', stop_loss=1.0750, retry_delay=0))
+        self.mt5.fail_next_orders(mt5sim.TRADE_RETCODE_INVALID_STOPS)
+
+        summary = asyncio.run(self.processor.adjust_positions('REF', stop_loss=1.0760, retry_delay=0))
+
+        self.assertEqual((summary['modified'], len(summary['failed'])), (2, 1))
+        summary = asyncio.run(self.processor.adjust_positions('REF', stop_loss=1.0760, retry_delay=0))
+        self.assertEqual((summary['modified'], summary['unchanged'], len(summary['failed'])), (1, 2, 0))
+
+    def test_new_legs_are_visible_in_a_fresh_snapshot(self):
+        snapshot = AccountSnapshot(self.mt5, max_staleness=60)
+        self.handler.accountSnapshot = snapshot
+        snapshot.refresh()
+        strategy = Strategy(0.01, 0.1, 3, '', True, True, 100)
+        self.processor.start_order_entry_process(
+            TradeSignal('EURUSD', 'Long', 1.0800, 1.0700, [1.0850, 1.0900, 1.0950], 'NEW', 1), strategy
+        )
+
+        summary = asyncio.run(self.processor.adjust_positions('NEW', stop_loss=1.0750, retry_delay=0))
+
+        self.assertEqual((summary['legs'], summary['modified']), (3, 3))
+
+    def test_implausible_stop_loss_is_not_sent(self):
+        sent = self.mt5.call_counts.get('order_send', 0)
+
+        # een pip aantal als niveau, boven de koers van een buy
+        summary = asyncio.run(self.processor.adjust_positions('REF', stop_loss=30, retry_delay=0))
+        self.assertEqual((summary['modified'], len(summary['failed'])), (0, 3))
+        # aan de goede kant, maar veel te ver van de open prijs
+        summary = asyncio.run(self.processor.adjust_positions('REF', stop_loss=0.9, retry_delay=0))
+        self.assertEqual((summary['modified'], len(summary['failed'])), (0, 3))
+
+        self.assertEqual(self.mt5.call_counts.get('order_send', 0), sent)
+        self.assertEqual({position.sl for position in self.mt5.positions_get()}, {1.07})
+
 if __name__ == '__main__':
     unittest.main()